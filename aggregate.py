@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+
+# Functions an aggregation can apply to its column.
+AGGREGATIONS = ('count', 'sum', 'min', 'max', 'mean', 'distinct_count', 'approx_distinct_count')
+
+# approx_distinct_count keeps a HyperLogLog sketch of 2**HLL_PRECISION
+# registers per group, for a standard error of about 1.04 / sqrt(4096), 1.6%.
+# Only registers that were hit are stored, so small groups stay small.
+HLL_PRECISION = 12
+HLL_REGISTERS = 2 ** HLL_PRECISION
+
+# Partial results held while streaming before they are merged into one, so
+# memory follows the number of groups rather than the number of chunks.
+PARTIALS_PER_MERGE = 16
+
+ROWS = '__rows'
+
+
+def parse_aggregations(group_by, aggregations):
+    # {output_column: {function: column}} as (output_column, function, column)
+    # triples, in order.
+    if not isinstance(group_by, list) or not group_by:
+        raise ValueError(f"Invalid group_by specified for aggregate: {group_by}")
+    if not isinstance(aggregations, dict) or not aggregations:
+        raise ValueError("No aggregations specified for aggregate")
+    parsed = []
+    for output_column, aggregation in aggregations.items():
+        if not isinstance(aggregation, dict) or len(aggregation) != 1 or list(aggregation)[0] not in AGGREGATIONS:
+            raise ValueError(f"Invalid aggregation specified for '{output_column}': {aggregation}. Expected one of: {', '.join(AGGREGATIONS)}")
+        if output_column in group_by:
+            raise ValueError(f"Aggregation '{output_column}' has the name of a group_by column")
+        [(function, column)] = aggregation.items()
+        parsed.append((output_column, function, column))
+    return parsed
+
+
+def _hashes(values):
+    # Numbers hash by value whatever dtype a chunk parsed them to, so 30 and
+    # 30.0 are one value.
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        values = values.astype('float64')
+    else:
+        values = values.astype(object)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _bit_length(values):
+    # Exact for 64-bit integers: each 32-bit half converts to a float exactly.
+    high = np.frexp((values >> np.uint64(32)).astype(np.float64))[1]
+    low = np.frexp((values & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+    return np.where(high > 0, high + 32, low)
+
+
+def _compact(cells, ranks):
+    # The highest rank of each register. A cell numbers a register of a group:
+    # group * HLL_REGISTERS + register.
+    highest = pd.Series(ranks).groupby(cells).max()
+    return highest.index.to_numpy(dtype=np.int64), highest.to_numpy(dtype=np.uint8)
+
+
+def _sketch(values, group_ids):
+    present = values.notna().to_numpy()
+    hashes = _hashes(values[present])
+    # The first bits of a hash pick the register, the position of the first
+    # one bit in the rest gives its rank.
+    registers = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = hashes << np.uint64(HLL_PRECISION)
+    ranks = np.minimum(64 - _bit_length(rest) + 1, 64 - HLL_PRECISION + 1)
+    return _compact(group_ids[present].astype(np.int64) * HLL_REGISTERS + registers, ranks)
+
+
+def _estimate(sketch, groups):
+    cells, ranks = sketch
+    group_ids = cells // HLL_REGISTERS
+    filled = np.bincount(group_ids, minlength=groups)
+    # Registers never hit count as rank 0.
+    inverse_sum = np.bincount(group_ids, weights=np.exp2(-ranks.astype(np.float64)), minlength=groups) + (HLL_REGISTERS - filled)
+    alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+    estimate = alpha * HLL_REGISTERS * HLL_REGISTERS / inverse_sum
+    # Small counts are estimated from the share of registers never hit.
+    empty = HLL_REGISTERS - filled
+    small = (estimate <= 2.5 * HLL_REGISTERS) & (empty > 0)
+    estimate[small] = HLL_REGISTERS * np.log(HLL_REGISTERS / empty[small])
+    return np.rint(estimate).astype(np.int64)
+
+
+def partial_aggregate(df, group_by, aggregations):
+    # The aggregate of one chunk: per group (numbered by first appearance),
+    # its row count and the partial value of every aggregation, the distinct
+    # (group, value) pairs of each distinct_count and the sketch of each
+    # approx_distinct_count.
+    invalid_columns = [column for column in dict.fromkeys(group_by + [column for _, _, column in aggregations])
+                       if column not in df.columns]
+    if invalid_columns:
+        raise ValueError(f"Invalid columns specified for aggregate: {', '.join(map(str, invalid_columns))}")
+    grouped = df.groupby(group_by, dropna=False, sort=False, observed=True)
+    totals = {ROWS: grouped.size()}
+    group_ids = grouped.ngroup().to_numpy()
+    distinct = {}
+    sketches = {}
+    for output_column, function, column in aggregations:
+        if function == 'mean':
+            totals[f'{output_column}.sum'] = grouped[column].sum()
+            totals[f'{output_column}.count'] = grouped[column].count()
+        elif function == 'distinct_count':
+            pairs = pd.DataFrame({'group': group_ids, 'value': df[column].to_numpy()})
+            distinct[output_column] = pairs[pairs['value'].notna()].drop_duplicates()
+        elif function == 'approx_distinct_count':
+            sketches[output_column] = _sketch(df[column], group_ids)
+        else:
+            totals[output_column] = getattr(grouped[column], function)()
+    return {'totals': pd.DataFrame(totals), 'distinct': distinct, 'sketches': sketches}
+
+
+def _merge_function(column, aggregations):
+    for output_column, function, _ in aggregations:
+        if column == output_column and function in ('min', 'max'):
+            return function
+    # Row counts, counts, sums and the parts of a mean add up.
+    return 'sum'
+
+
+def merge_partials(partials, aggregations):
+    # Merges partial aggregates into one, renumbering each one's groups into
+    # the merged groups.
+    if len(partials) == 1:
+        return partials[0]
+    totals = pd.concat([partial['totals'] for partial in partials])
+    totals = totals.groupby(level=list(range(totals.index.nlevels)), dropna=False, sort=False) \
+        .agg({column: _merge_function(column, aggregations) for column in totals.columns})
+    positions = [totals.index.get_indexer(partial['totals'].index) for partial in partials]
+    distinct = {}
+    sketches = {}
+    for output_column, function, _ in aggregations:
+        if function == 'distinct_count':
+            pairs = pd.concat([partial['distinct'][output_column].assign(group=position[partial['distinct'][output_column]['group'].to_numpy()])
+                               for partial, position in zip(partials, positions)], ignore_index=True)
+            distinct[output_column] = pairs.drop_duplicates()
+        elif function == 'approx_distinct_count':
+            cells = np.concatenate([position[partial['sketches'][output_column][0] // HLL_REGISTERS] * HLL_REGISTERS
+                                    + partial['sketches'][output_column][0] % HLL_REGISTERS
+                                    for partial, position in zip(partials, positions)])
+            ranks = np.concatenate([partial['sketches'][output_column][1] for partial in partials])
+            sketches[output_column] = _compact(cells, ranks)
+    return {'totals': totals, 'distinct': distinct, 'sketches': sketches}
+
+
+def finish_aggregate(partial, group_by, aggregations):
+    # One row per group, sorted by the group_by columns with missing keys
+    # last.
+    totals = partial['totals']
+    result = pd.DataFrame(index=totals.index)
+    for output_column, function, _ in aggregations:
+        if function == 'mean':
+            result[output_column] = totals[f'{output_column}.sum'] / totals[f'{output_column}.count'].where(totals[f'{output_column}.count'] > 0)
+        elif function == 'distinct_count':
+            result[output_column] = np.bincount(partial['distinct'][output_column]['group'].to_numpy(dtype=np.int64), minlength=len(totals))
+        elif function == 'approx_distinct_count':
+            result[output_column] = _estimate(partial['sketches'][output_column], len(totals))
+        else:
+            result[output_column] = totals[output_column]
+    result = result.reset_index()
+    result.columns = group_by + [output_column for output_column, _, _ in aggregations]
+    return result.sort_values(group_by, na_position='last', kind='stable', ignore_index=True)
+
+
+def aggregate_chunks(chunks, group_by, aggregations):
+    # Aggregates chunk by chunk, merging the partial results as they pile up,
+    # and yields the result once every chunk was seen.
+    aggregations = parse_aggregations(group_by, aggregations)
+    partials = []
+    for chunk in chunks:
+        partials.append(partial_aggregate(chunk, group_by, aggregations))
+        if len(partials) >= PARTIALS_PER_MERGE:
+            partials = [merge_partials(partials, aggregations)]
+    if partials:
+        yield finish_aggregate(merge_partials(partials, aggregations), group_by, aggregations)
@@ -0,0 +1,419 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from transform import replace_text_transform, merge_transform, convert_case_transform, apply_transformations
+from parse_transformations_file import parse_transformations_file
+from pipeline import run_step, run_pipeline
+
+
+PROJECT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'project')
+PROJECT_PIPELINE = os.path.join(PROJECT_DIRECTORY, 'pipeline.yml')
+
+# The columns of project/input.csv, and how the merge step's inputs share them.
+PROJECT_COLUMNS = ['SSN', 'Name', 'Age', 'Email', 'Phone', 'City', 'Address', 'ZipCode', 'Sex']
+MERGE_INPUT_COLUMNS = {
+    'input1.csv': ['SSN', 'Name', 'Age', 'Email', 'Phone', 'Sex'],
+    'input2.csv': ['SSN', 'City', 'Address', 'ZipCode']
+}
+
+GENERATOR_BLOCK_ROWS = 1000000
+DEFAULT_THRESHOLD = 0.2
+# Cases faster than this are mostly timer noise, so slowing down by less than
+# this is never reported as a regression.
+DEFAULT_MIN_SECONDS = 0.005
+
+
+# Row-at-a-time versions of the kernels, kept as the reference the vectorized
+# implementations in transform.py are measured against.
+def rowwise_replace_text_transform(df, column, start_position, end_position, replacement_character, start=True):
+    df[column] = df[column].astype(str)
+
+    def replace_text(row):
+        text = row[column]
+        length = len(text)
+        if start:
+            start_index = start_position
+            end_index = min(end_position + 1, length)
+        else:
+            start_index = max(length - end_position - 1, 0)
+            end_index = max(length - start_position, 0)
+        return text[:start_index] + replacement_character * (end_index - start_index) + text[end_index:]
+
+    df[column] = df.apply(replace_text, axis=1)
+    return df
+
+
+def rowwise_merge_transform(df, columns, output_column, separator=' '):
+    df[output_column] = df[columns].apply(lambda x: separator.join(x.dropna().astype(str)), axis=1)
+    return df
+
+
+def rowwise_sentencecase_transform(df, column):
+    df.loc[:, column] = df[column].apply(lambda x: x.capitalize())
+    return df
+
+
+def generate_kernel_data(rows, seed=0):
+    rng = np.random.RandomState(seed)
+    names = np.array(['john doe', 'jane smith', 'mark johnson', 'ann lee', 'bob ray'], dtype=object)
+    cities = np.array(['New York', 'Los Angeles', 'Chicago', None], dtype=object)
+    return pd.DataFrame({
+        'Name': rng.choice(names, rows),
+        'Phone': pd.Series(rng.randint(10 ** 9, 10 ** 10, rows)).astype(str),
+        'Address': pd.Series(rng.randint(1, 999, rows)).astype(str) + ' Main St',
+        'City': rng.choice(cities, rows),
+        'ZipCode': rng.randint(10000, 99999, rows)
+    })
+
+
+KERNEL_CASES = [
+    ('replace_text',
+     lambda df: rowwise_replace_text_transform(df, 'Phone', 1, 2, '^', False),
+     lambda df: replace_text_transform(df, 'Phone', 1, 2, '^', False)),
+    ('merge',
+     lambda df: rowwise_merge_transform(df, ['Address', 'City', 'ZipCode'], 'Address City ZipCode', ', '),
+     lambda df: merge_transform(df, ['Address', 'City', 'ZipCode'], 'Address City ZipCode', ', ')),
+    ('sentencecase',
+     lambda df: rowwise_sentencecase_transform(df, 'Name'),
+     lambda df: convert_case_transform(df, {'Name': 'sentencecase'})),
+]
+
+
+def time_call(function, df):
+    start = time.perf_counter()
+    result = function(df)
+    return time.perf_counter() - start, result
+
+
+def run_kernel_benchmark(rows):
+    df = generate_kernel_data(rows)
+    results = []
+    for name, rowwise, vectorized in KERNEL_CASES:
+        rowwise_seconds, expected = time_call(rowwise, df.copy())
+        vectorized_seconds, actual = time_call(vectorized, df.copy())
+        if not expected.equals(actual):
+            raise ValueError(f"Vectorized '{name}' output differs from the row-wise reference")
+        results.append((name, rowwise_seconds, vectorized_seconds))
+    return results
+
+
+FIRST_NAMES = np.array(['John', 'Jane', 'Mark', 'Ann', 'Bob', 'David', 'Emily', 'Sarah', 'Michael', 'Laura'], dtype=object)
+LAST_NAMES = np.array(['Doe', 'Smith', 'Johnson', 'Lee', 'Ray', 'Brown', 'Davis', 'Wilson', 'Taylor', 'Clark'], dtype=object)
+CITIES = np.array(['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'San Francisco', 'Seattle',
+                   'Boston', 'Denver', 'Dallas', 'Austin', 'Atlanta'], dtype=object)
+STREETS = np.array(['Main St', 'Elm St', 'Oak Ave', 'Pine Rd', 'Maple Dr', 'Cedar Ln'], dtype=object)
+
+
+def generate_project_block(start, rows, seed=0):
+    # Rows start..start+rows of the generated dataset. Each block has its own
+    # random state, so any block can be generated on its own. The values stay
+    # within what the project pipeline's checks accept, except for blank emails.
+    rng = np.random.RandomState([seed, start // GENERATOR_BLOCK_ROWS, start % GENERATOR_BLOCK_ROWS])
+    first_names = rng.choice(FIRST_NAMES, rows)
+    last_names = rng.choice(LAST_NAMES, rows)
+    emails = (pd.Series(first_names + last_names).str.lower() + '@example.com').to_numpy(dtype=object, copy=True)
+    emails[rng.random_sample(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        'SSN': np.arange(start, start + rows, dtype=np.int64) + 1000000000,
+        'Name': first_names + ' ' + last_names,
+        'Age': rng.randint(18, 40, rows),
+        'Email': emails,
+        'Phone': rng.randint(10 ** 9, 10 ** 10, rows, dtype=np.int64),
+        'City': rng.choice(CITIES, rows),
+        'Address': pd.Series(rng.randint(1, 1000, rows)).astype(str).to_numpy(dtype=object) + ' ' + rng.choice(STREETS, rows),
+        'ZipCode': rng.randint(10000, 100000, rows),
+        'Sex': rng.choice(np.array(['M', 'F'], dtype=object), rows)
+    }, columns=PROJECT_COLUMNS)
+
+
+def iter_project_data(rows, seed=0, block_rows=GENERATOR_BLOCK_ROWS):
+    for start in range(0, rows, block_rows):
+        yield generate_project_block(start, min(block_rows, rows - start), seed)
+
+
+def generate_project_data(rows, seed=0):
+    return pd.concat(iter_project_data(rows, seed), ignore_index=True)
+
+
+def write_project_inputs(directory, rows, seed=0):
+    # Writes input.csv and the two inputs of the project pipeline's merge step,
+    # one block at a time so 10M row datasets do not have to fit in memory.
+    paths = {name: os.path.join(directory, name) for name in ['input.csv', *MERGE_INPUT_COLUMNS]}
+    for position, block in enumerate(iter_project_data(rows, seed)):
+        mode, header = ('w', True) if position == 0 else ('a', False)
+        block.to_csv(paths['input.csv'], mode=mode, header=header, index=False)
+        for name, columns in MERGE_INPUT_COLUMNS.items():
+            block[columns].to_csv(paths[name], mode=mode, header=header, index=False)
+    return paths
+
+
+# Phone and SSN masked by one mask stage, and by the chain of transformations
+# it stands for, so the two can be compared.
+MASK_RULES = [
+    {'replace': {'match': '555', 'replacement': 'XXX'}},
+    {'replace_characters': {'num_characters': 3, 'replacement': '*'}},
+    {'replace_text': {'start_position': 1, 'end_position': 2, 'replacement': '^', 'start': False}}
+]
+CHAINED_MASK = [
+    definition
+    for column in ['Phone', 'SSN']
+    for definition in [
+        {'replace': {'column': column, 'match': '555', 'replacement': 'XXX'}},
+        {'replace_characters': {'column': column, 'num_characters': 3, 'replacement': '*'}},
+        {'replace_text': {'column': column, 'start_position': 1, 'end_position': 2, 'replacement': '^', 'start': False}}
+    ]
+]
+
+# The reference file of the lookup case, mapping every zip code to a region,
+# written next to the generated inputs.
+LOOKUP_REFERENCE = 'zip_regions.csv'
+REGIONS = ['Northeast', 'Southeast', 'Midwest', 'Southwest', 'West']
+
+# One case per transformation in transform.py, shaped like the project's own
+# transformations, and mask_chained to compare with mask. A case is a
+# transformation definition, or a list of them run together.
+TRANSFORM_CASES = [
+    ('create', {'create': {'column': 'Income', 'data_type': 'int64', 'default_value': 3000}}),
+    ('duplicate', {'duplicate': {'mapping': {'Name': 'Name_new', 'Phone': 'Phone_new', 'ZipCode': 'ZipCode_new'}}}),
+    ('split', {'split': {'column': 'City', 'separator': ' '}}),
+    ('split_pair', {'split_pair': {'column': 'Name', 'separator': ' ', 'first': False}}),
+    ('replace', {'replace': {'column': 'Phone', 'match': '555', 'replacement': 'XXX'}}),
+    ('replace_text', {'replace_text': {'column': 'Phone', 'start_position': 1, 'end_position': 2, 'replacement': '^', 'start': False}}),
+    ('replace_characters', {'replace_characters': {'column': 'Phone', 'num_characters': 3, 'replacement': '*'}}),
+    ('mask', {'mask': {'columns': ['Phone', 'SSN'], 'rules': MASK_RULES}}),
+    ('mask_chained', CHAINED_MASK),
+    ('merge', {'merge': {'columns': ['Address', 'City', 'ZipCode'], 'separator': ', ', 'output_column': 'Address City ZipCode'}}),
+    ('filter', {'filter': {'columns': ['SSN', 'Name', 'Age', 'City']}}),
+    ('drop', {'drop': {'columns': ['Email', 'Phone', 'Address']}}),
+    ('filter_records', {'filter_records': {'condition': '(Age <= 30) and (ZipCode >= 50000)'}}),
+    ('rename', {'rename': {'mapping': {'Phone': 'Phone_Number', 'Sex': 'Gender'}}}),
+    ('map_value', {'map_value': {'column': 'City', 'default_value': 'Unknown', 'mapping': {'New York': 'NY', 'Los Angeles': 'LA', 'Chicago': 'CHI'}}}),
+    ('lookup', {'lookup': {'column': 'ZipCode', 'reference_file': LOOKUP_REFERENCE, 'key_column': 'zip', 'value_column': 'region',
+                           'output_column': 'Region', 'default_value': 'Unknown'}}),
+    ('convert_case', {'convert_case': {'mapping': {'Name': 'uppercase', 'City': 'titlecase', 'Email': 'sentencecase'}}}),
+    ('sort', {'sort': {'mapping': {'Age': False, 'Name': True}}}),
+    ('aggregate', {'aggregate': {'group_by': ['City', 'Sex'], 'aggregations': {
+        'People': {'count': 'SSN'}, 'Average_Age': {'mean': 'Age'}, 'Oldest': {'max': 'Age'}, 'Emails': {'approx_distinct_count': 'Email'}}}}),
+    ('check_data_type', {'check_data_type': {'mapping': {'Name': 'object', 'Age': 'int64', 'Email': 'object', 'City': 'object'}}}),
+    ('check_not_blank', {'check_not_blank': {'columns': ['Name', 'Age', 'Phone', 'City', 'Address', 'ZipCode', 'Sex']}}),
+    ('checks', {'checks': [
+        {'type': 'length', 'column': 'Name', 'max_length': 100},
+        {'type': 'values', 'column': 'Sex', 'valid_values': ['M', 'F']},
+        {'type': 'range', 'column': 'Age', 'min_value': 18, 'max_value': 39}
+    ]}),
+]
+
+
+def best_of(function, repeat, setup=None):
+    # Runs `function` on a fresh `setup()` result each time, timing only the
+    # function. The fastest run is the least disturbed by the rest of the
+    # machine.
+    runs = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument)
+        runs.append(time.perf_counter() - start)
+    return {'seconds': min(runs), 'runs': runs}
+
+
+def write_lookup_reference(directory):
+    zips = np.arange(10000, 100000)
+    path = os.path.join(directory, LOOKUP_REFERENCE)
+    pd.DataFrame({'zip': zips, 'region': np.array(REGIONS, dtype=object)[zips % len(REGIONS)]}).to_csv(path, index=False)
+    return path
+
+
+def resolve_references(transformation_definitions, directory):
+    # Reference files of lookups are named relative to the benchmark
+    # directory.
+    transformation_definitions = copy.deepcopy(transformation_definitions)
+    for transformation_definition in transformation_definitions:
+        if 'lookup' in transformation_definition:
+            lookup = transformation_definition['lookup']
+            lookup['reference_file'] = os.path.join(directory, lookup['reference_file'])
+    return transformation_definitions
+
+
+def benchmark_transforms(df, rows, repeat, cases=TRANSFORM_CASES, directory='.'):
+    results = {}
+    for name, transformation_definitions in cases:
+        if not isinstance(transformation_definitions, list):
+            transformation_definitions = [transformation_definitions]
+        transformation_definitions = resolve_references(transformation_definitions, directory)
+        results[f'transform/{name}/{rows}'] = best_of(
+            lambda frame: apply_transformations(frame, transformation_definitions), repeat, df.copy)
+    return results
+
+
+def resolve_pipeline(pipeline_file):
+    # Transformation files are named relative to the pipeline file, so they are
+    # made absolute before the pipeline runs in the benchmark directory.
+    pipeline_definitions = copy.deepcopy(parse_transformations_file(pipeline_file))
+    for pipeline_definition_item in pipeline_definitions:
+        pipeline_definition = list(pipeline_definition_item.values())[0]
+        if pipeline_definition.get('transformation_file'):
+            pipeline_definition['transformation_file'] = os.path.join(
+                os.path.dirname(os.path.abspath(pipeline_file)), pipeline_definition['transformation_file'])
+    return pipeline_definitions
+
+
+def _run_step_quietly(pipeline_definition_item):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        succeeded = run_step(pipeline_definition_item)
+    if not succeeded:
+        raise ValueError(f"Benchmark step failed: {output.getvalue().strip()}")
+
+
+def benchmark_pipeline(directory, rows, repeat, pipeline_file=PROJECT_PIPELINE):
+    # Each step is timed on its own, in pipeline order so every step finds the
+    # outputs of the steps before it, then the whole pipeline end to end.
+    pipeline_definitions = resolve_pipeline(pipeline_file)
+    results = {}
+    previous_directory = os.getcwd()
+    os.chdir(directory)
+    try:
+        for position, pipeline_definition_item in enumerate(pipeline_definitions):
+            step_type = list(pipeline_definition_item.keys())[0]
+            results[f'step/{position + 1}_{step_type}/{rows}'] = best_of(
+                lambda _: _run_step_quietly(pipeline_definition_item), repeat)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[f'pipeline/{os.path.basename(pipeline_file)}/{rows}'] = best_of(
+                lambda _: run_pipeline(pipeline_definitions), repeat)
+    finally:
+        os.chdir(previous_directory)
+    return results
+
+
+def run_suite(row_counts, repeat=3, seed=0, pipeline_file=PROJECT_PIPELINE, include=('transform', 'step')):
+    results = {
+        'seed': seed,
+        'repeat': repeat,
+        'rows': list(row_counts),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'cases': {}
+    }
+    for rows in row_counts:
+        directory = tempfile.mkdtemp(prefix='etl-benchmark-')
+        try:
+            write_project_inputs(directory, rows, seed)
+            if 'transform' in include:
+                write_lookup_reference(directory)
+                df = pd.read_csv(os.path.join(directory, 'input.csv'))
+                results['cases'].update(benchmark_transforms(df, rows, repeat, directory=directory))
+                del df
+            if 'step' in include:
+                results['cases'].update(benchmark_pipeline(directory, rows, repeat, pipeline_file))
+        finally:
+            shutil.rmtree(directory)
+    return results
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD, min_seconds=DEFAULT_MIN_SECONDS):
+    # Returns (case, baseline seconds, current seconds, status) for every case
+    # in either run. A case regresses when it is more than `threshold` slower
+    # and the difference is at least `min_seconds`.
+    comparison = []
+    for case in sorted(set(baseline['cases']) | set(current['cases'])):
+        if case not in current['cases']:
+            comparison.append((case, baseline['cases'][case]['seconds'], None, 'missing'))
+            continue
+        if case not in baseline['cases']:
+            comparison.append((case, None, current['cases'][case]['seconds'], 'new'))
+            continue
+        baseline_seconds = baseline['cases'][case]['seconds']
+        current_seconds = current['cases'][case]['seconds']
+        status = 'ok'
+        if current_seconds > baseline_seconds * (1 + threshold) and current_seconds - baseline_seconds >= min_seconds:
+            status = 'regressed'
+        elif current_seconds < baseline_seconds / (1 + threshold) and baseline_seconds - current_seconds >= min_seconds:
+            status = 'improved'
+        comparison.append((case, baseline_seconds, current_seconds, status))
+    return comparison
+
+
+def _seconds(seconds):
+    return '-' if seconds is None else f'{seconds:.4f}s'
+
+
+def print_results(results):
+    for case, result in results['cases'].items():
+        print(f"{case:<40} {_seconds(result['seconds']):>12}")
+
+
+def print_comparison(comparison):
+    for case, baseline_seconds, current_seconds, status in comparison:
+        change = ''
+        if baseline_seconds and current_seconds is not None:
+            change = f'{(current_seconds / baseline_seconds - 1) * 100:+7.1f}%'
+        print(f"{case:<40} {_seconds(baseline_seconds):>12} {_seconds(current_seconds):>12} {change:>9}  {status}")
+
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark transformations, pipeline steps and the project pipeline.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of rows to generate for the kernel benchmark')
+    subparsers = parser.add_subparsers(dest='command')
+
+    generate_parser = subparsers.add_parser('generate', help='Write input.csv, input1.csv and input2.csv with the project schema')
+    generate_parser.add_argument('directory', type=str, help='Directory to write the files to')
+    generate_parser.add_argument('--rows', type=int, default=10000, help='Number of rows to generate')
+    generate_parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    run_parser = subparsers.add_parser('run', help='Time every transformation, every pipeline step and the whole pipeline')
+    run_parser.add_argument('--rows', type=int, nargs='+', default=[10000], help='Dataset sizes to benchmark, e.g. 10000 1000000')
+    run_parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the fastest is kept')
+    run_parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    run_parser.add_argument('--pipeline', type=str, default=PROJECT_PIPELINE, help='Pipeline file to time step by step and end to end')
+    run_parser.add_argument('--only', choices=['transform', 'step'], default=None, help='Only time transformations or only pipeline steps')
+    run_parser.add_argument('--output', type=str, default=None, help='Save the results as JSON to this file')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare results with a baseline and fail on regressions')
+    compare_parser.add_argument('baseline', type=str, help='Baseline results JSON file')
+    compare_parser.add_argument('results', type=str, help='Results JSON file to check')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed slowdown, e.g. 0.2 for 20%%')
+    compare_parser.add_argument('--min-seconds', type=float, default=DEFAULT_MIN_SECONDS, help='Ignore slowdowns smaller than this many seconds')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.command == 'generate':
+        os.makedirs(args.directory, exist_ok=True)
+        for path in write_project_inputs(args.directory, args.rows, args.seed).values():
+            print(f"Wrote {args.rows} rows to '{path}'.")
+    elif args.command == 'run':
+        results = run_suite(args.rows, args.repeat, args.seed, args.pipeline, (args.only,) if args.only else ('transform', 'step'))
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+            print(f"Saved results to '{args.output}'.")
+    elif args.command == 'compare':
+        comparison = compare_results(load_results(args.baseline), load_results(args.results), args.threshold, args.min_seconds)
+        print_comparison(comparison)
+        regressions = [case for case, _, _, status in comparison if status == 'regressed']
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for name, rowwise_seconds, vectorized_seconds in run_kernel_benchmark(args.rows):
+            print(f"{name:<14} row-wise {rowwise_seconds:8.3f}s  vectorized {vectorized_seconds:8.3f}s  speedup {rowwise_seconds / vectorized_seconds:6.1f}x")
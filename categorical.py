@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+from dataset_io import sample_dataset
+from plan import analyze_transformation, column_matches
+
+
+# Transformations that compute each value from that value alone, so on a
+# dictionary encoded column they run once per distinct value.
+DICTIONARY_TRANSFORMATIONS = {'map_value', 'convert_case', 'replace', 'replace_text', 'replace_characters', 'mask', 'lookup'}
+
+# Transformations that work on encoded columns as they are.
+ENCODED_TRANSFORMATIONS = {'duplicate', 'rename', 'drop', 'filter', 'create'}
+
+# Transformations that give the same rows on Arrow-backed string and nullable
+# columns as on the numpy columns read_csv would have parsed.
+EXTENSION_TRANSFORMATIONS = ENCODED_TRANSFORMATIONS | {'filter_records'}
+
+# Object columns with at most this share of distinct values are encoded
+# before a dictionary transformation. The first rows are checked before the
+# whole column is hashed.
+MAX_CATEGORICAL_RATIO = 0.05
+MIN_CATEGORICAL_ROWS = 10000
+SAMPLE_ROWS = 10000
+
+
+def is_categorical(series):
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def is_extension(series):
+    # Columns read with a schema sidecar.
+    return isinstance(series.dtype, (pd.StringDtype, pd.Int64Dtype, pd.BooleanDtype))
+
+
+def plain_column(series):
+    # The numpy backed column read_csv would have parsed: text as objects with
+    # NaN, and integers or booleans with blanks as floats or objects.
+    if isinstance(series.dtype, pd.StringDtype) or (isinstance(series.dtype, pd.BooleanDtype) and series.hasnans):
+        values = series.to_numpy(dtype=object, na_value=np.nan)
+    elif series.hasnans:
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        values = series.to_numpy(dtype=series.dtype.numpy_dtype)
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def encode_column(series, force=False):
+    # Returns the column as a categorical, or None when it has too many
+    # distinct values or holds something other than strings, which could be
+    # told apart by type but not by hash (1, 1.0 and True).
+    if series.dtype != object or (not force and len(series) < MIN_CATEGORICAL_ROWS):
+        return None
+    if not force and series.iloc[:SAMPLE_ROWS].nunique() > MAX_CATEGORICAL_RATIO * min(len(series), SAMPLE_ROWS):
+        return None
+    codes, uniques = pd.factorize(series.to_numpy())
+    if not force and len(uniques) > MAX_CATEGORICAL_RATIO * len(series):
+        return None
+    if not all(isinstance(value, str) for value in uniques):
+        return None
+    categorical = pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(pd.Index(uniques, dtype=object)))
+    return pd.Series(categorical, index=series.index, name=series.name)
+
+
+def categorical_columns(path, columns=None, categorical=None, file_format=None):
+    # Object columns to read dictionary encoded: those with few distinct
+    # values in the first rows of a large file, and those named in
+    # `categorical`.
+    if categorical is False:
+        return []
+    sample = sample_dataset(path, SAMPLE_ROWS, columns, file_format)
+    if sample is None:
+        return []
+    hinted = set(categorical or ())
+    large = len(sample) >= min(SAMPLE_ROWS, MIN_CATEGORICAL_ROWS)
+    return [column for column in sample.columns
+            if sample[column].dtype == object
+            and (column in hinted or (large and sample[column].nunique() <= MAX_CATEGORICAL_RATIO * len(sample)))]
+
+
+def decode_column(series):
+    return series.astype(object)
+
+
+def dictionary_values(series, function):
+    # Applies a value-wise function to the distinct values of a categorical
+    # column and remaps the codes. Only values present in the column are
+    # passed, with a missing value when there are any, so the function sees the
+    # same set of values, and infers the same result type, as on the rows.
+    categorical = series.array
+    # Codes are as narrow as the number of categories allows, so they are
+    # widened before the missing code (-1) is shifted to 0.
+    codes = categorical.codes.astype(np.intp)
+    counts = np.bincount(codes + 1, minlength=len(categorical.categories) + 1)
+    present = np.flatnonzero(counts[1:])
+    values = categorical.categories.to_numpy(dtype=object)[present]
+    if counts[0] > 0:
+        values = np.append(values, np.array([np.nan], dtype=object))
+    mapped = np.asarray(function(pd.Series(values, dtype=object)), dtype=object)
+    lookup = np.zeros(len(categorical.categories) + 1, dtype=np.intp)
+    lookup[present + 1] = np.arange(len(present))
+    lookup[0] = len(values) - 1
+    value_codes = lookup[codes + 1]
+    if not all(isinstance(value, str) or (isinstance(value, float) and np.isnan(value)) for value in mapped):
+        # Results that are not all strings cannot be deduplicated safely, so
+        # they are expanded to a plain column.
+        return pd.Series(mapped[value_codes], index=series.index, name=series.name)
+    new_codes, uniques = pd.factorize(mapped)
+    categorical = pd.Categorical.from_codes(new_codes[value_codes], dtype=pd.CategoricalDtype(pd.Index(uniques, dtype=object)))
+    return pd.Series(categorical, index=series.index, name=series.name)
+
+
+def map_values(series, function):
+    # Runs function on the distinct values of a categorical column, or on every
+    # row of any other column.
+    if is_categorical(series) and series.cat.categories.dtype == object:
+        return dictionary_values(series, function)
+    return function(series)
+
+
+def dictionary_columns(transformation_type, transformation):
+    if transformation_type == 'convert_case':
+        return list(transformation['mapping'])
+    if transformation_type == 'mask':
+        return list(transformation['columns'])
+    return [transformation['column']]
+
+
+class ColumnEncoder:
+    # Keeps low cardinality object columns dictionary encoded between the
+    # transformations that can work on them, and decodes them before anything
+    # else reads them. `categorical` names columns to encode whatever their
+    # cardinality, or is False to never encode. Arrow-backed and nullable
+    # columns are likewise turned into plain ones before a transformation
+    # that could treat them differently reads them.
+
+    def __init__(self, categorical=None, writes_rejects=False):
+        self.enabled = categorical is not False
+        self.hinted = set(categorical or ())
+        self.encoded = set()
+        self.extension = set()
+        self.writes_rejects = writes_rejects
+
+    def start(self, df):
+        # Columns read dictionary encoded are handled like the ones encoded
+        # here, and decoded before the frame is returned.
+        if self.enabled:
+            self.encoded = {column for column in df.columns
+                            if is_categorical(df[column]) and df[column].cat.categories.dtype == object}
+        self.extension = {column for column in df.columns if is_extension(df[column])}
+        return df
+
+    def before(self, df, transformation_type, transformation):
+        if transformation_type in ENCODED_TRANSFORMATIONS:
+            self._follow(transformation_type, transformation)
+            return df
+        if self.extension and transformation_type not in EXTENSION_TRANSFORMATIONS:
+            for column in self._touched(df, transformation_type, transformation, self.extension):
+                if column in df.columns and is_extension(df[column]):
+                    df[column] = plain_column(df[column])
+                self.extension.discard(column)
+        if not self.enabled:
+            return df
+        if transformation_type in DICTIONARY_TRANSFORMATIONS:
+            for column in dictionary_columns(transformation_type, transformation):
+                if column in self.encoded or column not in df.columns:
+                    continue
+                encoded = encode_column(df[column], column in self.hinted)
+                if encoded is not None:
+                    df[column] = encoded
+                    self.encoded.add(column)
+            if transformation_type == 'lookup' and transformation.get('output_column'):
+                # The looked up values of an encoded column come out encoded.
+                if transformation['column'] in self.encoded:
+                    self.encoded.add(transformation['output_column'])
+                else:
+                    self.encoded.discard(transformation['output_column'])
+            return df
+        return self.decode(df, self._touched(df, transformation_type, transformation, self.encoded))
+
+    def _touched(self, df, transformation_type, transformation, columns):
+        # Which of columns the transformation reads or writes.
+        if transformation_type == 'validate':
+            # Rejected rows are written as they are, so all of them count.
+            if self.writes_rejects:
+                return list(columns)
+            return [column for column in columns if column in {rule['column'] for rule in transformation}]
+        if transformation_type in DICTIONARY_TRANSFORMATIONS:
+            return [column for column in columns if column in dictionary_columns(transformation_type, transformation)]
+        reads, writes, _ = analyze_transformation(transformation_type, transformation, list(df.columns))
+        if not reads and not writes:
+            return list(columns)
+        return [column for column in columns if column_matches(column, reads) or column_matches(column, writes)]
+
+    def _follow(self, transformation_type, transformation):
+        # Encoded columns keep their codes when copied or renamed.
+        if transformation_type == 'duplicate':
+            for source, target in transformation['mapping'].items():
+                for names in (self.encoded, self.hinted, self.extension):
+                    if source in names:
+                        names.add(target)
+                    else:
+                        names.discard(target)
+        elif transformation_type == 'rename':
+            mapping = transformation['mapping']
+            self.encoded = {mapping.get(column, column) for column in self.encoded}
+            self.extension = {mapping.get(column, column) for column in self.extension}
+            self.hinted = {mapping.get(column, column) for column in self.hinted}
+        elif transformation_type == 'drop':
+            self.encoded.difference_update(transformation['columns'])
+            self.extension.difference_update(transformation['columns'])
+        elif transformation_type == 'filter':
+            self.encoded.intersection_update(transformation['columns'])
+            self.extension.intersection_update(transformation['columns'])
+
+    def decode(self, df, columns=None):
+        for column in list(self.encoded if columns is None else columns):
+            if column in df.columns and is_categorical(df[column]):
+                df[column] = decode_column(df[column])
+            self.encoded.discard(column)
+        return df
@@ -0,0 +1,216 @@
+import collections
+import contextlib
+import io
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+# Codec extensions, which decide the codec of a file named with one.
+COMPRESSIONS = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+    '.lz4': 'lz4'
+}
+
+# The first bytes of a file written with each codec.
+MAGIC_NUMBERS = {
+    b'\x1f\x8b': 'gzip',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+    b'\x04\x22\x4d\x18': 'lz4'
+}
+
+# Uncompressed bytes per block. Blocks are compressed independently, as gzip
+# members or zstd and lz4 frames, which concatenate into one valid file that
+# gzip, zstd and lz4 decompress as a whole.
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Blocks held between the codec threads and the reader or writer, so memory
+# stays bounded however far one side runs ahead of the other.
+MAX_PENDING_BLOCKS = 8
+
+COMPRESSION_THREADS = os.cpu_count() or 1
+
+# The codec of files written without a codec extension, set by the compression
+# key of the step running in this process.
+_compression = None
+
+
+def check_compression(compression):
+    if compression is not None and compression not in set(COMPRESSIONS.values()):
+        raise ValueError(f"Invalid compression '{compression}'. Expected one of: {', '.join(sorted(set(COMPRESSIONS.values())))}")
+    return compression
+
+
+def use_compression(compression=None):
+    global _compression
+    _compression = check_compression(compression)
+
+
+def step_compression():
+    return _compression
+
+
+def strip_compression(path):
+    root, extension = os.path.splitext(path)
+    return root if extension.lower() in COMPRESSIONS else path
+
+
+def file_compression(path):
+    # The codec a file is written with: the one its extension names, or else
+    # the compression of the step.
+    return COMPRESSIONS.get(os.path.splitext(path)[1].lower(), _compression)
+
+
+def stored_compression(path):
+    # The codec a file was written with, from its first bytes, so inputs are
+    # read whatever they are named. No CSV file starts with these bytes.
+    with open(path, 'rb') as file:
+        head = file.read(4)
+    return next((compression for magic, compression in MAGIC_NUMBERS.items() if head.startswith(magic)), None)
+
+
+def _require_pyarrow(compression):
+    if pa is None:
+        raise ValueError(f"pyarrow is required to read and write {compression} files")
+
+
+class _DecompressingReader(io.RawIOBase):
+    # Decompresses a file on a background thread into a bounded queue of
+    # blocks, so the next block is decompressed while the parser works on the
+    # ones before it. A compressed stream does not mark where its blocks start,
+    # so each file is decompressed by one thread.
+
+    def __init__(self, path, compression):
+        self.stream = pa.CompressedInputStream(pa.OSFile(path), compression)
+        self.blocks = queue.Queue(MAX_PENDING_BLOCKS)
+        self.block = memoryview(b'')
+        self.done = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._decompress, daemon=True)
+        self.thread.start()
+
+    def _decompress(self):
+        try:
+            while not self.stopped.is_set():
+                block = self.stream.read(BLOCK_SIZE)
+                self._put(block)
+                if not block:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Gives up when the reader was closed before reading everything.
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.block:
+            if self.done:
+                return 0
+            item = self.blocks.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self.done = True
+                return 0
+            self.block = memoryview(item)
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.stream.close()
+        super().close()
+
+
+class _CompressingWriter(io.RawIOBase):
+    # Cuts what is written into blocks compressed on a thread pool while the
+    # next block is being filled, and writes them to the file in order.
+
+    def __init__(self, path, compression, append=False):
+        self.file = open(path, 'ab' if append else 'wb')
+        self.compression = compression
+        self.executor = ThreadPoolExecutor(max_workers=COMPRESSION_THREADS)
+        self.buffer = bytearray()
+        self.pending = collections.deque()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            self._submit(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block):
+        if len(self.pending) >= MAX_PENDING_BLOCKS:
+            self._write_oldest()
+        self.pending.append(self.executor.submit(pa.compress, block, self.compression, asbytes=True))
+
+    def _write_oldest(self):
+        self.file.write(self.pending.popleft().result())
+
+    def flush(self):
+        # Compresses what is buffered as a smaller block, so everything written
+        # so far is on disk.
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self._write_oldest()
+        self.file.flush()
+
+    def close(self):
+        if not self.closed:
+            try:
+                # Flushes what is still buffered.
+                super().close()
+            finally:
+                self.executor.shutdown()
+                self.file.close()
+
+
+@contextlib.contextmanager
+def open_input(path):
+    # Yields what read_csv should read: the path of an uncompressed file, or a
+    # file object decompressing a compressed one.
+    compression = stored_compression(path)
+    if compression is None:
+        yield path
+        return
+    _require_pyarrow(compression)
+    with _DecompressingReader(path, compression) as reader:
+        yield reader
+
+
+def open_output(path, append=False):
+    # A text file for to_csv, compressed when the path names a codec or the
+    # step has one.
+    compression = file_compression(path)
+    if compression is None:
+        return open(path, 'a' if append else 'w', newline='')
+    _require_pyarrow(compression)
+    return io.TextIOWrapper(_CompressingWriter(path, compression, append), encoding='utf-8', newline='')
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import pandas as pd
+
+
+class DatasetCache:
+
+    def __init__(self, memory_limit, intermediate_files=(), spill_dir=None):
+        self.memory_limit = memory_limit
+        self.intermediate_files = {os.path.abspath(path) for path in intermediate_files}
+        self.spill_path = tempfile.mkdtemp(prefix='etl-cache-', dir=spill_dir)
+        self.datasets = OrderedDict()
+        self.spilled = {}
+        self.spill_count = 0
+        self.memory_usage = 0
+
+    def is_intermediate(self, path):
+        return os.path.abspath(path) in self.intermediate_files
+
+    def __contains__(self, path):
+        path = os.path.abspath(path)
+        return path in self.datasets or path in self.spilled
+
+    def put(self, path, df):
+        path = os.path.abspath(path)
+        self.remove(path)
+        self.datasets[path] = (df, int(df.memory_usage(deep=True).sum()))
+        self.memory_usage += self.datasets[path][1]
+        self._evict()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        if path in self.datasets:
+            self.datasets.move_to_end(path)
+            return self.datasets[path][0]
+        if path in self.spilled:
+            df = pd.read_pickle(self.spilled[path])
+            self.put(path, df)
+            return df
+        return None
+
+    def remove(self, path):
+        path = os.path.abspath(path)
+        if path in self.datasets:
+            self.memory_usage -= self.datasets.pop(path)[1]
+        if path in self.spilled:
+            os.remove(self.spilled.pop(path))
+
+    def _evict(self):
+        # Least recently used datasets are spilled to pickle files, which keep
+        # the exact dtypes and load back far faster than re-parsing CSV.
+        while self.memory_usage > self.memory_limit and self.datasets:
+            path, (df, memory_usage) = self.datasets.popitem(last=False)
+            spill_file = os.path.join(self.spill_path, f'{self.spill_count}_{os.path.basename(path)}.pkl')
+            self.spill_count += 1
+            df.to_pickle(spill_file)
+            self.spilled[path] = spill_file
+            self.memory_usage -= memory_usage
+
+    def close(self):
+        self.datasets.clear()
+        self.spilled.clear()
+        self.memory_usage = 0
+        shutil.rmtree(self.spill_path, ignore_errors=True)
@@ -0,0 +1,161 @@
+import os
+import pandas as pd
+from profiling import record_rows, record_bytes
+from schema import schemas_enabled, read_typed_csv, write_frame_schema
+from compression import open_input, open_output, step_compression, strip_compression
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow'
+}
+
+
+def dataset_format(path, file_format=None):
+    # Known extensions decide the format. Other files use the given format,
+    # so a step can mix e.g. CSV inputs with an Arrow intermediate named .tmp.
+    # A codec extension after the format's, as in .csv.gz, is skipped.
+    if file_format is not None and file_format not in set(FORMATS.values()):
+        raise ValueError(f"Invalid format '{file_format}'. Expected one of: {', '.join(sorted(set(FORMATS.values())))}")
+    file_format = FORMATS.get(os.path.splitext(strip_compression(path))[1].lower(), file_format or 'csv')
+    if file_format != 'csv' and strip_compression(path) != path:
+        raise ValueError(f"Only CSV files are compressed whole, '{path}' is {file_format}. Use the compression key instead")
+    return file_format
+
+
+def parquet_compression():
+    # Parquet and Arrow files compress their columns with the step's codec.
+    return step_compression() or 'snappy'
+
+
+def ipc_options():
+    compression = step_compression()
+    if compression is None:
+        return None
+    if compression == 'gzip':
+        raise ValueError("Arrow files are compressed with lz4 or zstd, not gzip")
+    return pa.ipc.IpcWriteOptions(compression=compression)
+
+
+def require_pyarrow(file_format):
+    if pa is None:
+        raise ValueError(f"pyarrow is required to read and write {file_format} files")
+
+
+def open_arrow(path):
+    # Arrow IPC files are memory mapped, so reading columns only touches the
+    # pages holding them.
+    return pa.ipc.open_file(pa.memory_map(path, 'r'))
+
+
+def select_columns(names, columns):
+    # Columns come back in file order, as read_csv does with usecols.
+    return None if columns is None else [column for column in names if column in columns]
+
+
+def dataset_columns(path, cache=None, file_format=None):
+    if cache is not None and path in cache:
+        return list(cache.get(path).columns)
+    if not os.path.exists(path):
+        return None
+    file_format = dataset_format(path, file_format)
+    if file_format == 'csv':
+        with open_input(path) as source:
+            return list(pd.read_csv(source, nrows=0).columns)
+    require_pyarrow(file_format)
+    if file_format == 'parquet':
+        return list(pq.read_schema(path).names)
+    return list(open_arrow(path).schema.names)
+
+
+def read_dataset(path, cache=None, columns=None, file_format=None, categorical=None):
+    df = _read_dataset(path, cache, columns, file_format, categorical)
+    record_rows('in', df)
+    if cache is None or path not in cache:
+        record_bytes('in', path)
+    return df
+
+
+def _read_dataset(path, cache=None, columns=None, file_format=None, categorical=None):
+    # Columns named in `categorical` are read dictionary encoded where the
+    # format allows it.
+    if cache is not None and path in cache:
+        # Transformations modify frames in place, so callers get their own copy.
+        df = cache.get(path)
+        return (df if columns is None else df[columns]).copy()
+    file_format = dataset_format(path, file_format)
+    if file_format == 'csv':
+        # With schema sidecars, CSV files are parsed by pyarrow with the
+        # recorded column types instead of inferring them again.
+        if schemas_enabled():
+            df = read_typed_csv(path, columns, categorical)
+            if df is not None:
+                return df
+        with open_input(path) as source:
+            return pd.read_csv(source, usecols=columns, dtype={column: 'category' for column in categorical or ()})
+    require_pyarrow(file_format)
+    if file_format == 'parquet':
+        return pq.read_table(path, columns=select_columns(pq.read_schema(path).names, columns),
+                             read_dictionary=categorical or None).to_pandas()
+    table = open_arrow(path).read_all()
+    if columns is not None:
+        table = table.select(select_columns(table.schema.names, columns))
+    return table.to_pandas()
+
+
+def sample_dataset(path, rows, columns=None, file_format=None):
+    # The first rows of a file, or None for formats that are not read in
+    # order.
+    file_format = dataset_format(path, file_format)
+    if file_format == 'csv':
+        with open_input(path) as source:
+            return pd.read_csv(source, usecols=columns, nrows=rows)
+    if file_format == 'parquet':
+        require_pyarrow(file_format)
+        parquet_file = pq.ParquetFile(path)
+        batches = parquet_file.iter_batches(rows, columns=select_columns(parquet_file.schema_arrow.names, columns))
+        return next(batches, parquet_file.schema_arrow.empty_table()).to_pandas()
+    return None
+
+
+def write_dataset(df, path, cache=None, file_format=None):
+    record_rows('out', df)
+    if cache is not None and cache.is_intermediate(path):
+        cache.put(path, df)
+        return
+    file_format = dataset_format(path, file_format)
+    if file_format == 'csv':
+        with open_output(path) as file:
+            df.to_csv(file, index=False)
+        record_bytes('out', path)
+        if schemas_enabled():
+            write_frame_schema(path, df)
+        return
+    require_pyarrow(file_format)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if file_format == 'parquet':
+        pq.write_table(table, path, compression=parquet_compression())
+    else:
+        with pa.ipc.new_file(path, table.schema, options=ipc_options()) as writer:
+            writer.write_table(table)
+    record_bytes('out', path)
+
+
+def iter_dataset_chunks(df, chunksize, columns=None):
+    if columns is not None:
+        df = df[columns]
+    for start in range(0, max(len(df), 1), chunksize):
+        chunk = df.iloc[start:start + chunksize].copy()
+        record_rows('in', chunk)
+        yield chunk
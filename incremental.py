@@ -0,0 +1,216 @@
+import hashlib
+import io
+import json
+import os
+import pandas as pd
+from dataset_io import dataset_format
+from compression import file_compression, stored_compression
+from stream import BARRIER_TRANSFORMATIONS, CsvChunkWriter
+from parallel import apply_transformations_parallel
+
+
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+
+# Bytes just before a checkpoint offset that are hashed to make sure the
+# input was only appended to, not rewritten.
+TAIL_HASH_BYTES = 4096
+
+
+def checkpoint_file(output_file):
+    return f'{output_file}{CHECKPOINT_SUFFIX}'
+
+
+def definition_hash(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _hash_range(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        return hashlib.sha256(file.read(end - start)).hexdigest()
+
+
+def _header_end(path):
+    with open(path, 'rb') as file:
+        return len(file.readline())
+
+
+def complete_size(path):
+    # A writer may be in the middle of appending a row, so only whole lines
+    # (up to the last newline) are taken.
+    size = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        file.seek(max(size - TAIL_HASH_BYTES, 0))
+        block = file.read()
+    last_newline = block.rfind(b'\n')
+    if last_newline < 0:
+        return size if size <= TAIL_HASH_BYTES else _header_end(path)
+    return size - len(block) + last_newline + 1
+
+
+def input_checkpoint(path, rows, dtypes=None, offset=None):
+    offset = complete_size(path) if offset is None else offset
+    return {
+        'offset': offset,
+        'rows': rows,
+        'header_hash': _hash_range(path, 0, _header_end(path)),
+        'tail_hash': _hash_range(path, max(offset - TAIL_HASH_BYTES, 0), offset),
+        'dtypes': None if dtypes is None else {column: str(dtype) for column, dtype in dtypes.items()}
+    }
+
+
+def read_checkpoint(output_file):
+    if not os.path.exists(checkpoint_file(output_file)):
+        return None
+    with open(checkpoint_file(output_file)) as file:
+        return json.load(file)
+
+
+def write_checkpoint(output_file, definition, inputs, reject_file=None):
+    checkpoint = {
+        'definition': definition,
+        'inputs': {os.path.abspath(path): input_checkpoint for path, input_checkpoint in inputs.items()},
+        'output_size': os.path.getsize(output_file),
+        'reject_size': os.path.getsize(reject_file) if reject_file is not None and os.path.exists(reject_file) else None
+    }
+    with open(checkpoint_file(output_file), 'w') as file:
+        json.dump(checkpoint, file, indent=2, sort_keys=True)
+
+
+def remove_checkpoint(output_file):
+    if os.path.exists(checkpoint_file(output_file)):
+        os.remove(checkpoint_file(output_file))
+
+
+def is_appended(path, checkpoint):
+    if not os.path.exists(path):
+        return False
+    offset = checkpoint['offset']
+    return (os.path.getsize(path) >= offset
+            and _hash_range(path, 0, _header_end(path)) == checkpoint['header_hash']
+            and _hash_range(path, max(offset - TAIL_HASH_BYTES, 0), offset) == checkpoint['tail_hash'])
+
+
+def read_rows(path, start, end, columns=None, dtypes=None):
+    # Reads the rows stored between two byte offsets, parsing them the way the
+    # full input was parsed. Returns None when they cannot be: a column whose
+    # new rows do not parse to its recorded type (blanks or text in an integer
+    # column, text in a float column) would change type.
+    header = list(pd.read_csv(path, nrows=0).columns)
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    dtypes = dtypes or {}
+    # Types read from a schema sidecar (text, nullable and dictionary
+    # columns) take any value and are forced as well.
+    forced_dtypes = {column: dtype for column, dtype in dtypes.items()
+                     if dtype in ('object', 'float64', 'string', 'Int64', 'boolean', 'category')}
+    try:
+        df = pd.read_csv(io.BytesIO(data), header=None, names=header, usecols=columns, dtype=forced_dtypes)
+    except (ValueError, TypeError):
+        return None
+    if len(df) > 0 and any(column in dtypes and str(df[column].dtype) != dtypes[column] for column in df.columns):
+        return None
+    return df
+
+
+def append_writer(path):
+    # Chunks are appended below the header already on disk.
+    writer = CsvChunkWriter(path)
+    if os.path.exists(path):
+        writer.columns = list(pd.read_csv(path, nrows=0).columns)
+    return writer
+
+
+def unsupported_reason(input_files, output_file, transformation_definitions=(), cache=None, file_format=None, extra_files=()):
+    # Why the step cannot run incrementally at all, or None.
+    barriers = [list(transformation_definition.keys())[0] for transformation_definition in transformation_definitions
+                if list(transformation_definition.keys())[0] in BARRIER_TRANSFORMATIONS]
+    if barriers:
+        return f"'{barriers[0]}' needs every row, so incremental mode requires a full recompute"
+    if any(dataset_format(path, file_format) != 'csv' for path in [*input_files, output_file, *extra_files]):
+        return "incremental mode only appends to CSV files"
+    if any(file_compression(path) is not None or (os.path.exists(path) and stored_compression(path) is not None)
+           for path in [*input_files, output_file, *extra_files]):
+        return "incremental mode only appends to uncompressed files"
+    if cache is not None and any(path in cache or cache.is_intermediate(path) for path in [*input_files, output_file]):
+        return "incremental mode needs its input and output on disk"
+    return None
+
+
+def stale_reason(input_files, output_file, definition, checkpoint):
+    # Why the checkpoint cannot be continued from, or None when only the rows
+    # appended to the inputs since the checkpoint need processing.
+    if checkpoint is None:
+        return "there is no checkpoint yet"
+    if checkpoint['definition'] != definition:
+        return "the step definition changed since the checkpoint"
+    if not os.path.exists(output_file) or os.path.getsize(output_file) != checkpoint['output_size']:
+        return "the output changed since the checkpoint"
+    for path in input_files:
+        input_checkpoint = checkpoint['inputs'].get(os.path.abspath(path))
+        if input_checkpoint is None or not is_appended(path, input_checkpoint):
+            return f"'{path}' was rewritten rather than appended to"
+    return None
+
+
+def process_increment(input_file, output_file, transformation_definitions, checkpoint, columns=None, reject_file=None, workers=1):
+    # Runs the rows appended to the input since the checkpoint through the
+    # transformations and appends them to the output. Returns the number of
+    # new rows, or None when they have to be processed in full.
+    previous = checkpoint['inputs'][os.path.abspath(input_file)]
+    end = complete_size(input_file)
+    df = read_rows(input_file, previous['offset'], end, columns, previous['dtypes'])
+    if df is None:
+        return None
+    rows = len(df)
+    if rows > 0:
+        rejects = append_writer(reject_file) if reject_file is not None else None
+        writer = append_writer(output_file)
+        # Both files are closed, so everything is on disk before the
+        # checkpoint records their sizes.
+        try:
+            df = apply_transformations_parallel(df, transformation_definitions, workers, rejects)
+            writer.write(df)
+        finally:
+            writer.close()
+            if rejects is not None:
+                rejects.close()
+    write_checkpoint(output_file, checkpoint['definition'], {
+        input_file: input_checkpoint(input_file, None if previous['rows'] is None else previous['rows'] + rows, previous['dtypes'], end)
+    }, reject_file)
+    return rows
+
+
+def merge_increment(input_file1, input_file2, output_file, key_column, checkpoint):
+    # For an inner join, the new output rows are the new left rows joined with
+    # the whole right input, plus the old left rows joined with the new right
+    # rows. Returns the number of new rows, or None when they have to be
+    # joined in full.
+    previous = [checkpoint['inputs'][os.path.abspath(path)] for path in (input_file1, input_file2)]
+    ends = [complete_size(path) for path in (input_file1, input_file2)]
+    new_left = read_rows(input_file1, previous[0]['offset'], ends[0], dtypes=previous[0]['dtypes'])
+    new_right = read_rows(input_file2, previous[1]['offset'], ends[1], dtypes=previous[1]['dtypes'])
+    if new_left is None or new_right is None:
+        return None
+    results = []
+    if len(new_left) > 0:
+        right = read_rows(input_file2, _header_end(input_file2), ends[1], dtypes=previous[1]['dtypes'])
+        if right is None:
+            return None
+        results.append(pd.merge(new_left, right, on=key_column))
+    if len(new_right) > 0:
+        old_left = read_rows(input_file1, _header_end(input_file1), previous[0]['offset'], dtypes=previous[0]['dtypes'])
+        results.append(pd.merge(old_left, new_right, on=key_column))
+    writer = append_writer(output_file)
+    try:
+        for result in results:
+            writer.write(result)
+    finally:
+        writer.close()
+    inputs = {}
+    for path, input_previous, end, new_rows in zip((input_file1, input_file2), previous, ends, (new_left, new_right)):
+        rows = None if input_previous['rows'] is None else input_previous['rows'] + len(new_rows)
+        inputs[path] = input_checkpoint(path, rows, input_previous['dtypes'], end)
+    write_checkpoint(output_file, checkpoint['definition'], inputs)
+    return len(new_left) + len(new_right)
@@ -0,0 +1,180 @@
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from dataset_io import iter_dataset_chunks, dataset_columns
+from stream import DEFAULT_CHUNKSIZE, read_dataset_chunks, read_run, chunk_writer
+
+
+DEFAULT_PARTITIONS = 16
+
+JOIN_TYPES = {'inner', 'left', 'right', 'outer'}
+
+
+def key_columns(key_column):
+    return list(key_column) if isinstance(key_column, (list, tuple)) else [key_column]
+
+
+def _dataset_chunks(input_file, chunksize, cache=None, file_format=None):
+    if cache is not None and input_file in cache:
+        return iter_dataset_chunks(cache.get(input_file), chunksize)
+    return read_dataset_chunks(input_file, chunksize, file_format=file_format)
+
+
+def partition_numbers(df, keys, partitions):
+    # Numeric keys are hashed as float64 so that 1 and 1.0 land in the same
+    # partition, as they match in pd.merge.
+    hashed_keys = pd.DataFrame({
+        key: df[key].astype('float64') if pd.api.types.is_numeric_dtype(df[key]) else df[key]
+        for key in keys
+    })
+    return (pd.util.hash_pandas_object(hashed_keys, index=False) % partitions).to_numpy()
+
+
+def partition_chunks(chunks, keys, partitions, spill_path, name, empty):
+    # Rows are appended to one spill file per partition, so only one chunk is
+    # held in memory. Returns the file paths and an empty frame with the
+    # columns and dtypes of the first chunk.
+    paths = [os.path.join(spill_path, f'{name}_{partition}.pkl') for partition in range(partitions)]
+    files = [open(path, 'wb') for path in paths]
+    first = True
+    try:
+        for chunk in chunks:
+            if first:
+                empty = chunk.iloc[:0]
+                first = False
+            for partition, rows in chunk.groupby(partition_numbers(chunk, keys, partitions), sort=False):
+                pickle.dump(rows, files[partition], protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for file in files:
+            file.close()
+    return paths, empty
+
+
+def _read_partition(path, empty):
+    blocks = list(read_run(path))
+    return pd.concat(blocks, ignore_index=True) if blocks else empty
+
+
+def join_partition(left_path, right_path, left_empty, right_empty, keys, how, result_path=None):
+    result = pd.merge(_read_partition(left_path, left_empty), _read_partition(right_path, right_empty), on=keys, how=how)
+    if result_path is None:
+        return result
+    with open(result_path, 'wb') as file:
+        pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return result_path
+
+
+def grace_join(left_chunks, right_chunks, keys, how, empties, spill_path, partitions=DEFAULT_PARTITIONS, workers=1):
+    # Both inputs are hash partitioned on the keys, so matching rows always
+    # share a partition and each partition pair is joined on its own.
+    left_paths, left_empty = partition_chunks(left_chunks, keys, partitions, spill_path, 'left', empties[0])
+    right_paths, right_empty = partition_chunks(right_chunks, keys, partitions, spill_path, 'right', empties[1])
+    if workers <= 1:
+        for left_path, right_path in zip(left_paths, right_paths):
+            result = join_partition(left_path, right_path, left_empty, right_empty, keys, how)
+            os.remove(left_path)
+            os.remove(right_path)
+            if len(result) > 0:
+                yield result
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(join_partition, left_path, right_path, left_empty, right_empty, keys, how,
+                                   os.path.join(spill_path, f'result_{partition}.pkl'))
+                   for partition, (left_path, right_path) in enumerate(zip(left_paths, right_paths))]
+        for future in futures:
+            result_path = future.result()
+            with open(result_path, 'rb') as file:
+                result = pickle.load(file)
+            os.remove(result_path)
+            if len(result) > 0:
+                yield result
+
+
+def _before(df, keys, boundary):
+    # Rows whose key tuple sorts before the boundary tuple.
+    mask = pd.Series(False, index=df.index)
+    equal = pd.Series(True, index=df.index)
+    for key, value in zip(keys, boundary):
+        mask |= equal & (df[key] < value)
+        equal &= df[key] == value
+    return mask.to_numpy()
+
+
+def _sorted_chunks(chunks, keys, name):
+    previous_key = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if not pd.MultiIndex.from_frame(chunk[keys]).is_monotonic_increasing or \
+                (previous_key is not None and _before(chunk.iloc[:1], keys, previous_key)[0]):
+            raise ValueError(f"The {name} input is not sorted by {', '.join(keys)}")
+        previous_key = tuple(chunk[keys].iloc[-1])
+        yield chunk
+
+
+def sorted_join(left_chunks, right_chunks, keys, how, empties):
+    # Both inputs are already sorted on the keys, so rows can be joined as soon
+    # as neither side can still produce their key.
+    sides = [_sorted_chunks(left_chunks, keys, 'left'), _sorted_chunks(right_chunks, keys, 'right')]
+    buffers = [next(side, None) for side in sides]
+    done = [buffer is None for buffer in buffers]
+    buffers = [empty if buffer is None else buffer for buffer, empty in zip(buffers, empties)]
+    while not all(done):
+        last_keys = [tuple(buffer[keys].iloc[-1]) if len(buffer) > 0 else None for buffer in buffers]
+        limits = [index for index in range(2) if not done[index]]
+        if any(last_keys[index] is None for index in limits):
+            limiting = [index for index in limits if last_keys[index] is None]
+        else:
+            boundary = min(last_keys[index] for index in limits)
+            ready = [_before(buffer, keys, boundary) for buffer in buffers]
+            result = pd.merge(buffers[0][ready[0]], buffers[1][ready[1]], on=keys, how=how)
+            if len(result) > 0:
+                yield result
+            buffers = [buffer[~mask] for buffer, mask in zip(buffers, ready)]
+            limiting = [index for index in limits if last_keys[index] == boundary]
+        for index in limiting:
+            chunk = next(sides[index], None)
+            if chunk is None:
+                done[index] = True
+            else:
+                buffers[index] = pd.concat([buffers[index], chunk], ignore_index=True)
+    result = pd.merge(buffers[0], buffers[1], on=keys, how=how)
+    if len(result) > 0:
+        yield result
+
+
+def join_files(input_file1, input_file2, output_file, key_column, how='inner', chunksize=DEFAULT_CHUNKSIZE,
+               partitions=DEFAULT_PARTITIONS, sorted_inputs=False, workers=1, spill_dir=None, cache=None, file_format=None):
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Invalid join type '{how}'. Expected one of: {', '.join(sorted(JOIN_TYPES))}")
+    keys = key_columns(key_column)
+    empties = []
+    for input_file in (input_file1, input_file2):
+        columns = dataset_columns(input_file, cache, file_format)
+        if columns is None:
+            raise FileNotFoundError(f"No such file: '{input_file}'")
+        missing_keys = [key for key in keys if key not in columns]
+        if missing_keys:
+            raise KeyError(', '.join(missing_keys))
+        empties.append(pd.DataFrame(columns=columns))
+    left_chunks = _dataset_chunks(input_file1, chunksize, cache, file_format)
+    right_chunks = _dataset_chunks(input_file2, chunksize, cache, file_format)
+    with tempfile.TemporaryDirectory(prefix='etl-join-', dir=spill_dir) as spill_path:
+        if sorted_inputs:
+            results = sorted_join(left_chunks, right_chunks, keys, how, empties)
+        else:
+            results = grace_join(left_chunks, right_chunks, keys, how, empties, spill_path, partitions, workers)
+        writer = chunk_writer(output_file, file_format)
+        written = False
+        for result in results:
+            writer.write(result)
+            written = True
+        if not written:
+            # pd.merge moves the keys when both frames are empty, so take the
+            # column order from a one row join instead.
+            writer.write(pd.merge(empties[0].reindex([0]), empties[1].reindex([0]), on=keys, how=how).iloc[:0])
+        writer.close()
+        return writer.rows
+
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from dataset_io import read_dataset
+
+
+INDEX_SUFFIX = '.index'
+
+# Reference tables loaded in this process, least recently used first. Worker
+# processes forked after a table was loaded share its pages.
+MAX_CACHED_REFERENCES = 8
+_references = OrderedDict()
+
+
+class ReferenceIndex:
+    # A reference table as three arrays: its distinct keys in sorted order,
+    # the position of each key's value among the distinct values (-1 for a
+    # missing value) and the distinct values. Text is stored in fixed width
+    # numpy strings, so every array can be saved and memory mapped, and keys
+    # are found by binary search rather than through a hash table built in
+    # every process.
+
+    def __init__(self, keys, codes, values):
+        self.keys = keys
+        self.codes = codes
+        self.values = values
+
+    def _query(self, series):
+        # The values of series in the type of the keys, with a mask of those
+        # that can match: numeric keys match numbers and numeric text, text
+        # keys match the text of any value.
+        if self.keys.dtype.kind in 'if':
+            numbers = series if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype) \
+                else pd.to_numeric(series, errors='coerce')
+            if self.keys.dtype.kind == 'i' and pd.api.types.is_integer_dtype(numbers.dtype):
+                valid = numbers.notna().to_numpy()
+                return numbers.to_numpy(dtype=np.int64, na_value=0), valid
+            numbers = numbers.to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(numbers)
+            if self.keys.dtype.kind == 'i':
+                valid &= numbers == np.round(numbers)
+                return np.where(valid, numbers, 0).astype(np.int64), valid
+            return numbers, valid
+        valid = series.notna().to_numpy()
+        text = series.to_numpy(dtype=object, na_value='').astype(str)
+        query = text.astype(self.keys.dtype)
+        if text.dtype.itemsize > query.dtype.itemsize:
+            # Values longer than the keys are cut by the cast and cannot match.
+            valid &= query == text
+        return query, valid
+
+    def value_positions(self, series):
+        if len(self.keys) == 0:
+            return np.full(len(series), -1, dtype=np.intp)
+        query, valid = self._query(series)
+        # Searching for the values in sorted order walks the keys once
+        # instead of jumping around them.
+        order = np.argsort(query, kind='stable')
+        positions = np.empty(len(query), dtype=np.intp)
+        positions[order] = np.searchsorted(self.keys, query[order])
+        positions = np.minimum(positions, len(self.keys) - 1)
+        found = valid & (self.keys[positions] == query)
+        return np.where(found, self.codes[positions], -1).astype(np.intp)
+
+    def lookup(self, series, default_value=None):
+        # Only the distinct values that were found are turned into objects.
+        value_positions = self.value_positions(series)
+        needed, local_positions = np.unique(value_positions, return_inverse=True)
+        values = self.values[needed[needed >= 0]]
+        if values.dtype.kind == 'U':
+            values = values.astype(object)
+        if len(needed) and needed[0] < 0:
+            local_positions = local_positions - 1
+        result = pd.Series(pd.api.extensions.take(values, local_positions, allow_fill=True),
+                           index=series.index, name=series.name)
+        return result if default_value is None else result.fillna(default_value)
+
+
+def _key_array(keys):
+    if pd.api.types.is_integer_dtype(keys.dtype) and not keys.isna().any():
+        return keys.to_numpy(dtype=np.int64)
+    if pd.api.types.is_numeric_dtype(keys.dtype) and not pd.api.types.is_bool_dtype(keys.dtype):
+        return keys.to_numpy(dtype=np.float64)
+    return keys.to_numpy(dtype=object).astype(str)
+
+
+def _value_array(values):
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.to_numpy(dtype=np.int64 if pd.api.types.is_integer_dtype(values.dtype) else np.float64)
+    return values.to_numpy(dtype=object).astype(str)
+
+
+def build_reference(df, key_column, value_column):
+    # The first row of a key wins. Rows without a key never match.
+    missing_columns = [column for column in (key_column, value_column) if column not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Invalid columns specified for lookup reference: {', '.join(missing_columns)}")
+    df = df[df[key_column].notna()]
+    keys = _key_array(df[key_column])
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    codes, uniques = pd.factorize(df[value_column].iloc[order[first]])
+    return ReferenceIndex(keys[first], codes.astype(np.int32), _value_array(pd.Series(uniques)))
+
+
+def index_directory(reference_file, key_column, value_column):
+    return f'{reference_file}.{key_column}.{value_column}{INDEX_SUFFIX}'
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write_index(reference_file, key_column, value_column, file_format=None):
+    # Saves the index of a reference table next to it, so later runs memory
+    # map it instead of reading and sorting the table.
+    index = build_reference(read_dataset(reference_file, columns=[key_column, value_column], file_format=file_format),
+                            key_column, value_column)
+    directory = index_directory(reference_file, key_column, value_column)
+    os.makedirs(directory, exist_ok=True)
+    for name in ('keys', 'codes', 'values'):
+        np.save(os.path.join(directory, f'{name}.npy'), getattr(index, name))
+    with open(os.path.join(directory, 'source.json'), 'w') as file:
+        json.dump({'reference_file': os.path.abspath(reference_file), 'stat': _stat(reference_file)}, file)
+    return index
+
+
+def read_index(reference_file, key_column, value_column):
+    # The prebuilt index of a reference table memory mapped, or None when
+    # there is none or the table changed since it was built.
+    directory = index_directory(reference_file, key_column, value_column)
+    if not os.path.exists(os.path.join(directory, 'source.json')):
+        return None
+    with open(os.path.join(directory, 'source.json')) as file:
+        if json.load(file)['stat'] != _stat(reference_file):
+            return None
+    return ReferenceIndex(*[np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in ('keys', 'codes', 'values')])
+
+
+def load_reference(reference_file, key_column, value_column, file_format=None):
+    # Loaded once per process and reused while the file is unchanged.
+    cache_key = (os.path.abspath(reference_file), key_column, value_column)
+    stat = _stat(reference_file)
+    cached = _references.get(cache_key)
+    if cached is not None and cached[0] == stat:
+        _references.move_to_end(cache_key)
+        return cached[1]
+    index = read_index(reference_file, key_column, value_column)
+    if index is None:
+        index = build_reference(read_dataset(reference_file, columns=[key_column, value_column], file_format=file_format),
+                                key_column, value_column)
+    _references[cache_key] = (stat, index)
+    _references.move_to_end(cache_key)
+    while len(_references) > MAX_CACHED_REFERENCES:
+        _references.popitem(last=False)
+    return index
+
+
+def reference_files(transformation_definitions):
+    return [list(transformation_definition.values())[0]['reference_file']
+            for transformation_definition in transformation_definitions or []
+            if list(transformation_definition.keys())[0] == 'lookup']
+
+
+def preload_references(transformation_definitions):
+    # Loads the reference tables of the lookups before worker processes are
+    # forked, so they share one copy.
+    for transformation_definition in transformation_definitions:
+        if list(transformation_definition.keys())[0] == 'lookup':
+            transformation = list(transformation_definition.values())[0]
+            load_reference(transformation['reference_file'], transformation['key_column'], transformation['value_column'],
+                           transformation.get('format'))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Build the on-disk index of a lookup reference table.')
+    parser.add_argument('reference_file', type=str, help='Reference CSV, Parquet or Arrow file')
+    parser.add_argument('--key', type=str, required=True, help='Column holding the keys')
+    parser.add_argument('--value', type=str, required=True, help='Column holding the values')
+    parser.add_argument('--format', type=str, default=None, help='File format (csv, parquet or arrow) when the extension does not name one')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    index = write_index(args.reference_file, args.key, args.value, args.format)
+    print(f"Indexed {len(index.keys)} keys and {len(index.values)} distinct values of '{args.reference_file}' "
+          f"into '{index_directory(args.reference_file, args.key, args.value)}'.")
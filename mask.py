@@ -0,0 +1,163 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# Rules a mask can hold, with their required parameters. replace,
+# replace_text and replace_characters take the parameters of the
+# transformations of the same name.
+MASK_RULES = {
+    'replace': ('match', 'replacement'),
+    'regex': ('pattern', 'replacement'),
+    'replace_text': ('start_position', 'end_position', 'replacement'),
+    'replace_characters': ('num_characters', 'replacement')
+}
+
+
+def _trie(literals):
+    trie = {}
+    for literal in literals:
+        node = trie
+        for character in literal:
+            node = node.setdefault(character, {})
+        # The empty key marks the end of a literal.
+        node[''] = True
+    return trie
+
+
+def _trie_expression(node):
+    branches = [re.escape(character) + _trie_expression(child) for character, child in sorted(node.items()) if character != '']
+    if not branches:
+        return ''
+    expression = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    # A literal that ends here is only matched when no longer one does.
+    return f'(?:{expression})?' if '' in node else expression
+
+
+def literal_pattern(literals):
+    # All the literals in one regular expression shaped like a trie of their
+    # characters, so the scan follows one path per position whatever the
+    # number of literals, as an Aho-Corasick automaton would. At each position
+    # the longest literal wins.
+    return re.compile(_trie_expression(_trie(literals)))
+
+
+def _literal_rule(replacements):
+    if len(replacements) == 1:
+        [(match, replacement)] = replacements.items()
+        return lambda text: text.replace(match, replacement)
+    pattern = literal_pattern(replacements)
+    return lambda text: pattern.sub(lambda found: replacements[found.group()], text)
+
+
+def _regex_rule(pattern, replacement):
+    try:
+        pattern = re.compile(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern '{pattern}' specified for mask: {str(e)}")
+    return lambda text: pattern.sub(replacement, text)
+
+
+def _bounds(start_position, end_position, start, length):
+    # The slice of a text of the given length that replace_text masks.
+    if start:
+        return start_position, min(end_position + 1, length)
+    return max(length - end_position - 1, 0), max(length - start_position, 0)
+
+
+def _mask_slice(text, start_position, end_position, replacement, start):
+    start_index, end_index = _bounds(start_position, end_position, start, len(text))
+    return text[:start_index] + replacement * (end_index - start_index) + text[end_index:]
+
+
+def mask_positions(text, masks):
+    # Applies positional masks (start_position, end_position, replacement,
+    # start), in order, to an object array of strings. Masks only depend on
+    # the text length, so each group of equally long values is masked in one
+    # go: the strings are viewed as a matrix of code points and every masked
+    # range is overwritten for the whole group.
+    result = np.empty(len(text), dtype=object)
+    lengths = np.fromiter(map(len, text), dtype=np.intp, count=len(text))
+    for text_length, rows in pd.Series(lengths).groupby(lengths).indices.items():
+        values = text[rows]
+        bounds = [_bounds(start_position, end_position, start, text_length) for start_position, end_position, _, start in masks]
+        if text_length > 0 and all(len(mask[2]) == 1 and 0 <= start_index <= end_index <= text_length
+                                   for mask, (start_index, end_index) in zip(masks, bounds)):
+            codes = values.astype(f'U{text_length}').view(np.uint32).reshape(len(rows), text_length)
+            # Text ending in NUL characters loses them in a numpy string.
+            if not (codes[:, -1] == 0).any():
+                for mask, (start_index, end_index) in zip(masks, bounds):
+                    codes[:, start_index:end_index] = ord(mask[2])
+                result[rows] = codes.reshape(-1).view(f'U{text_length}').astype(object)
+                continue
+        # Masks that change the length of the text or reach past it are
+        # applied value by value.
+        for mask in masks:
+            values = np.array([_mask_slice(value, *mask) for value in values], dtype=object)
+        result[rows] = values
+    return result
+
+
+def compile_rules(rules):
+    # Turns mask rules into stages applied in order: ('text', functions) for
+    # a run of replace and regex rules, which every value goes through before
+    # the next value is read, and ('positions', masks) for a run of
+    # replace_text and replace_characters rules, applied by mask_positions. A
+    # run of replace rules becomes a single matcher that replaces every
+    # literal in one scan, so replacements are not scanned again by later
+    # literals.
+    stages = []
+    literals = {}
+
+    def stage(stage_type):
+        if not stages or stages[-1][0] != stage_type:
+            stages.append((stage_type, []))
+        return stages[-1][1]
+
+    def add_literals():
+        if literals:
+            stage('text').append(_literal_rule(dict(literals)))
+            literals.clear()
+
+    for rule in rules:
+        if not isinstance(rule, dict) or len(rule) != 1 or list(rule.keys())[0] not in MASK_RULES:
+            raise ValueError(f"Invalid rule specified for mask: {rule}")
+        rule_type, parameters = list(rule.items())[0]
+        missing_parameters = [name for name in MASK_RULES[rule_type] if name not in (parameters or {})]
+        if missing_parameters:
+            raise ValueError(f"Missing {', '.join(missing_parameters)} in {rule_type} rule of mask")
+        if rule_type == 'replace':
+            if parameters['match'] == '':
+                raise ValueError("Invalid empty match specified for mask")
+            # A literal listed twice keeps its first replacement.
+            literals.setdefault(str(parameters['match']), str(parameters['replacement']))
+            continue
+        add_literals()
+        if rule_type == 'regex':
+            stage('text').append(_regex_rule(parameters['pattern'], str(parameters['replacement'])))
+        elif rule_type == 'replace_text':
+            stage('positions').append((parameters['start_position'], parameters['end_position'], str(parameters['replacement']),
+                                       parameters.get('start', True)))
+        else:
+            stage('positions').append((0, parameters['num_characters'] - 1, str(parameters['replacement']), parameters.get('first', True)))
+    add_literals()
+    return stages
+
+
+def mask_values(values, stages):
+    # Every value is turned into text once, as astype(str) would, before the
+    # stages run.
+    text = np.empty(len(values), dtype=object)
+    text[:] = [str(value) for value in values.to_numpy(dtype=object)]
+    for stage_type, items in stages:
+        if stage_type == 'positions':
+            text = mask_positions(text, items)
+            continue
+
+        def apply(value):
+            for function in items:
+                value = function(value)
+            return value
+
+        text[:] = [apply(value) for value in text]
+    return text
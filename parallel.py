@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import numpy as np
+import pandas as pd
+from transform import apply_transformations
+from stream import union_columns, split_after_filters
+from plan import ROW_LOCAL_TRANSFORMATIONS
+from profiling import profile_span
+from lookup import preload_references
+
+
+# Transformations that give the same rows whichever partition a row is in.
+# split and split_pair may create a different number of columns per
+# partition; the missing ones are added back as blanks when the partitions
+# are concatenated. filter_records keeps or drops each row on its own, and a
+# partition it empties stops there. Everything else (sort and the checks)
+# runs on the whole frame between partitioned segments.
+PARTITIONED_TRANSFORMATIONS = ROW_LOCAL_TRANSFORMATIONS | {'split', 'split_pair', 'map_value', 'lookup', 'filter_records'}
+
+# Partitioning a segment made only of these costs more in copying the
+# partitions to the workers than it saves.
+CHEAP_TRANSFORMATIONS = {'create', 'duplicate', 'rename', 'drop', 'filter'}
+
+MIN_PARTITION_ROWS = 50000
+
+
+def parallel_segments(transformation_definitions):
+    segments = []
+    for transformation_definition in transformation_definitions:
+        partitioned = list(transformation_definition.keys())[0] in PARTITIONED_TRANSFORMATIONS
+        if segments and segments[-1][0] == partitioned:
+            segments[-1][1].append(transformation_definition)
+        else:
+            segments.append((partitioned, [transformation_definition]))
+    return [(partitioned and any(list(transformation_definition.keys())[0] not in CHEAP_TRANSFORMATIONS
+                                 for transformation_definition in definitions), definitions)
+            for partitioned, definitions in segments]
+
+
+def apply_pieces(partition, pieces, categorical=None):
+    # Stops at the first piece that leaves the partition empty and reports how
+    # many pieces were applied.
+    for position, piece in enumerate(pieces):
+        partition = apply_transformations(partition, piece, categorical=categorical)
+        if len(partition) == 0:
+            return partition, position + 1
+    return partition, len(pieces)
+
+
+def concat_partitions(results, pieces, categorical=None):
+    partitions = [partition for partition, _ in results if len(partition) > 0]
+    if not partitions:
+        # Every partition was filtered out, so finish one of them empty.
+        partition, applied = results[0]
+        return apply_transformations(partition, [definition for piece in pieces[applied:] for definition in piece], categorical=categorical)
+    columns = reduce(union_columns, [list(partition.columns) for partition in partitions])
+    return pd.concat([partition if list(partition.columns) == columns else partition.reindex(columns=columns)
+                      for partition in partitions])
+
+
+def apply_partitioned(executor, df, transformation_definitions, partitions, categorical=None):
+    pieces = split_after_filters(transformation_definitions)
+    bounds = np.linspace(0, len(df), partitions + 1).astype(int)
+    # The transformations run in the worker processes, so the profile only
+    # shows the partitioned segment as a whole.
+    names = ', '.join(list(transformation_definition.keys())[0] for transformation_definition in transformation_definitions)
+    with profile_span(names, 'partition', df, partitions=partitions) as span:
+        futures = [executor.submit(apply_pieces, df.iloc[start:end], pieces, categorical) for start, end in zip(bounds[:-1], bounds[1:])]
+        df = concat_partitions([future.result() for future in futures], pieces, categorical)
+        span.output(df)
+    return df
+
+
+def apply_transformations_parallel(df, transformation_definitions, workers, rejects=None, min_partition_rows=MIN_PARTITION_ROWS, categorical=None):
+    # Runs of row-local transformations are applied to row ranges of the frame
+    # on a process pool and concatenated back in order.
+    partitions = min(workers, len(df) // min_partition_rows)
+    segments = parallel_segments(transformation_definitions)
+    if partitions <= 1 or not any(partitioned for partitioned, _ in segments):
+        return apply_transformations(df, transformation_definitions, rejects, categorical)
+    # Reference tables are loaded before the workers are forked, so they
+    # share one copy instead of each reading the file.
+    preload_references(transformation_definitions)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for partitioned, definitions in segments:
+            if partitioned:
+                df = apply_partitioned(executor, df, definitions, partitions, categorical)
+            else:
+                df = apply_transformations(df, definitions, rejects, categorical)
+    return df
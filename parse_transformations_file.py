@@ -1,10 +1,21 @@
-
+import copy
+import os
 import yaml
 
 
+# Parsed files by path, with the size and modification time they were parsed
+# at, so a long-running process parses each file once until it changes.
+_parsed = {}
 
 
 def parse_transformations_file(transformations_file):
-    with open(transformations_file, 'r') as file:
-        transformations = yaml.safe_load(file)
-    return transformations
+    path = os.path.abspath(transformations_file)
+    stat = os.stat(path)
+    stat = (stat.st_size, stat.st_mtime_ns)
+    cached = _parsed.get(path)
+    if cached is None or cached[0] != stat:
+        with open(transformations_file, 'r') as file:
+            transformations = yaml.safe_load(file)
+        cached = _parsed[path] = (stat, transformations)
+    # Callers get their own copy, as some of them change the definitions.
+    return copy.deepcopy(cached[1])
@@ -1,30 +1,159 @@
+import contextlib
+import io
+import os
+import tempfile
+import time
 import pandas as pd
 import yaml
-from transform import apply_transformations
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from parallel import apply_transformations_parallel
 from parse_transformations_file import parse_transformations_file
+from stream import stream_process, stream_split, chunk_writer, DEFAULT_CHUNKSIZE
+from join import join_files, DEFAULT_PARTITIONS
+from incremental import definition_hash, unsupported_reason, stale_reason, read_checkpoint, write_checkpoint, \
+    remove_checkpoint, complete_size, input_checkpoint, process_increment, merge_increment
+from scheduler import run_steps, step_files, may_read
+from dataset_cache import DatasetCache
+from step_cache import StepCache
+from dataset_io import read_dataset, write_dataset, dataset_columns
+from plan import compile_plan, plan_definitions, explain_plan
+from profiling import profile_span, count_rows
+from shards import is_sharded, is_shard_pattern, shard_files, shard_path, make_parent_directory, reshard, print_shard_report
+from categorical import categorical_columns
+from compression import use_compression
 
 
-def merge(input_file1, input_file2, output_file, key_column):
+def merge(input_file1, input_file2, output_file, key_column, cache=None, file_format=None, how='inner',
+          chunksize=None, partitions=None, sorted_inputs=False, workers=1, spill_dir=None, incremental=False):
     try:
-        df1 = pd.read_csv(input_file1)
-        df2 = pd.read_csv(input_file2)
-        merged_df = pd.merge(df1, df2, on=key_column)
-        merged_df.to_csv(output_file, index=False)
+        checkpoint = None
+        if incremental:
+            # New rows of either input are joined against the other input, and
+            # the matches appended to the output. Only inner joins never change
+            # the rows already written.
+            definition = definition_hash(key_column, how)
+            reason = "only inner joins can be merged incrementally" if how != 'inner' or chunksize or sorted_inputs else None
+            reason = reason or unsupported_reason([input_file1, input_file2], output_file, cache=cache, file_format=file_format)
+            if reason is None:
+                reason = stale_reason([input_file1, input_file2], output_file, definition, read_checkpoint(output_file))
+            if reason is None:
+                rows = merge_increment(input_file1, input_file2, output_file, key_column, read_checkpoint(output_file))
+                if rows is not None:
+                    print(f"Merged CSV files '{input_file1}' and '{input_file2}' incrementally: {rows} new input rows.")
+                    return True
+                reason = "the new rows do not parse to the types of the earlier rows"
+            print(f"Merging '{input_file1}' and '{input_file2}' in full: {reason}.")
+            remove_checkpoint(output_file)
+            if how == 'inner' and not (chunksize or sorted_inputs) and \
+                    unsupported_reason([input_file1, input_file2], output_file, cache=cache, file_format=file_format) is None:
+                checkpoint = {input_file1: complete_size(input_file1), input_file2: complete_size(input_file2)}
+
+        if chunksize or sorted_inputs:
+            # Out of core: both inputs are streamed and joined partition by
+            # partition, or in one pass when they are already sorted on the key.
+            join_files(input_file1, input_file2, output_file, key_column, how, chunksize or DEFAULT_CHUNKSIZE,
+                       partitions or DEFAULT_PARTITIONS, sorted_inputs, workers, spill_dir, cache, file_format)
+        else:
+            df1 = read_dataset(input_file1, cache, file_format=file_format)
+            df2 = read_dataset(input_file2, cache, file_format=file_format)
+            merged_df = pd.merge(df1, df2, on=key_column, how=how)
+            write_dataset(merged_df, output_file, cache, file_format)
+            if checkpoint is not None:
+                write_checkpoint(output_file, definition, {
+                    path: input_checkpoint(path, len(df), df.dtypes.to_dict(), checkpoint[path])
+                    for path, df in ((input_file1, df1), (input_file2, df2))
+                })
         print(f"Merged CSV files '{input_file1}' and '{input_file2}' into '{output_file}' successfully.")
+        return True
     except (FileNotFoundError, KeyError) as e:
         print(f"Error occurred during merge: {str(e)}")
+        return False
 
-def split(input_file, output_definitions):
+def split(input_file, output_definitions, cache=None, file_format=None, chunksize=None, workers=None):
     try:
-        df = pd.read_csv(input_file)
+        if chunksize:
+            stream_split(input_file, output_definitions, chunksize, workers, cache, file_format)
+            for output_file in output_definitions:
+                print(f"Split CSV file '{input_file}' into '{output_file}' successfully.")
+            return True
+
+        # Only the columns some output needs are read. Unknown columns are left
+        # for the selection below to report.
+        input_columns = dataset_columns(input_file, cache, file_format)
+        if input_columns is None:
+            raise FileNotFoundError(f"No such file: '{input_file}'")
+        needed_columns = {column for columns in output_definitions.values() for column in columns}
+        df = read_dataset(input_file, cache, [column for column in input_columns if column in needed_columns], file_format)
         for output_file, columns in output_definitions.items():
             split_df = df[columns]
-            split_df.to_csv(output_file, index=False)
+            write_dataset(split_df, output_file, cache, file_format)
             print(f"Split CSV file '{input_file}' into '{output_file}' successfully.")
+        return True
     except (FileNotFoundError, KeyError) as e:
         print(f"Error occurred during split: {str(e)}")
+        return False
+
+def process_shard(input_file, output_file, transformation_definitions, chunksize=None, spill_dir=None, optimize=True, reject_file=None, file_format=None, categorical=None):
+    # Processes one input shard, holding back what the step prints so the
+    # shards running at the same time do not interleave.
+    output = io.StringIO()
+    start = time.perf_counter()
+    with count_rows() as rows, contextlib.redirect_stdout(output):
+        succeeded = process(input_file, output_file, None, transformation_definitions, chunksize, spill_dir, None, optimize,
+                            reject_file, file_format, categorical=categorical)
+    return {
+        'shard': input_file,
+        'succeeded': succeeded,
+        'seconds': time.perf_counter() - start,
+        'rows_in': rows['in'],
+        'rows_out': rows['out'],
+        'output': output.getvalue()
+    }
+
+
+def process_shards(input_file, output_file, transformation_definitions, chunksize=None, spill_dir=None, optimize=True, reject_file=None, file_format=None, workers=1, categorical=None, shard_rows=None, shard_size=None):
+    # Every input shard is processed on its own, up to `workers` at a time,
+    # into its own output shard. With shard_rows or shard_size (bytes) the
+    # processed shards are cut again into output shards of that many rows or
+    # that size.
+    shards = shard_files(input_file, file_format)
+    resharding = bool(shard_rows or shard_size)
+    for name, pattern in (('output_file', output_file), ('reject_file', reject_file)):
+        if pattern is not None and (len(shards) > 1 or resharding) and not is_shard_pattern(pattern):
+            print(f"Error occurred during process: '{name}' needs a shard pattern such as 'output-{{name}}.csv' for the {len(shards)} shards of '{input_file}'.")
+            return False
+    if resharding and '{name}' in output_file:
+        print(f"Error occurred during process: re-sharded outputs are numbered, so '{output_file}' can only use {{index}}.")
+        return False
+    with tempfile.TemporaryDirectory(prefix='etl-shards-', dir=spill_dir) as temporary_directory:
+        extension = os.path.splitext(output_file)[1]
+        outputs = [os.path.join(temporary_directory, f'{index}{extension}') if resharding else shard_path(output_file, index, shard)
+                   for index, shard in enumerate(shards)]
+        rejects = [shard_path(reject_file, index, shard) if reject_file is not None else None for index, shard in enumerate(shards)]
+        for path in outputs + rejects:
+            if path is not None:
+                make_parent_directory(path)
+        arguments = [shards, outputs, [transformation_definitions] * len(shards), [chunksize] * len(shards), [spill_dir] * len(shards),
+                     [optimize] * len(shards), rejects, [file_format] * len(shards), [categorical] * len(shards)]
+        if workers > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+                results = list(executor.map(process_shard, *arguments))
+        else:
+            results = list(map(process_shard, *arguments))
+        failed = [result for result in results if not result['succeeded']]
+        for result in failed:
+            print(result['output'], end='')
+        if failed:
+            return False
+        if resharding:
+            outputs = reshard(outputs, output_file, file_format, shard_rows, shard_size)
+    print(f"Process {len(shards)} shards of '{input_file}' into {len(outputs)} shards of '{output_file}' successfully:")
+    print_shard_report(results)
+    return True
 
-def process(input_file, output_file, transformation_file, transformation_definitions):
+
+def process(input_file, output_file, transformation_file, transformation_definitions, chunksize=None, spill_dir=None, cache=None, optimize=True, reject_file=None, file_format=None, workers=1, incremental=False, categorical=None, shard_rows=None, shard_size=None):
 
 
     try:
@@ -33,49 +162,216 @@ def process(input_file, output_file, transformation_file, transformation_definit
             transformation_definitions = parse_transformations_file(transformation_file)
             transformation_type = transformation_file
 
-        df = pd.read_csv(input_file)
-        df = apply_transformations(df, transformation_definitions)
+        if is_sharded(input_file):
+            # Shards run on the worker pool one whole shard each, so the
+            # transformations of a shard run in one process.
+            if incremental:
+                print(f"Processing the shards of '{input_file}' in full: incremental mode needs a single input file.")
+            return process_shards(input_file, output_file, transformation_definitions, chunksize, spill_dir, optimize, reject_file,
+                                  file_format, workers, categorical, shard_rows, shard_size)
+
+        columns = None
+        if optimize:
+            input_columns = dataset_columns(input_file, cache, file_format)
+            plan = compile_plan(transformation_definitions, input_columns, reject_rows=reject_file is not None)
+            transformation_definitions = plan_definitions(plan)
+            if plan['usecols'] != input_columns:
+                columns = plan['usecols']
+
+        checkpoint = None
+        if incremental:
+            # Only the rows appended to the input since the last run are
+            # processed and appended to the output, unless something forces a
+            # full run.
+            definition = definition_hash(transformation_definitions, columns, reject_file)
+            reason = unsupported_reason([input_file], output_file, transformation_definitions, cache, file_format,
+                                        [reject_file] if reject_file is not None else [])
+            if reason is None:
+                reason = stale_reason([input_file], output_file, definition, read_checkpoint(output_file))
+            if reason is None:
+                rows = process_increment(input_file, output_file, transformation_definitions, read_checkpoint(output_file),
+                                         columns, reject_file, workers)
+                if rows is not None:
+                    print(f"Process CSV file '{input_file}' incrementally: {rows} new rows appended to '{output_file}'.")
+                    return True
+                reason = "the new rows do not parse to the types of the earlier rows"
+            print(f"Processing '{input_file}' in full: {reason}.")
+            remove_checkpoint(output_file)
+            if unsupported_reason([input_file], output_file, transformation_definitions, cache, file_format) is None:
+                checkpoint = {'offset': complete_size(input_file), 'rows': None, 'dtypes': None}
+
+        rejects = None
+        if reject_file is not None:
+            if os.path.exists(reject_file):
+                os.remove(reject_file)
+            rejects = chunk_writer(reject_file, file_format)
+
+        if chunksize:
+            stream_process(input_file, output_file, transformation_definitions, chunksize, spill_dir, cache, columns, rejects, file_format, categorical)
+        else:
+            # Low cardinality text columns are read dictionary encoded, so
+            # value-wise transformations run once per distinct value. The
+            # checkpoint of an incremental run needs the types as parsed.
+            encoded_columns = []
+            if checkpoint is None and (cache is None or input_file not in cache):
+                encoded_columns = categorical_columns(input_file, columns, categorical, file_format)
+            df = read_dataset(input_file, cache, columns, file_format, encoded_columns)
+            if checkpoint is not None:
+                checkpoint.update(rows=len(df), dtypes=df.dtypes.to_dict())
+            df = apply_transformations_parallel(df, transformation_definitions, workers, rejects, categorical=categorical)
 
-        df.to_csv(output_file, index=False)
+            write_dataset(df, output_file, cache, file_format)
+        if rejects is not None:
+            rejects.close()
+        if checkpoint is not None:
+            write_checkpoint(output_file, definition, {
+                input_file: input_checkpoint(input_file, checkpoint['rows'], checkpoint['dtypes'], checkpoint['offset'])
+            }, reject_file)
         
        
         print(f"Process CSV file '{input_file}' using '{transformation_type}' into '{output_file}' successfully.")
+        if rejects is not None and rejects.rows:
+            print(f"Rejected {rejects.rows} rows failing checks into '{reject_file}'.")
+        return True
         
     except (FileNotFoundError, KeyError) as e:
         print(f"Error occurred during split: {str(e)}")
+        return False
 
 
  
 
-def run_pipeline(pipeline_definitions):
+def intermediate_files(pipeline_definitions):
+    # Outputs read again by a later step stay in the dataset cache instead of
+    # being written, unless the step asks for them to be materialized.
+    # Streamed and incremental outputs are always written to disk.
+    # Outputs a later step reads as part of a directory or glob of shards are
+    # written too, as shards are listed on disk.
+    produced = set()
+    intermediate = set()
+    written = set()
+    for pipeline_definition_item in pipeline_definitions:
+        pipeline_definition = list(pipeline_definition_item.values())[0]
+        input_files, output_files = step_files(pipeline_definition_item)
+        for path in input_files:
+            if path in produced:
+                intermediate.add(path)
+            written.update(output for output in produced if output != path and may_read(path, output))
+        if pipeline_definition.get('materialize') or pipeline_definition.get('chunksize') or pipeline_definition.get('sorted') \
+                or pipeline_definition.get('incremental'):
+            produced.difference_update(output_files)
+        else:
+            produced.update(path for path in output_files if not is_shard_pattern(path))
+    return intermediate - written
+
+
+def run_step(pipeline_definition_item, cache=None):
+    # Files of the step named without a codec extension are compressed with
+    # the step's codec, if it has one.
+    try:
+        use_compression(list(pipeline_definition_item.values())[0].get('compression'))
+    except ValueError as e:
+        print(f"Error occurred during {list(pipeline_definition_item.keys())[0]}: {str(e)}")
+        return False
     try:
+        return _run_step(pipeline_definition_item, cache)
+    finally:
+        use_compression(None)
+
+
+def _run_step(pipeline_definition_item, cache=None):
+    pipeline_definition_type = list(pipeline_definition_item.keys())[0]
+    pipeline_definition = list(pipeline_definition_item.values())[0]    
+    
+    if pipeline_definition_type == 'merge':
+        return merge(
+            pipeline_definition['input_file1'],
+            pipeline_definition['input_file2'],
+            pipeline_definition['output_file'],
+            pipeline_definition['key_column'],
+            cache,
+            pipeline_definition.get('format'),
+            pipeline_definition.get('how', 'inner'),
+            pipeline_definition.get('chunksize'),
+            pipeline_definition.get('partitions'),
+            pipeline_definition.get('sorted', False),
+            pipeline_definition.get('workers', 1),
+            pipeline_definition.get('spill_dir'),
+            pipeline_definition.get('incremental', False)
+        )
+    elif pipeline_definition_type == 'split':
+        return split(
+            pipeline_definition['input_file'],
+            pipeline_definition['output_definitions'],
+            cache,
+            pipeline_definition.get('format'),
+            pipeline_definition.get('chunksize'),
+            pipeline_definition.get('workers')
+        )
+    elif pipeline_definition_type == 'process':
+        return process(
+            pipeline_definition['input_file'],
+            pipeline_definition['output_file'],
+            pipeline_definition['transformation_file'],
+            pipeline_definition['transformations'],
+            pipeline_definition.get('chunksize'),
+            pipeline_definition.get('spill_dir'),
+            cache,
+            pipeline_definition.get('optimize', True),
+            pipeline_definition.get('reject_file'),
+            pipeline_definition.get('format'),
+            pipeline_definition.get('workers', 1),
+            pipeline_definition.get('incremental', False),
+            pipeline_definition.get('categorical'),
+            pipeline_definition.get('shard_rows'),
+            (pipeline_definition.get('shard_size') or 0) * 1024 * 1024 or None
+        )
 
-        for pipeline_definition_item in pipeline_definitions:
-            pipeline_definition_type = list(pipeline_definition_item.keys())[0]
-            pipeline_definition = list(pipeline_definition_item.values())[0]    
-            
-            if pipeline_definition_type == 'merge':
-                merge(
-                    pipeline_definition['input_file1'],
-                    pipeline_definition['input_file2'],
-                    pipeline_definition['output_file'],
-                    pipeline_definition['key_column']
-                )
-            elif pipeline_definition_type == 'split':
-                split(
-                    pipeline_definition['input_file'],
-                    pipeline_definition['output_definitions'] 
-                )
-            elif pipeline_definition_type == 'process':
-                process(
-                    pipeline_definition['input_file'],
-                    pipeline_definition['output_file'],
-                    pipeline_definition['transformation_file'],
-                    pipeline_definition['transformations']
-                )
+
+def explain_pipeline(pipeline_definitions):
+    for index, pipeline_definition_item in enumerate(pipeline_definitions):
+        pipeline_definition_type = list(pipeline_definition_item.keys())[0]
+        pipeline_definition = list(pipeline_definition_item.values())[0]
+        if pipeline_definition_type != 'process':
+            continue
+        transformation_definitions = pipeline_definition.get('transformations')
+        if pipeline_definition.get('transformation_file') is not None:
+            transformation_definitions = parse_transformations_file(pipeline_definition['transformation_file'])
+        input_file = pipeline_definition['input_file']
+        if is_sharded(input_file):
+            # Shards are planned from their first file.
+            input_file = shard_files(input_file, pipeline_definition.get('format'))[0]
+        plan = compile_plan(transformation_definitions or [], dataset_columns(input_file, file_format=pipeline_definition.get('format')),
+                            pipeline_definition.get('optimize', True), pipeline_definition.get('reject_file') is not None)
+        print(f"Plan for step {index + 1} (process) '{pipeline_definition['input_file']}' into '{pipeline_definition['output_file']}':")
+        print(explain_plan(plan, transformation_definitions))
+        print()
+
+
+def run_pipeline(pipeline_definitions, workers=1, cache_memory=None, manifest_file=None, force_from=None):
+    # The dataset cache lives in this process, so it is only used when the
+    # steps run here rather than on a worker pool.
+    cache = None
+    if cache_memory and workers <= 1:
+        cache = DatasetCache(cache_memory, intermediate_files(pipeline_definitions))
+    # With a manifest, steps whose inputs and definition did not change since
+    # their last successful run are skipped, except from step `force_from` on.
+    step_cache = None
+    if manifest_file is not None:
+        step_cache = StepCache(manifest_file, force_from, cache.intermediate_files if cache is not None else ())
+    try:
+        # Steps run as soon as the steps producing their inputs have finished,
+        # up to `workers` at a time.
+        with profile_span('pipeline', 'pipeline'):
+            results = run_steps(pipeline_definitions, partial(run_step, cache=cache), workers, step_cache)
         # Perform additional processing on input_file if required 
+        return all(results)
     except (FileNotFoundError, KeyError, yaml.YAMLError) as e:
         print(f"Error occurred during CSV processing: {str(e)}")
+        return False
+    finally:
+        if cache is not None:
+            cache.close()
 
  
  
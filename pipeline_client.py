@@ -0,0 +1,51 @@
+import argparse
+import http.client
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+
+
+DEFAULT_PORT = 8765
+
+
+def submit_job(url, command, argv, cwd=None):
+    # Only the standard library is imported, so the client starts in a few
+    # milliseconds.
+    # Returns the job's result, or raises ConnectionError when there is no
+    # service at url and ValueError when it turned the job down.
+    job = {'command': command, 'args': argv, 'cwd': cwd or os.getcwd()}
+    address = urlsplit(url)
+    connection = http.client.HTTPConnection(address.hostname, address.port or 80)
+    try:
+        connection.request('POST', f"{address.path.rstrip('/')}/jobs", json.dumps(job), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        result = json.load(response)
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise ValueError(result.get('error', response.reason))
+    return result
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run a pipeline_main.py or transform_main.py job on a running pipeline_service.py.')
+    parser.add_argument('--url', type=str, default=os.environ.get('PIPELINE_SERVICE_URL', f'http://127.0.0.1:{DEFAULT_PORT}'), help='Address of the service')
+    parser.add_argument('command', type=str, choices=['pipeline', 'transform'], help='Program to run: pipeline (pipeline_main.py) or transform (transform_main.py)')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments of the program, as on its command line')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    try:
+        result = submit_job(args.url, args.command, args.args)
+    except ConnectionError as e:
+        print(f"Error occurred submitting the job: no service at '{args.url}' ({str(e)})")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error occurred submitting the job: {str(e)}")
+        sys.exit(1)
+    print(result['output'], end='')
+    sys.exit(0 if result['succeeded'] else 1)
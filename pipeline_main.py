@@ -1,12 +1,27 @@
-from pipeline import run_pipeline
+from pipeline import run_pipeline, explain_pipeline
 from parse_transformations_file import parse_transformations_file
+from schema import use_schemas
+from profiling import start_profiling, stop_profiling, write_chrome_trace, write_prometheus_textfile, print_profile, serve_dashboard
 import argparse
+import sys
 import yaml 
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(description='Run pipeline based on pipeline definitions.')
     parser.add_argument('pipeline_definition_file', type=str, help='Pipeline file path') 
-    args = parser.parse_args()
+    parser.add_argument('--workers', type=int, default=1, help='Number of independent steps to run in parallel')
+    parser.add_argument('--explain', action='store_true', help='Print the optimized plan of each process step instead of running the pipeline')
+    parser.add_argument('--manifest', type=str, default=None, help='File recording completed steps, so unchanged steps are skipped on the next run. Without it every step runs')
+    parser.add_argument('--force', action='store_true', help='With --manifest, run every step even if it is unchanged')
+    parser.add_argument('--from-step', type=int, default=None, help='With --manifest, run this step (counting from 1) and every later step even if unchanged')
+    parser.add_argument('--cache-memory', type=int, default=None, help='Keep intermediate datasets in memory up to this many megabytes instead of writing them')
+    parser.add_argument('--schema', action='store_true', help='Read CSV files with the column types in their schema sidecars, inferring missing ones, and write sidecars next to CSV outputs')
+    parser.add_argument('--profile', action='store_true', help='Time every step and transformation and write a trace and metrics file')
+    parser.add_argument('--profile-trace', type=str, default='pipeline-profile.json', help='Chrome trace-event JSON file written by --profile')
+    parser.add_argument('--profile-metrics', type=str, default='pipeline-profile.prom', help='Prometheus textfile written by --profile')
+    parser.add_argument('--dashboard', action='store_true', help='With --profile, serve a timeline of the run on a local page')
+    parser.add_argument('--dashboard-port', type=int, default=8050, help='Port of the --dashboard page')
+    args = parser.parse_args(argv)
     return args
 
 def parse_pipeline_definitions_file(pipeline_definition_file):
@@ -14,6 +29,37 @@ def parse_pipeline_definitions_file(pipeline_definition_file):
         pipeline_definitions = yaml.safe_load(file)
     return pipeline_definitions
 
-args = parse_arguments() 
-pipeline_definitions = parse_transformations_file(args.pipeline_definition_file)
-run_pipeline(pipeline_definitions) 
+def main(args):
+    # Returns whether every step succeeded.
+    pipeline_definitions = parse_transformations_file(args.pipeline_definition_file)
+    if args.explain:
+        explain_pipeline(pipeline_definitions)
+        return True
+    cache_memory = args.cache_memory * 1024 * 1024 if args.cache_memory else None
+    force_from = 0 if args.force else (args.from_step - 1 if args.from_step else None)
+    workers = args.workers
+    if args.schema:
+        use_schemas()
+    if args.profile:
+        # Steps on a worker pool would be measured in other processes.
+        if workers > 1:
+            print("Profiling runs the steps one at a time.")
+            workers = 1
+        start_profiling()
+    try:
+        succeeded = run_pipeline(pipeline_definitions, workers, cache_memory, args.manifest, force_from)
+    finally:
+        # A pipeline that raised leaves no profiler running.
+        profiler = stop_profiling() if args.profile else None
+    if profiler is not None:
+        print_profile(profiler)
+        write_chrome_trace(profiler, args.profile_trace)
+        write_prometheus_textfile(profiler, args.profile_metrics)
+        print(f"Wrote the profile to '{args.profile_trace}' and '{args.profile_metrics}'.")
+        if args.dashboard:
+            serve_dashboard(profiler.events, args.dashboard_port)
+    return succeeded
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main(parse_arguments()) else 1)
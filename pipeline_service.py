@@ -0,0 +1,116 @@
+import argparse
+import contextlib
+import io
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from flask import Flask, jsonify, request
+import pipeline_main
+import transform_main
+from parse_transformations_file import parse_transformations_file
+from lookup import preload_references
+from schema import use_schemas
+from profiling import stop_profiling
+from pipeline_client import DEFAULT_PORT
+
+
+# The command line programs a job can run, by name.
+COMMANDS = {
+    'pipeline': pipeline_main,
+    'transform': transform_main
+}
+
+
+def run_job(command, argv, cwd):
+    # Runs one job in a pool worker with the arguments of the command line
+    # program, returning what it printed. Workers are reused from job to job,
+    # so the imports, parsed transformation files and lookup tables they
+    # loaded stay warm.
+    output = io.StringIO()
+    start = time.perf_counter()
+    succeeded = False
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            os.chdir(cwd)
+            # Settings from the last job's flags do not carry over.
+            use_schemas(False)
+            stop_profiling()
+            args = COMMANDS[command].parse_arguments(argv)
+            if getattr(args, 'dashboard', False):
+                print("The profile dashboard is not available from the service.")
+            else:
+                succeeded = COMMANDS[command].main(args) is not False
+        except SystemExit as e:
+            # argparse exits after printing its usage or help.
+            succeeded = e.code == 0
+        except Exception:
+            traceback.print_exc()
+    return {
+        'succeeded': succeeded,
+        'seconds': time.perf_counter() - start,
+        'output': output.getvalue()
+    }
+
+
+def preload(pipeline_files):
+    # Parses pipelines and their transformation files and loads their lookup
+    # tables before the workers are forked, so every worker shares them.
+    for pipeline_file in pipeline_files:
+        for pipeline_definition_item in parse_transformations_file(pipeline_file):
+            pipeline_definition = list(pipeline_definition_item.values())[0]
+            transformation_definitions = list(pipeline_definition.get('transformations') or [])
+            if pipeline_definition.get('transformation_file') is not None:
+                transformation_definitions += parse_transformations_file(pipeline_definition['transformation_file'])
+            preload_references(transformation_definitions)
+
+
+def create_app(workers=1):
+    # Every worker is forked before the app serves a request, so none is
+    # forked from a process running server threads.
+    executor = ProcessPoolExecutor(max_workers=workers)
+    for future in [executor.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    app = Flask(__name__)
+    state = {'jobs': 0, 'started': time.time()}
+    lock = threading.Lock()
+
+    @app.post('/jobs')
+    def submit_job():
+        job = request.get_json(silent=True) or {}
+        if job.get('command') not in COMMANDS or not isinstance(job.get('args', []), list):
+            return jsonify({'error': f"A job needs a command ({', '.join(COMMANDS)}) and a list of args."}), 400
+        result = executor.submit(run_job, job['command'], [str(arg) for arg in job.get('args', [])],
+                                 job.get('cwd') or os.getcwd()).result()
+        with lock:
+            state['jobs'] += 1
+        return jsonify(result)
+
+    @app.get('/status')
+    def status():
+        return jsonify({'workers': workers, 'jobs': state['jobs'], 'uptime_seconds': time.time() - state['started']})
+
+    app.executor = executor
+    return app
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Serve pipeline and transform jobs from a pool of warm worker processes.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes running jobs')
+    parser.add_argument('--preload', type=str, nargs='*', default=[], help='Pipeline files whose transformation files and lookup tables are loaded before the workers start')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    preload(args.preload)
+    app = create_app(args.workers)
+    print(f"Serving pipeline jobs on http://{args.host}:{args.port}/ with {args.workers} workers")
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        app.executor.shutdown()
@@ -0,0 +1,301 @@
+import re
+from validate import CHECK_TRANSFORMATIONS
+
+
+CONDITION_KEYWORDS = {'and', 'or', 'not', 'in', 'is', 'True', 'False', 'None'}
+
+# Transformations that compute their output row by row from the columns they
+# read, so they give the same result on a subset of the rows. split and
+# split_pair are excluded: the number of columns they create depends on
+# which rows are present.
+ROW_LOCAL_TRANSFORMATIONS = {'duplicate', 'replace', 'replace_text', 'replace_characters', 'mask', 'merge', 'convert_case', 'create', 'rename', 'drop', 'filter'}
+
+# Transformations whose only effect is the columns they write, so they can be
+# dropped when nothing reads those columns.
+REMOVABLE_TRANSFORMATIONS = {'duplicate', 'replace', 'replace_text', 'replace_characters', 'mask', 'map_value', 'lookup', 'merge', 'convert_case', 'split', 'split_pair', 'create'}
+
+
+def condition_columns(condition):
+    condition = re.sub(r"'[^']*'|\"[^\"]*\"", ' ', condition)
+    columns = set(re.findall(r'`([^`]*)`', condition))
+    condition = re.sub(r'`[^`]*`|@\w+', ' ', condition)
+    columns.update(name for name in re.findall(r'[A-Za-z_]\w*', condition) if name not in CONDITION_KEYWORDS)
+    return columns
+
+
+def _pattern(column):
+    return f'{column}_*'
+
+
+def column_matches(column, names):
+    if column in names:
+        return True
+    prefix, _, suffix = column.rpartition('_')
+    return suffix.isdigit() and _pattern(prefix) in names
+
+
+def _append(columns, new_columns):
+    return columns + [column for column in new_columns if column not in columns]
+
+
+def analyze_transformation(transformation_type, transformation, columns):
+    # Returns the columns a transformation reads, the columns it writes (or
+    # removes), and the schema after it runs.
+    if transformation_type in ('split', 'split_pair'):
+        column = transformation['column']
+        return {column}, {_pattern(column)}, _append(columns, [_pattern(column)])
+    if transformation_type in ('replace', 'replace_text', 'replace_characters', 'map_value'):
+        column = transformation['column']
+        return {column}, {column}, columns
+    if transformation_type == 'mask':
+        return set(transformation['columns']), set(transformation['columns']), columns
+    if transformation_type == 'lookup':
+        column = transformation['column']
+        output_column = transformation.get('output_column') or column
+        return {column}, {output_column}, _append(columns, [output_column])
+    if transformation_type == 'merge':
+        merge_columns = [col.strip() for col in transformation['columns'] if column_matches(col.strip(), columns)]
+        output_column = transformation.get('output_column') or '_'.join(merge_columns)
+        return set(merge_columns), {output_column}, _append(columns, [output_column])
+    if transformation_type == 'filter':
+        return set(transformation['columns']), set(columns) - set(transformation['columns']), list(transformation['columns'])
+    if transformation_type == 'drop':
+        dropped = set(transformation['columns'])
+        return set(), dropped, [column for column in columns if column not in dropped]
+    if transformation_type == 'filter_records':
+        return condition_columns(transformation['condition']), set(), columns
+    if transformation_type == 'rename':
+        mapping = transformation['mapping']
+        return set(mapping), set(mapping) | set(mapping.values()), [mapping.get(column, column) for column in columns]
+    if transformation_type == 'convert_case':
+        mapping = [column for column in transformation['mapping'] if column_matches(column, columns)]
+        return set(mapping), set(mapping), columns
+    if transformation_type == 'duplicate':
+        mapping = transformation['mapping']
+        return set(mapping), set(mapping.values()), _append(columns, list(mapping.values()))
+    if transformation_type == 'aggregate':
+        # Only the group_by columns and the aggregations are left.
+        reads = set(transformation['group_by']) | {list(aggregation.values())[0] for aggregation in transformation['aggregations'].values()}
+        outputs = list(transformation['group_by']) + list(transformation['aggregations'])
+        return reads, (set(columns) - set(transformation['group_by'])) | set(transformation['aggregations']), outputs
+    if transformation_type == 'sort':
+        return {column for column in transformation['mapping'] if column_matches(column, columns)}, set(), columns
+    if transformation_type == 'create':
+        column = transformation['column']
+        return ({column} if column_matches(column, columns) else set()), {column}, _append(columns, [column])
+    if transformation_type in ('check_data_type', 'check_not_blank'):
+        return set(transformation.get('mapping') or transformation.get('columns')), set(), columns
+    if transformation_type == 'checks':
+        reads = set()
+        for check in transformation:
+            reads.update(check.get('columns') or [])
+            reads.update(check.get('mapping') or [])
+            if check.get('column') is not None:
+                reads.add(check['column'])
+        return reads, set(), columns
+    return set(), set(), columns
+
+
+def _node(transformation_definition, index):
+    return {
+        'type': list(transformation_definition.keys())[0],
+        'transformation': list(transformation_definition.values())[0],
+        'index': index,
+        'notes': []
+    }
+
+
+def _annotate(nodes, input_columns):
+    columns = list(input_columns)
+    for node in nodes:
+        node['columns'] = columns
+        node['reads'], node['writes'], columns = analyze_transformation(node['type'], node['transformation'], columns)
+    return columns
+
+
+def _can_push_past(node, predicate_reads):
+    if node['type'] not in ROW_LOCAL_TRANSFORMATIONS and not _map_value_keeps_dtype(node):
+        return False
+    if node['type'] == 'filter':
+        return predicate_reads <= node['reads']
+    return not any(column_matches(column, node['writes']) for column in predicate_reads)
+
+
+def _map_value_keeps_dtype(node):
+    # map_value gives an object column whatever rows are present only when
+    # every value it can produce is a string.
+    if node['type'] != 'map_value' or node['transformation'].get('default_value') is None:
+        return False
+    values = list(node['transformation']['mapping'].values()) + [node['transformation']['default_value']]
+    return all(isinstance(value, str) for value in values)
+
+
+def push_down_filters(nodes):
+    nodes = list(nodes)
+    for node in [node for node in nodes if node['type'] == 'filter_records']:
+        position = nodes.index(node)
+        while position > 0 and _can_push_past(nodes[position - 1], node['reads']):
+            nodes[position - 1], nodes[position] = nodes[position], nodes[position - 1]
+            position -= 1
+        if position < node['index']:
+            node['notes'].append(f'pushed down from step {node["index"] + 1}')
+    return nodes
+
+
+def _is_live(node, live):
+    for column in node['writes']:
+        if column_matches(column, live):
+            return True
+        if column.endswith('_*') and any(name.startswith(column[:-1]) for name in live):
+            return True
+    return False
+
+
+def _is_removable(node, live):
+    if node['type'] not in REMOVABLE_TRANSFORMATIONS or not node['writes']:
+        return False
+    # Keep anything that would raise on its inputs, so errors still surface.
+    if node['type'] == 'create':
+        if node['reads']:
+            return False
+    elif not node['reads'] or not all(column_matches(column, node['columns']) for column in node['reads']):
+        return False
+    return not _is_live(node, live)
+
+
+def _exists(column, columns):
+    if column.endswith('_*'):
+        return any(column_matches(name, {column}) for name in columns)
+    return column_matches(column, columns)
+
+
+def _created(node):
+    return {column for column in node['writes'] if not _exists(column, node['columns'])}
+
+
+def _prune_entries(node, live, mentioned):
+    # Drop the mapping entries of duplicate, rename and convert_case whose
+    # result nobody reads. A rename entry is only dropped when neither name
+    # is mentioned again, so the column is simply left out by a later filter.
+    mapping = node['transformation'].get('mapping') if node['type'] in ('duplicate', 'rename', 'convert_case') else None
+    if not isinstance(mapping, dict):
+        return node
+    kept_mapping = {}
+    for column, value in mapping.items():
+        exists = column_matches(column, node['columns'])
+        if node['type'] == 'duplicate' and exists and not column_matches(value, live):
+            continue
+        if node['type'] == 'convert_case' and exists and not column_matches(column, live):
+            continue
+        if node['type'] == 'rename' and exists and not (column_matches(column, live) or column_matches(value, live)
+                                                       or column in mentioned or value in mentioned):
+            continue
+        kept_mapping[column] = value
+    if len(kept_mapping) == len(mapping):
+        return node
+    if not kept_mapping:
+        return None
+    node['transformation'] = dict(node['transformation'], mapping=kept_mapping)
+    node['reads'], node['writes'], _ = analyze_transformation(node['type'], node['transformation'], node['columns'])
+    node['notes'].append(f"keeps only the {', '.join(kept_mapping)} entries, the others are never used")
+    return node
+
+
+def prune_columns(nodes, input_columns, output_columns, reject_rows=False):
+    # Walk the plan backwards keeping track of the columns something later
+    # still needs. Transformations that only write unneeded columns are
+    # removed, and input columns nobody needs are not read at all.
+    live = set(output_columns)
+    mentioned = set()
+    kept = []
+    for node in reversed(nodes):
+        created = _created(node)
+        if not _is_removable(node, live):
+            node = _prune_entries(node, live, mentioned)
+        else:
+            node = None
+        if node is None:
+            continue
+        node['lost'] = created - _created(node)
+        if node['type'] == 'rename':
+            live = (live - set(node['transformation']['mapping'].values())) | node['reads']
+        elif reject_rows and node['type'] in CHECK_TRANSFORMATIONS:
+            # Rejected rows are written with every column they have at this point.
+            live = live | set(node['columns'])
+        elif node['type'] in ('drop', 'filter', 'aggregate'):
+            live = {column for column in live if not column_matches(column, node['writes'])} | node['reads']
+        elif node['type'] in ('duplicate', 'merge', 'create', 'split', 'split_pair'):
+            # Columns that already existed keep their position when they are
+            # overwritten, so they are still read even though their values are not.
+            live = {column for column in live if not column_matches(column, _created(node))} | node['reads']
+        else:
+            live = live | node['reads']
+        mentioned |= node['reads'] if node['type'] == 'filter' else node['reads'] | node['writes']
+        kept.append(node)
+    kept.reverse()
+    usecols = [column for column in input_columns if column in live]
+
+    # Columns that are no longer read or created do not exist when a later
+    # drop runs, so take them out of its list.
+    missing = set(input_columns) - set(usecols)
+    for node in nodes:
+        if node not in kept:
+            missing.update(_created(node))
+            continue
+        missing.update(node['lost'])
+        if node['type'] == 'drop':
+            dropped = [column for column in node['transformation']['columns'] if not column_matches(column, missing)]
+            if len(dropped) != len(node['transformation']['columns']):
+                node['transformation'] = dict(node['transformation'], columns=dropped)
+                node['notes'].append('no longer drops columns that are not read')
+        elif node['type'] != 'filter':
+            missing.difference_update(_created(node))
+    return kept, usecols
+
+
+def compile_plan(transformation_definitions, input_columns, optimize=True, reject_rows=False):
+    # Without the input header only the filter pushdown can be applied.
+    nodes = [_node(transformation_definition, index) for index, transformation_definition in enumerate(transformation_definitions)]
+    output_columns = _annotate(nodes, input_columns or [])
+    usecols = input_columns
+    if optimize:
+        nodes = push_down_filters(nodes)
+        if input_columns is not None:
+            _annotate(nodes, input_columns)
+            nodes, usecols = prune_columns(nodes, input_columns, output_columns, reject_rows)
+        _annotate(nodes, usecols or [])
+    return {
+        'input_columns': input_columns,
+        'usecols': usecols,
+        'nodes': nodes,
+        'removed': [index for index in range(len(transformation_definitions)) if index not in {node['index'] for node in nodes}]
+    }
+
+
+def plan_definitions(plan):
+    return [{node['type']: node['transformation']} for node in plan['nodes']]
+
+
+def explain_plan(plan, transformation_definitions=None):
+    lines = []
+    if plan['usecols'] is None:
+        lines.append("read all columns (input not available, columns are not pruned)")
+    else:
+        pruned = [column for column in plan['input_columns'] if column not in plan['usecols']]
+        lines.append(f"read columns [{', '.join(plan['usecols'])}]")
+        if pruned:
+            lines.append(f"  pruned columns [{', '.join(pruned)}]")
+    for position, node in enumerate(plan['nodes']):
+        reads = ', '.join(sorted(node['reads']))
+        writes = ', '.join(sorted(node['writes'])) if node['type'] not in ('drop', 'filter') else ''
+        line = f"{position + 1}. {node['type']} (step {node['index'] + 1}) reads [{reads}]"
+        if writes:
+            line += f" writes [{writes}]"
+        lines.append(line)
+        for note in node['notes']:
+            lines.append(f"     {note}")
+    if transformation_definitions is not None:
+        for index in plan['removed']:
+            transformation_type = list(transformation_definitions[index].keys())[0]
+            lines.append(f"removed {transformation_type} (step {index + 1}), its output is never used")
+    return '\n'.join(lines)
@@ -0,0 +1,357 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# The profiler collecting spans in this process, or None when not profiling.
+_profiler = None
+
+# Row counts of datasets read and written, kept while count_rows is active.
+_row_counters = []
+
+PROMETHEUS_PREFIX = 'etl'
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes, or None where the
+    # platform does not report it.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def frame_shape(df):
+    return (len(df), len(df.columns)) if df is not None else (None, None)
+
+
+def frame_memory(df):
+    return int(df.memory_usage(index=True, deep=True).sum()) if df is not None else None
+
+
+class Span:
+    # One timed region: a pipeline run, a step or a transformation. Rows and
+    # columns come from the frames going in and out, or for steps from the
+    # datasets the step read and wrote. Steps also count the bytes of the files
+    # they read and wrote, as stored on disk.
+
+    def __init__(self, profiler, name, category, df=None, args=None):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.df_in = df
+        self.df_out = None
+        self.args = dict(args or {})
+        self.rows = {'in': 0, 'out': 0}
+        self.columns = {'in': 0, 'out': 0}
+        self.bytes = {'in': 0, 'out': 0}
+
+    def __enter__(self):
+        # Memory is measured outside the timed region, so deep memory usage of
+        # large string columns does not count against the span. Transformations
+        # often change the frame in place, so its shape is taken now.
+        self.shape_in = frame_shape(self.df_in)
+        self.memory_in = frame_memory(self.df_in)
+        # Holding on to the input would keep it alive after a transformation
+        # replaced it.
+        self.df_in = None
+        self.step = self.profiler.step
+        if self.category == 'step':
+            self.profiler.step = self
+        self.cpu_start = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def output(self, df):
+        self.df_out = df
+
+    def add_rows(self, direction, df):
+        self.rows[direction] += len(df)
+        self.columns[direction] = max(self.columns[direction], len(df.columns))
+
+    def add_bytes(self, direction, size):
+        self.bytes[direction] += size
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        cpu_end = time.process_time()
+        if self.category == 'step':
+            self.profiler.step = self.step
+            rows_in, rows_out = self.rows['in'], self.rows['out']
+            columns_in, columns_out = self.columns['in'], self.columns['out']
+            bytes_in, bytes_out = self.bytes['in'], self.bytes['out']
+            memory_delta = None
+        else:
+            rows_in, columns_in = self.shape_in
+            rows_out, columns_out = frame_shape(self.df_out)
+            memory_out = frame_memory(self.df_out)
+            memory_delta = memory_out - self.memory_in if memory_out is not None and self.memory_in is not None else None
+            bytes_in, bytes_out = None, None
+        if self.step is not None and self.category != 'step':
+            self.args['step'] = self.step.name
+        self.args.update({
+            'wall_seconds': end - self.start,
+            'cpu_seconds': cpu_end - self.cpu_start,
+            'rows_in': rows_in,
+            'rows_out': rows_out,
+            'columns_in': columns_in,
+            'columns_out': columns_out,
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'memory_delta_bytes': memory_delta,
+            'peak_rss_bytes': peak_rss(),
+            'status': 'ok' if exc_type is None else 'error'
+        })
+        self.profiler.add_event(self, end)
+        return False
+
+
+class _NoSpan:
+    # Stands in for a span when profiling is off, so instrumented code costs
+    # one lookup.
+
+    def __enter__(self):
+        return self
+
+    def output(self, df):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Profiler:
+    # Collects spans as Chrome trace events. Steps run one at a time while
+    # profiling, so rows read and written by any thread count towards the
+    # current step.
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.step = None
+        self.lock = threading.Lock()
+
+    def add_event(self, span, end):
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': (span.start - self.origin) * 1e6,
+            'dur': (end - span.start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': span.args
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def record_rows(self, direction, df):
+        with self.lock:
+            if self.step is not None:
+                self.step.add_rows(direction, df)
+
+    def record_bytes(self, direction, size):
+        with self.lock:
+            if self.step is not None:
+                self.step.add_bytes(direction, size)
+
+
+def start_profiling():
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def stop_profiling():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def is_profiling():
+    return _profiler is not None
+
+
+def profile_span(name, category, df=None, **args):
+    if _profiler is None:
+        return NO_SPAN
+    return Span(_profiler, name, category, df, args)
+
+
+def record_rows(direction, df):
+    # Counts a dataset read ('in') or written ('out') by the current step.
+    if _profiler is not None:
+        _profiler.record_rows(direction, df)
+    for counter in _row_counters:
+        counter[direction] += len(df)
+
+
+def record_bytes(direction, path):
+    # Counts the size on disk of a file read ('in') or written ('out') by the
+    # current step.
+    if _profiler is not None and os.path.exists(path):
+        _profiler.record_bytes(direction, os.path.getsize(path))
+
+
+@contextlib.contextmanager
+def count_rows():
+    # Counts the rows read and written inside the block without profiling it.
+    counter = {'in': 0, 'out': 0}
+    _row_counters.append(counter)
+    try:
+        yield counter
+    finally:
+        _row_counters.remove(counter)
+
+
+def write_chrome_trace(profiler, path):
+    # Loads in chrome://tracing and https://ui.perfetto.dev.
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': profiler.events, 'displayTimeUnit': 'ms'}, file, indent=1)
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items())
+
+
+def prometheus_metrics(events):
+    # Steps get one sample each. Transformations are summed per step and type,
+    # as a streamed step runs every transformation once per chunk.
+    metrics = {}
+
+    def add(name, help_text, metric_type, labels, value):
+        if value is None:
+            return
+        metric = metrics.setdefault(name, {'help': help_text, 'type': metric_type, 'samples': {}})
+        key = _labels(labels)
+        metric['samples'][key] = metric['samples'].get(key, 0) + value
+
+    for event in events:
+        args = event['args']
+        if event['cat'] == 'pipeline':
+            add('pipeline_seconds', 'Wall time of the pipeline run.', 'gauge', {}, args['wall_seconds'])
+            add('pipeline_cpu_seconds', 'CPU time of the pipeline run.', 'gauge', {}, args['cpu_seconds'])
+            add('peak_rss_bytes', 'Peak resident set size of the pipeline process.', 'gauge', {}, args['peak_rss_bytes'])
+        elif event['cat'] == 'step':
+            labels = {'step': event['name']}
+            add('step_seconds', 'Wall time of a pipeline step.', 'gauge', labels, args['wall_seconds'])
+            add('step_cpu_seconds', 'CPU time of a pipeline step.', 'gauge', labels, args['cpu_seconds'])
+            add('step_rows_in', 'Rows read by a pipeline step.', 'gauge', labels, args['rows_in'])
+            add('step_rows_out', 'Rows written by a pipeline step.', 'gauge', labels, args['rows_out'])
+            add('step_columns_in', 'Columns of the widest dataset read by a pipeline step.', 'gauge', labels, args['columns_in'])
+            add('step_columns_out', 'Columns of the widest dataset written by a pipeline step.', 'gauge', labels, args['columns_out'])
+            add('step_bytes_in', 'Bytes of the files read by a pipeline step, as stored.', 'gauge', labels, args.get('bytes_in'))
+            add('step_bytes_out', 'Bytes of the files written by a pipeline step, as stored.', 'gauge', labels, args.get('bytes_out'))
+            add('step_peak_rss_bytes', 'Peak resident set size when a pipeline step finished.', 'gauge', labels, args['peak_rss_bytes'])
+            add('step_failed', 'Whether a pipeline step raised an error.', 'gauge', labels, int(args['status'] != 'ok'))
+        elif event['cat'] == 'transform':
+            labels = {'step': args.get('step', ''), 'transformation': event['name']}
+            add('transform_seconds_total', 'Wall time spent in a transformation.', 'counter', labels, args['wall_seconds'])
+            add('transform_cpu_seconds_total', 'CPU time spent in a transformation.', 'counter', labels, args['cpu_seconds'])
+            add('transform_calls_total', 'Times a transformation ran, once per chunk when streaming.', 'counter', labels, 1)
+            add('transform_rows_in_total', 'Rows going into a transformation.', 'counter', labels, args['rows_in'])
+            add('transform_rows_out_total', 'Rows coming out of a transformation.', 'counter', labels, args['rows_out'])
+            add('transform_memory_delta_bytes', 'Change in DataFrame memory made by a transformation.', 'gauge', labels, args['memory_delta_bytes'])
+    lines = []
+    for name, metric in metrics.items():
+        full_name = f'{PROMETHEUS_PREFIX}_{name}'
+        lines.append(f"# HELP {full_name} {metric['help']}")
+        lines.append(f"# TYPE {full_name} {metric['type']}")
+        for labels, value in metric['samples'].items():
+            lines.append(f'{full_name}{{{labels}}} {value}' if labels else f'{full_name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus_textfile(profiler, path):
+    # Written under a temporary name and renamed, so the node exporter's
+    # textfile collector never reads half a file.
+    temporary_file = f'{path}.tmp'
+    with open(temporary_file, 'w') as file:
+        file.write(prometheus_metrics(profiler.events))
+    os.replace(temporary_file, path)
+
+
+def print_profile(profiler):
+    for event in profiler.events:
+        if event['cat'] != 'step':
+            continue
+        args = event['args']
+        print(f"{event['name']:<24} {args['wall_seconds']:9.3f}s wall {args['cpu_seconds']:9.3f}s cpu "
+              f"{args['rows_in']:>10} rows in {args['rows_out']:>10} rows out "
+              f"{(args.get('bytes_in') or 0) / 1e6:>10.1f} MB in {(args.get('bytes_out') or 0) / 1e6:>10.1f} MB out")
+
+
+def load_trace(path):
+    with open(path) as file:
+        return json.load(file)['traceEvents']
+
+
+def timeline_figure(events):
+    # One bar per span on a lane per category, so transformations sit under
+    # the step that ran them, as in a flame chart.
+    import plotly.graph_objects as go
+    lanes = ['pipeline', 'step', 'transform', 'partition']
+    figure = go.Figure()
+    for category in lanes:
+        category_events = [event for event in events if event['cat'] == category]
+        if not category_events:
+            continue
+        figure.add_trace(go.Bar(
+            name=category,
+            orientation='h',
+            y=[category] * len(category_events),
+            base=[event['ts'] / 1000 for event in category_events],
+            x=[event['dur'] / 1000 for event in category_events],
+            text=[event['name'] for event in category_events],
+            hovertext=[f"{event['name']}<br>" + '<br>'.join(f'{key}: {value}' for key, value in event['args'].items())
+                       for event in category_events],
+            hoverinfo='text'
+        ))
+    figure.update_layout(barmode='overlay', xaxis_title='milliseconds', yaxis={'categoryorder': 'array', 'categoryarray': lanes[::-1]})
+    return figure
+
+
+def serve_dashboard(events, port=8050):
+    # dash and plotly are only needed for the local page.
+    try:
+        from dash import Dash, dcc, html
+        figure = timeline_figure(events)
+    except ImportError:
+        print("The profile dashboard needs dash and plotly.")
+        return
+    app = Dash(__name__)
+    app.layout = html.Div([
+        html.H3('Pipeline profile'),
+        dcc.Graph(figure=figure, style={'height': '80vh'})
+    ])
+    print(f"Serving the profile on http://127.0.0.1:{port}/")
+    app.run(port=port, debug=False)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Show a pipeline profile trace as a timeline in the browser.')
+    parser.add_argument('trace_file', type=str, help='Chrome trace JSON written by pipeline_main.py --profile')
+    parser.add_argument('--port', type=int, default=8050, help='Port of the local page')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    serve_dashboard(load_trace(args.trace_file), args.port)
@@ -0,0 +1,140 @@
+import fnmatch
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from profiling import profile_span
+from parse_transformations_file import parse_transformations_file
+from lookup import reference_files
+
+
+def step_files(pipeline_definition_item):
+    pipeline_definition = list(pipeline_definition_item.values())[0]
+    input_files = []
+    output_files = []
+    for key, value in pipeline_definition.items():
+        if value is None:
+            continue
+        if key.startswith('input_file') or key == 'transformation_file':
+            input_files.append(value)
+        elif key in ('output_file', 'reject_file'):
+            output_files.append(value)
+        elif key == 'output_definitions':
+            output_files.extend(value)
+        # Reference tables of lookups are read like input files.
+        if key == 'transformations':
+            input_files.extend(reference_files(value))
+        elif key == 'transformation_file' and os.path.isfile(value):
+            input_files.extend(reference_files(parse_transformations_file(value)))
+    return ([os.path.abspath(path) for path in input_files],
+            [os.path.abspath(path) for path in output_files])
+
+
+def output_glob(path):
+    # The files a shard pattern such as 'out/{name}.csv' can write, as a glob.
+    return re.sub(r'\{[^}]*\}', '*', path)
+
+
+def may_read(input_path, output_path):
+    # Whether a step reading input_path (a file, a directory of shards or a
+    # glob) can read a file written to output_path (a file or a shard
+    # pattern). Globs that might overlap count as overlapping, as a missing
+    # dependency lets a step read a file while it is being written.
+    written = output_glob(output_path)
+    return (fnmatch.fnmatchcase(input_path, written) or fnmatch.fnmatchcase(written, input_path)
+            or fnmatch.fnmatchcase(os.path.dirname(written), input_path))
+
+
+def build_step_graph(pipeline_definitions):
+    # A step depends on the last step that wrote one of its inputs, and must
+    # also wait for earlier readers and writers of any file it overwrites.
+    # Directories, globs and shard patterns depend on every step writing
+    # files they can match.
+    dependencies = []
+    last_writer = {}
+    readers = {}
+    for index, pipeline_definition_item in enumerate(pipeline_definitions):
+        input_files, output_files = step_files(pipeline_definition_item)
+        step_dependencies = set()
+        for path in input_files:
+            step_dependencies.update(writer for written, writer in last_writer.items() if may_read(path, written))
+        for path in output_files:
+            step_dependencies.update(writer for written, writer in last_writer.items() if may_read(output_glob(path), written))
+            for read, step_readers in readers.items():
+                if may_read(read, path):
+                    step_dependencies.update(step_readers)
+        for path in input_files:
+            readers.setdefault(path, set()).add(index)
+        for path in output_files:
+            last_writer[path] = index
+            readers[path] = set()
+        step_dependencies.discard(index)
+        dependencies.append(step_dependencies)
+    return dependencies
+
+
+def _step_name(index, pipeline_definition_item):
+    return f"step {index + 1} ({list(pipeline_definition_item.keys())[0]})"
+
+
+def run_steps(pipeline_definitions, run_step, workers=1, step_cache=None):
+    dependencies = build_step_graph(pipeline_definitions)
+    results = [None] * len(pipeline_definitions)
+    errors = []
+
+    def ready_steps(pending):
+        ready = []
+        for index in sorted(pending):
+            if any(results[dependency] is False for dependency in dependencies[index]):
+                print(f"Skipping {_step_name(index, pipeline_definitions[index])} because an upstream step failed.")
+                results[index] = False
+                pending.discard(index)
+            elif all(results[dependency] is True for dependency in dependencies[index]):
+                if step_cache is not None and step_cache.is_fresh(index, pipeline_definitions[index]):
+                    print(f"Skipping {_step_name(index, pipeline_definitions[index])} because its inputs and definition are unchanged.")
+                    results[index] = True
+                    pending.discard(index)
+                else:
+                    ready.append(index)
+        return ready
+
+    def record(index, run):
+        try:
+            results[index] = run() is not False
+        except Exception as e:
+            print(f"Error occurred during {_step_name(index, pipeline_definitions[index])}: {str(e)}")
+            results[index] = False
+            errors.append(e)
+        if step_cache is not None:
+            if results[index]:
+                step_cache.record(index, pipeline_definitions[index])
+            else:
+                step_cache.forget(pipeline_definitions[index])
+
+    def run_here(index):
+        with profile_span(_step_name(index, pipeline_definitions[index]), 'step'):
+            return run_step(pipeline_definitions[index])
+
+    pending = set(range(len(pipeline_definitions)))
+    if workers <= 1:
+        while pending:
+            index = ready_steps(pending)[:1]
+            if not index:
+                continue
+            pending.discard(index[0])
+            record(index[0], lambda: run_here(index[0]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while pending or running:
+                for index in ready_steps(pending):
+                    pending.discard(index)
+                    running[executor.submit(run_step, pipeline_definitions[index])] = index
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(running.pop(future), future.result)
+
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from compression import open_input
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+
+SCHEMA_SUFFIX = '.schema.json'
+
+# Whether CSV files are read with their schema sidecars and written with new
+# ones. Off by default, as typed columns change how some values are written
+# (an integer column with blanks keeps its integers rather than turning into
+# floats).
+_enabled = False
+
+# Text columns with at most this share of distinct values, and no more than
+# MAX_DOMAIN_VALUES of them, are recorded with their domain and read
+# dictionary encoded.
+MAX_DOMAIN_RATIO = 0.05
+MAX_DOMAIN_VALUES = 1000
+MIN_DOMAIN_ROWS = 10000
+
+# The strings read_csv treats as missing by default.
+NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+               '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# The column types a sidecar records, with the dtype each gets when the file
+# is read in chunks with read_csv: the one a full read without a sidecar
+# would have given it. Integer and boolean columns with blanks are recorded
+# as nullable types, and text with a small domain as a category.
+CHUNK_DTYPES = {
+    'int64': 'int64',
+    'Int64': 'float64',
+    'float64': 'float64',
+    'bool': 'bool',
+    'boolean': 'object',
+    'string': 'object',
+    'category': 'object'
+}
+
+
+def use_schemas(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def schemas_enabled():
+    return _enabled
+
+
+def schema_file(path):
+    return f'{path}{SCHEMA_SUFFIX}'
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_schema(path):
+    # The sidecar of a CSV file, or None when there is none or the file
+    # changed since it was written.
+    if not os.path.exists(schema_file(path)) or not os.path.exists(path):
+        return None
+    with open(schema_file(path)) as file:
+        schema = json.load(file)
+    if [schema.get('size'), schema.get('mtime_ns')] != list(_stat(path)):
+        return None
+    return schema
+
+
+def write_schema(path, columns, rows):
+    size, mtime_ns = _stat(path)
+    schema = {'size': size, 'mtime_ns': mtime_ns, 'rows': rows, 'columns': columns}
+    temporary_file = f'{schema_file(path)}.tmp'
+    with open(temporary_file, 'w') as file:
+        json.dump(schema, file, indent=2)
+    os.replace(temporary_file, schema_file(path))
+    return schema
+
+
+def remove_schema(path):
+    if os.path.exists(schema_file(path)):
+        os.remove(schema_file(path))
+
+
+def _text_column(name, values, rows):
+    # values are the distinct non-missing strings, or None when the caller
+    # already knows there are too many.
+    if values is not None and rows >= MIN_DOMAIN_ROWS and len(values) <= min(MAX_DOMAIN_RATIO * rows, MAX_DOMAIN_VALUES):
+        return {'name': name, 'type': 'category', 'categories': sorted(values)}
+    return {'name': name, 'type': 'string'}
+
+
+def _frame_domain(series):
+    # The distinct strings of a text column, unless its first rows already
+    # hold too many of them.
+    if len(series) < MIN_DOMAIN_ROWS or series.iloc[:MIN_DOMAIN_ROWS].nunique() > MAX_DOMAIN_RATIO * MIN_DOMAIN_ROWS:
+        return None
+    return list(series.dropna().unique())
+
+
+def _arrow_column(name, column, rows):
+    nullable = column.null_count > 0
+    if pa.types.is_integer(column.type):
+        return {'name': name, 'type': 'Int64' if nullable else 'int64'}
+    if pa.types.is_floating(column.type) or pa.types.is_null(column.type):
+        # read_csv parses a column with nothing in it as floats.
+        return {'name': name, 'type': 'float64'}
+    if pa.types.is_boolean(column.type):
+        return {'name': name, 'type': 'boolean' if nullable else 'bool'}
+    # Dates and times stay text, as read_csv leaves them.
+    values = None
+    if pa.types.is_string(column.type) or pa.types.is_dictionary(column.type):
+        if rows >= MIN_DOMAIN_ROWS:
+            unique = column.unique()
+            if pa.types.is_dictionary(unique.type):
+                unique = unique.dictionary_decode()
+            values = [value for value in unique.to_pylist() if value is not None]
+    return _text_column(name, values, rows)
+
+
+def frame_columns(df):
+    # Sidecar columns describing a frame as to_csv writes it.
+    rows = len(df)
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        dtype = series.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            if categories.dtype == object and all(isinstance(value, str) for value in categories):
+                values = list(series.cat.remove_unused_categories().cat.categories)
+                columns.append(_text_column(name, values, rows))
+                continue
+            series = series.astype(object)
+            dtype = series.dtype
+        if isinstance(dtype, pd.StringDtype):
+            columns.append(_text_column(name, _frame_domain(series), rows))
+        elif str(dtype) in ('Int64', 'boolean') or dtype in (np.int64, np.float64, np.bool_):
+            columns.append({'name': name, 'type': str(dtype)})
+        elif pd.api.types.is_integer_dtype(dtype):
+            columns.append({'name': name, 'type': 'int64'})
+        elif pd.api.types.is_float_dtype(dtype):
+            columns.append({'name': name, 'type': 'float64'})
+        else:
+            # Object columns are described by what they hold, as read_csv
+            # would see it once written.
+            kind = pd.api.types.infer_dtype(series, skipna=True)
+            nullable = bool(series.isna().any())
+            if kind == 'integer':
+                columns.append({'name': name, 'type': 'Int64' if nullable else 'int64'})
+            elif kind in ('floating', 'mixed-integer-float', 'empty'):
+                columns.append({'name': name, 'type': 'float64'})
+            elif kind == 'boolean':
+                columns.append({'name': name, 'type': 'boolean' if nullable else 'bool'})
+            elif kind == 'string':
+                columns.append(_text_column(name, _frame_domain(series), rows))
+            else:
+                return None
+    return columns
+
+
+def write_frame_schema(path, df):
+    # Called after a frame was written to path with to_csv. Frames holding
+    # values the sidecar cannot describe get none.
+    columns = frame_columns(df)
+    if columns is None:
+        remove_schema(path)
+        return None
+    return write_schema(path, columns, len(df))
+
+
+def arrow_type(column):
+    if column['type'] in ('int64', 'Int64'):
+        return pa.int64()
+    if column['type'] == 'float64':
+        return pa.float64()
+    if column['type'] in ('bool', 'boolean'):
+        return pa.bool_()
+    if column['type'] == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+
+def _convert_options(column_types=None, include_columns=None):
+    return pa_csv.ConvertOptions(column_types=column_types, include_columns=include_columns,
+                                 null_values=NULL_VALUES, strings_can_be_null=True)
+
+
+def table_frame(table, schema, categorical=()):
+    # Text becomes Arrow-backed string columns, or categoricals for columns
+    # with a domain and those named in `categorical`. Integer and boolean
+    # columns with blanks keep their type as nullable columns.
+    types = {column['name']: column['type'] for column in schema['columns']}
+    for index, name in enumerate(table.column_names):
+        if pa.types.is_string(table.column(name).type) and (types.get(name) == 'category' or name in categorical):
+            table = table.set_column(index, name, table.column(name).dictionary_encode())
+    df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+    for name in table.column_names:
+        if types.get(name) == 'Int64':
+            df[name] = table.column(name).to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+        elif types.get(name) == 'boolean':
+            df[name] = table.column(name).to_pandas(types_mapper={pa.bool_(): pd.BooleanDtype()}.get)
+    return df
+
+
+def infer_schema(path):
+    # One multi-threaded pass over the file with type inference, returning
+    # the sidecar written and the table read.
+    with open_input(path) as source:
+        table = pa_csv.read_csv(source, convert_options=_convert_options())
+    columns = [_arrow_column(name, table.column(name), table.num_rows) for name in table.column_names]
+    return write_schema(path, columns, table.num_rows), table
+
+
+def read_typed_csv(path, columns=None, categorical=()):
+    # Reads a CSV file with the types recorded in its sidecar, inferring and
+    # writing the sidecar first if it has none. Returns None when pyarrow is
+    # missing or the file does not parse to the recorded types, so the caller
+    # falls back to read_csv.
+    if pa_csv is None:
+        return None
+    try:
+        schema = read_schema(path)
+        table = None
+        if schema is None:
+            schema, table = infer_schema(path)
+            # Inferred types that the sidecar records differently, such as
+            # dates kept as text, need the file read again.
+            if any(arrow_type(column) != table.column(column['name']).type for column in schema['columns']
+                   if column['type'] != 'category'):
+                table = None
+            elif columns is not None:
+                table = table.select([name for name in table.column_names if name in columns])
+        if table is None:
+            names = [column['name'] for column in schema['columns']]
+            with open_input(path) as source:
+                table = pa_csv.read_csv(source, convert_options=_convert_options(
+                    {column['name']: arrow_type(column) for column in schema['columns']},
+                    None if columns is None else [name for name in names if name in columns]))
+    except (pa.ArrowInvalid, KeyError) as e:
+        print(f"Reading '{path}' without its schema: {str(e)}")
+        remove_schema(path)
+        return None
+    return table_frame(table, schema, set(categorical or ()))
+
+
+def chunk_dtypes(path, columns=None):
+    # read_csv dtypes that give every chunk of the file the types of the
+    # whole file, or None without a sidecar.
+    schema = read_schema(path)
+    if schema is None:
+        return None
+    return {column['name']: CHUNK_DTYPES[column['type']] for column in schema['columns']
+            if columns is None or column['name'] in columns}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Infer the column types of CSV files and write them to sidecar files.')
+    parser.add_argument('input_files', type=str, nargs='+', help='CSV files to infer')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    for input_file in args.input_files:
+        schema, _ = infer_schema(input_file)
+        print(f"Wrote '{schema_file(input_file)}' ({schema['rows']} rows):")
+        for column in schema['columns']:
+            domain = f" ({len(column['categories'])} values)" if column['type'] == 'category' else ''
+            print(f"  {column['name']}: {column['type']}{domain}")
@@ -0,0 +1,146 @@
+import glob
+import os
+import numpy as np
+from dataset_io import FORMATS, dataset_format
+from stream import DEFAULT_CHUNKSIZE, chunk_writer, read_csv_text, read_dataset_chunks
+from compression import strip_compression
+
+
+# Rows written to a new output shard cut by size before its bytes per row are
+# known.
+SIZE_PROBE_ROWS = 1000
+
+
+def is_sharded(path):
+    # A directory or a glob pattern names a set of input shards.
+    return os.path.isdir(path) or any(character in path for character in '*?[')
+
+
+def is_shard_pattern(path):
+    return '{' in path
+
+
+def shard_files(path, file_format=None):
+    # Shards in name order. A directory holds every file in a known format,
+    # or every file when the step names a format.
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in os.listdir(path)
+                 if not name.startswith('.') and (file_format is not None or os.path.splitext(strip_compression(name))[1].lower() in FORMATS)]
+    else:
+        files = glob.glob(path)
+    files = sorted(file for file in files if os.path.isfile(file))
+    if not files:
+        raise FileNotFoundError(f"No input shards match '{path}'")
+    return files
+
+
+def shard_name(path):
+    return os.path.splitext(os.path.basename(strip_compression(path)))[0]
+
+
+def shard_path(pattern, index, input_file=None):
+    # Fills in {index} (the shard number, which takes a format such as
+    # {index:04d}) and {name} (the input shard's file name without extension).
+    fields = {'index': index}
+    if input_file is not None:
+        fields['name'] = shard_name(input_file)
+    try:
+        return pattern.format(**fields)
+    except KeyError as e:
+        raise ValueError(f"Invalid shard pattern '{pattern}': {{{e.args[0]}}} is not available here") from None
+
+
+def make_parent_directory(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+def read_shard_chunks(path, chunksize, file_format=None):
+    # CSV shards are read back as text, so rows are written out again exactly
+    # as they were.
+    if dataset_format(path, file_format) == 'csv':
+        yield from read_csv_text(path, chunksize)
+        return
+    yield from read_dataset_chunks(path, chunksize, file_format=file_format)
+
+
+class ShardWriter:
+    # Cuts the rows written to it into output shards of at most `rows` rows,
+    # or of about `size` bytes, numbered from 0.
+
+    def __init__(self, pattern, file_format=None, rows=None, size=None):
+        self.pattern = pattern
+        self.file_format = file_format
+        self.rows = rows
+        self.size = size
+        self.paths = []
+        self.writer = None
+        self.shard_rows = 0
+        self.empty = None
+
+    def _full(self):
+        if self.rows and self.shard_rows >= self.rows:
+            return True
+        return bool(self.size) and self.writer.size() >= self.size
+
+    def _rows_that_fit(self):
+        # Estimated from the bytes per row written to the shard so far.
+        if self.shard_rows == 0:
+            return SIZE_PROBE_ROWS
+        size = self.writer.size()
+        return max(1, int((self.size - size) / (size / self.shard_rows)))
+
+    def write(self, chunk):
+        if self.empty is None:
+            self.empty = chunk.iloc[:0]
+        while len(chunk) > 0:
+            if self.writer is None:
+                self.paths.append(shard_path(self.pattern, len(self.paths)))
+                make_parent_directory(self.paths[-1])
+                self.writer = chunk_writer(self.paths[-1], self.file_format)
+                self.shard_rows = 0
+            room = self.rows - self.shard_rows if self.rows else len(chunk)
+            if self.size:
+                room = min(room, self._rows_that_fit())
+            self.writer.write(chunk.iloc[:room])
+            self.shard_rows += len(chunk.iloc[:room])
+            chunk = chunk.iloc[room:]
+            if self._full():
+                self.writer.close()
+                self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        elif not self.paths and self.empty is not None:
+            # Every row was filtered out, so one empty shard keeps the header.
+            self.paths.append(shard_path(self.pattern, 0))
+            make_parent_directory(self.paths[-1])
+            writer = chunk_writer(self.paths[-1], self.file_format)
+            writer.write(self.empty)
+            writer.close()
+
+
+def reshard(paths, pattern, file_format=None, rows=None, size=None):
+    # Streams the processed shards, in order, into new shards of the given
+    # number of rows or size.
+    writer = ShardWriter(pattern, file_format, rows, size)
+    for path in paths:
+        for chunk in read_shard_chunks(path, DEFAULT_CHUNKSIZE, file_format):
+            writer.write(chunk)
+    writer.close()
+    return writer.paths
+
+
+def print_shard_report(results):
+    # One line per shard, and how far the slowest shard is from the median, so
+    # stragglers stand out.
+    for result in results:
+        print(f"  {result['shard']:<40} {result['seconds']:9.3f}s {result['rows_in']:>10} rows in {result['rows_out']:>10} rows out")
+    if len(results) > 1:
+        seconds = [result['seconds'] for result in results]
+        slowest = results[int(np.argmax(seconds))]
+        median = float(np.median(seconds))
+        ratio = f", {slowest['seconds'] / median:.1f}x the median of {median:.3f}s" if median > 0 else ''
+        print(f"Slowest shard '{slowest['shard']}' took {slowest['seconds']:.3f}s{ratio}.")
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+from scheduler import step_files
+
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class StepCache:
+    # Remembers a fingerprint of every step that succeeded: its definition and
+    # the content hashes of the files it reads. A step whose fingerprint is
+    # unchanged and whose outputs are still as it left them is skipped.
+    # Content hashes are reused while a file keeps its size and mtime.
+
+    def __init__(self, manifest_file, force_from=None, in_memory_files=()):
+        self.manifest_file = manifest_file
+        self.force_from = force_from
+        self.in_memory_files = set(in_memory_files)
+        self.fingerprints = {}
+        self.manifest = {'files': {}, 'steps': {}}
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as file:
+                self.manifest = json.load(file)
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        known = self.manifest['files'].get(path)
+        if known is not None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        self.manifest['files'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def fingerprint(self, pipeline_definition_item):
+        input_files, _ = step_files(pipeline_definition_item)
+        # Files handed over in memory may have a stale copy on disk.
+        if any(path in self.in_memory_files or not os.path.isfile(path) for path in input_files):
+            return None
+        digest = hashlib.sha256(json.dumps(pipeline_definition_item, sort_keys=True, default=str).encode())
+        for path in sorted(input_files):
+            digest.update(f'{path}={self.file_hash(path)}'.encode())
+        return digest.hexdigest()
+
+    def _outputs_unchanged(self, outputs):
+        for path, recorded in outputs.items():
+            if not os.path.isfile(path):
+                return False
+            stat = os.stat(path)
+            if [stat.st_size, stat.st_mtime_ns] != recorded:
+                return False
+        return True
+
+    def is_fresh(self, index, pipeline_definition_item):
+        _, output_files = step_files(pipeline_definition_item)
+        fingerprint = self.fingerprint(pipeline_definition_item)
+        self.fingerprints[index] = fingerprint
+        if fingerprint is None or (self.force_from is not None and index >= self.force_from):
+            return False
+        step = self.manifest['steps'].get('|'.join(sorted(output_files)))
+        return step is not None and step['fingerprint'] == fingerprint and self._outputs_unchanged(step['outputs'])
+
+    def record(self, index, pipeline_definition_item):
+        _, output_files = step_files(pipeline_definition_item)
+        key = '|'.join(sorted(output_files))
+        fingerprint = self.fingerprints.pop(index, None)
+        # Outputs kept only in the dataset cache were never written, so the
+        # step cannot be skipped next time.
+        if fingerprint is None or any(path in self.in_memory_files or not os.path.isfile(path) for path in output_files):
+            self.manifest['steps'].pop(key, None)
+        else:
+            self.manifest['steps'][key] = {
+                'fingerprint': fingerprint,
+                'outputs': {path: [os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in output_files}
+            }
+        self.save()
+
+    def forget(self, pipeline_definition_item):
+        _, output_files = step_files(pipeline_definition_item)
+        self.manifest['steps'].pop('|'.join(sorted(output_files)), None)
+
+    def save(self):
+        temporary_file = f'{self.manifest_file}.tmp'
+        with open(temporary_file, 'w') as file:
+            json.dump(self.manifest, file, indent=2, sort_keys=True)
+        os.replace(temporary_file, self.manifest_file)
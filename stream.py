@@ -0,0 +1,500 @@
+import os
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from transform import apply_transformations, sort_transform
+from dataset_io import iter_dataset_chunks, dataset_columns, dataset_format, open_arrow, pa, pq, require_pyarrow, select_columns, \
+    parquet_compression, ipc_options
+from validate import CHECK_TRANSFORMATIONS
+from aggregate import aggregate_chunks
+from profiling import record_rows, record_bytes
+from compression import open_input, open_output, strip_compression
+from schema import schemas_enabled, chunk_dtypes
+
+
+DEFAULT_CHUNKSIZE = 100000
+MERGE_FAN_IN = 16
+
+# Transformations that need every row before they can emit one. Everything
+# else in transform.py works row by row and can be applied to each chunk.
+BARRIER_TRANSFORMATIONS = {'sort', 'aggregate'}
+
+# Transformations that can leave a chunk empty. Checks drop rows when failing
+# rows go to a reject file.
+ROW_DROPPING_TRANSFORMATIONS = {'filter_records'} | CHECK_TRANSFORMATIONS
+
+
+def is_barrier(transformation_definition):
+    return list(transformation_definition.keys())[0] in BARRIER_TRANSFORMATIONS
+
+
+def split_segments(transformation_definitions):
+    segments = []
+    row_local_definitions = []
+    for transformation_definition in transformation_definitions:
+        if is_barrier(transformation_definition):
+            segments.append((row_local_definitions, transformation_definition))
+            row_local_definitions = []
+        else:
+            row_local_definitions.append(transformation_definition)
+    segments.append((row_local_definitions, None))
+    return segments
+
+
+def union_columns(columns, other_columns):
+    # New columns are placed right after the column that precedes them in
+    # other_columns, which is where a full-frame run would have put them.
+    columns = list(columns)
+    previous_column = None
+    for column in other_columns:
+        if column not in columns:
+            position = columns.index(previous_column) + 1 if previous_column is not None else 0
+            columns.insert(position, column)
+        previous_column = column
+    return columns
+
+
+def _whole_file_dtypes(input_file, columns, chunksize):
+    # read_csv dtypes that give every chunk the types a full read gives the
+    # whole file, from one pass over its chunks. Integers with blanks in
+    # another chunk become floats, booleans with blanks nullable booleans, and a
+    # column with text in any chunk keeps every value as it was written.
+    chunk_types = {}
+    with open_input(input_file) as source, pd.read_csv(source, usecols=columns, chunksize=chunksize) as reader:
+        for chunk in reader:
+            for col in chunk.columns:
+                chunk_types.setdefault(col, set()).add(chunk[col].dtype.name)
+    dtypes = {}
+    for col, types in chunk_types.items():
+        if len(types) == 1 and 'object' not in types:
+            dtypes[col] = types.pop()
+        elif types <= {'int64', 'float64'}:
+            dtypes[col] = 'float64'
+        elif types == {'bool', 'float64'}:
+            dtypes[col] = 'boolean'
+        else:
+            dtypes[col] = str
+    return dtypes
+
+
+def read_csv_chunks(input_file, chunksize=DEFAULT_CHUNKSIZE, columns=None, dtypes=None):
+    # Every chunk is parsed to the dtypes of the whole file: those of its
+    # schema sidecar, or else those found by one pass over its chunks, as a
+    # chunk only sees its own values (an integer column whose blanks are all
+    # in another chunk would be parsed as int64 rather than float64).
+    boolean_columns = []
+    if dtypes is None:
+        dtypes = _whole_file_dtypes(input_file, columns, chunksize)
+        boolean_columns = [col for col, dtype in dtypes.items() if dtype == 'boolean']
+    with open_input(input_file) as source, pd.read_csv(source, chunksize=chunksize, usecols=columns, dtype=dtypes) as reader:
+        for chunk in reader:
+            # A full read gives booleans with blanks as objects.
+            for col in boolean_columns:
+                chunk[col] = chunk[col].astype(object).where(chunk[col].notna(), np.nan)
+            yield chunk
+
+
+def read_csv_text(input_file, chunksize=DEFAULT_CHUNKSIZE, columns=None):
+    # CSV values as text, so they are written out again exactly as they were
+    # read.
+    with open_input(input_file) as source, \
+            pd.read_csv(source, chunksize=chunksize, usecols=columns, dtype=str, keep_default_na=False) as reader:
+        yield from reader
+
+
+def _counted(chunks, input_file):
+    for chunk in chunks:
+        record_rows('in', chunk)
+        yield chunk
+    record_bytes('in', input_file)
+
+
+def read_dataset_chunks(input_file, chunksize=DEFAULT_CHUNKSIZE, columns=None, file_format=None):
+    file_format = dataset_format(input_file, file_format)
+    if file_format == 'csv':
+        dtypes = chunk_dtypes(input_file, columns) if schemas_enabled() else None
+        yield from _counted(read_csv_chunks(input_file, chunksize, columns, dtypes), input_file)
+        return
+    require_pyarrow(file_format)
+    if file_format == 'parquet':
+        parquet_file = pq.ParquetFile(input_file)
+        batches = parquet_file.iter_batches(chunksize, columns=select_columns(parquet_file.schema_arrow.names, columns))
+    else:
+        table = open_arrow(input_file).read_all()
+        if columns is not None:
+            table = table.select(select_columns(table.schema.names, columns))
+        batches = table.to_batches(chunksize)
+    emitted = False
+    for batch in batches:
+        emitted = True
+        chunk = batch.to_pandas()
+        record_rows('in', chunk)
+        yield chunk
+    record_bytes('in', input_file)
+    if not emitted:
+        yield (parquet_file.schema_arrow if file_format == 'parquet' else table.schema).empty_table().to_pandas()
+
+
+def _apply_row_local(chunks, transformation_definitions, rejects=None, categorical=None):
+    # Chunks emptied by an upstream filter are dropped, so later transforms
+    # never see an empty frame unless the whole input filtered down to one.
+    empty_chunk = None
+    emitted = False
+    for chunk in chunks:
+        if len(chunk) == 0:
+            if empty_chunk is None:
+                empty_chunk = chunk
+            continue
+        emitted = True
+        yield apply_transformations(chunk, transformation_definitions, rejects, categorical)
+    if not emitted and empty_chunk is not None:
+        yield apply_transformations(empty_chunk, transformation_definitions, rejects, categorical)
+
+
+def split_after_filters(transformation_definitions):
+    # Consecutive checks stay in one piece so they are still validated together.
+    pieces = [[]]
+    for transformation_definition in transformation_definitions:
+        transformation_type = list(transformation_definition.keys())[0]
+        if not pieces[-1] and len(pieces) > 1 and transformation_type in CHECK_TRANSFORMATIONS \
+                and list(pieces[-2][-1].keys())[0] in CHECK_TRANSFORMATIONS:
+            pieces.pop()
+        pieces[-1].append(transformation_definition)
+        if transformation_type in ROW_DROPPING_TRANSFORMATIONS:
+            pieces.append([])
+    return pieces
+
+
+def _write_run(blocks, path, block_rows):
+    with open(path, 'wb') as file:
+        for block in blocks:
+            for start in range(0, max(len(block), 1), block_rows):
+                pickle.dump(block.iloc[start:start + block_rows], file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_run(path):
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                block = pickle.load(file)
+            except EOFError:
+                return
+            if len(block) > 0:
+                yield block
+
+
+def _merge_runs(run_paths, mapping, block_rows, chunksize):
+    readers = [read_run(path) for path in run_paths]
+    pending = [None] * len(readers)
+    exhausted = [False] * len(readers)
+    columns = None
+    output = []
+    output_rows = 0
+
+    while True:
+        for run, reader in enumerate(readers):
+            while not exhausted[run] and (pending[run] is None or len(pending[run]) < block_rows):
+                block = next(reader, None)
+                if block is None:
+                    exhausted[run] = True
+                else:
+                    pending[run] = block if pending[run] is None else pd.concat([pending[run], block])
+
+        active = [run for run in range(len(readers)) if pending[run] is not None]
+        if not active:
+            break
+        if columns is None:
+            columns = [col for col in mapping if col in pending[active[0]].columns]
+            ascending = [mapping[col] for col in columns]
+
+        # Blocks are concatenated in run order, so a stable sort keeps rows
+        # that tie in the order of their runs and of their positions in them.
+        lengths = [len(pending[run]) for run in active]
+        merged = pd.concat([pending[run] for run in active], ignore_index=True)
+        order = merged.sort_values(columns, ascending=ascending, kind='stable').index.to_numpy()
+        sorted_positions = np.empty(len(order), dtype=np.intp)
+        sorted_positions[order] = np.arange(len(order))
+        run_ids = np.repeat(active, lengths)
+
+        # Every run is sorted, so nothing still on disk can sort before the
+        # earliest last loaded row of a run that has more data to read.
+        ends = np.cumsum(lengths) - 1
+        last_rows = [sorted_positions[end] for run, end in zip(active, ends) if not exhausted[run]]
+        boundary = min(last_rows) + 1 if last_rows else len(merged)
+
+        pending = [None] * len(readers)
+        rest = order[boundary:]
+        rest_runs = run_ids[rest]
+        for run in np.unique(rest_runs):
+            pending[run] = merged.take(rest[rest_runs == run])
+
+        output.append(merged.take(order[:boundary]))
+        output_rows += boundary
+        if output_rows >= chunksize:
+            yield pd.concat(output, ignore_index=True)
+            output = []
+            output_rows = 0
+
+    if output:
+        yield pd.concat(output, ignore_index=True)
+
+
+def top_sort(chunks, mapping, limit):
+    # Keeps the first `limit` rows of the chunks seen so far, so memory is
+    # bounded by the limit and one chunk and nothing is spilled. The rows kept
+    # come before the next chunk, so rows that tie keep their input order.
+    top = None
+    for chunk in chunks:
+        top = chunk if top is None else pd.concat([top, chunk], ignore_index=True)
+        top = sort_transform(top, mapping, limit)
+    if top is not None:
+        yield top.reset_index(drop=True)
+
+
+def external_sort(chunks, mapping, spill_dir, chunksize=DEFAULT_CHUNKSIZE):
+    block_rows = max(chunksize // MERGE_FAN_IN, 1)
+    run_paths = []
+    empty_chunk = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            empty_chunk = chunk
+            continue
+        path = os.path.join(spill_dir, f'run_{len(run_paths)}.pkl')
+        _write_run([sort_transform(chunk, mapping)], path, block_rows)
+        run_paths.append(path)
+
+    if not run_paths:
+        if empty_chunk is not None:
+            yield empty_chunk
+        return
+
+    run_count = len(run_paths)
+    while len(run_paths) > MERGE_FAN_IN:
+        merged_paths = []
+        for start in range(0, len(run_paths), MERGE_FAN_IN):
+            group = run_paths[start:start + MERGE_FAN_IN]
+            path = os.path.join(spill_dir, f'run_{run_count}.pkl')
+            run_count += 1
+            _write_run(_merge_runs(group, mapping, block_rows, block_rows), path, block_rows)
+            for group_path in group:
+                os.remove(group_path)
+            merged_paths.append(path)
+        run_paths = merged_paths
+
+    yield from _merge_runs(run_paths, mapping, block_rows, chunksize)
+
+
+def _apply_barrier(chunks, transformation_definition, spill_dir, chunksize):
+    transformation_type = list(transformation_definition.keys())[0]
+    transformation = list(transformation_definition.values())[0]
+    if transformation_type == 'sort':
+        if transformation.get('limit') is not None:
+            return top_sort(chunks, transformation['mapping'], transformation['limit'])
+        return external_sort(chunks, transformation['mapping'], spill_dir, chunksize)
+    if transformation_type == 'aggregate':
+        return aggregate_chunks(chunks, transformation['group_by'], transformation['aggregations'])
+    raise ValueError(f"Transformation '{transformation_type}' cannot be streamed")
+
+
+def transform_chunks(chunks, transformation_definitions, spill_dir, chunksize=DEFAULT_CHUNKSIZE, rejects=None, categorical=None):
+    for row_local_definitions, barrier_definition in split_segments(transformation_definitions):
+        for piece in split_after_filters(row_local_definitions):
+            chunks = _apply_row_local(chunks, piece, rejects, categorical)
+        if barrier_definition is not None:
+            chunks = _apply_barrier(chunks, barrier_definition, spill_dir, chunksize)
+    return chunks
+
+
+class CsvChunkWriter:
+    # Keeps the output open from the first chunk on, so a compressed output
+    # is one stream. A writer whose columns are set up front appends to the
+    # file below its header.
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.columns = None
+        self.file = None
+        self.rows = 0
+
+    def write(self, chunk):
+        self.rows += len(chunk)
+        record_rows('out', chunk)
+        if self.columns is None:
+            self.file = open_output(self.output_file)
+            chunk.to_csv(self.file, index=False)
+            self.columns = list(chunk.columns)
+            return
+        if self.file is None:
+            self.file = open_output(self.output_file, append=True)
+        if list(chunk.columns) != self.columns:
+            columns = union_columns(self.columns, chunk.columns)
+            if columns != self.columns:
+                self._widen(columns)
+            chunk = chunk.reindex(columns=self.columns)
+        chunk.to_csv(self.file, header=False, index=False)
+
+    def _widen(self, columns):
+        # A later chunk produced columns the header does not have yet (e.g. a
+        # split with more parts), so rewrite what is on disk with the wider header.
+        self.file.close()
+        # The codec extension stays last, so the rewrite is compressed alike.
+        root = strip_compression(self.output_file)
+        temporary_file = f'{root}.widen{self.output_file[len(root):]}'
+        with open_output(temporary_file) as file:
+            header = True
+            for chunk in read_csv_text(self.output_file):
+                chunk.reindex(columns=columns).to_csv(file, header=header, index=False)
+                header = False
+            if header:
+                pd.DataFrame(columns=columns).to_csv(file, index=False)
+        os.replace(temporary_file, self.output_file)
+        self.file = open_output(self.output_file, append=True)
+        self.columns = columns
+
+    def size(self):
+        # Bytes on disk, once everything written so far has reached the file.
+        if self.file is not None:
+            self.file.flush()
+        return os.path.getsize(self.output_file)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            record_bytes('out', self.output_file)
+
+
+def _common_type(type1, type2):
+    if type1 == type2 or pa.types.is_null(type2):
+        return type1
+    if pa.types.is_null(type1):
+        return type2
+    if (pa.types.is_integer(type1) or pa.types.is_floating(type1)) and (pa.types.is_integer(type2) or pa.types.is_floating(type2)):
+        return pa.float64()
+    return pa.string()
+
+
+class ColumnarChunkWriter:
+    # Writes chunks to a Parquet or Arrow IPC file. Both need one schema for the
+    # whole file, so when a chunk brings new columns or wider types (e.g. a
+    # column that was empty so far) the part written so far is rewritten.
+
+    def __init__(self, output_file, file_format):
+        require_pyarrow(file_format)
+        self.output_file = output_file
+        self.file_format = file_format
+        self.columns = None
+        self.schema = None
+        self.writer = None
+        self.temporary_file = f'{output_file}.part'
+        self.rows = 0
+
+    def _open(self, path, schema):
+        self.temporary_file = path
+        self.schema = schema
+        if self.file_format == 'parquet':
+            self.writer = pq.ParquetWriter(path, schema, compression=parquet_compression())
+        else:
+            self.writer = pa.ipc.new_file(path, schema, options=ipc_options())
+
+    def _conform(self, table):
+        arrays = [table[field.name].cast(field.type) if field.name in table.column_names else pa.nulls(len(table), field.type)
+                  for field in self.schema]
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def write(self, chunk):
+        self.rows += len(chunk)
+        record_rows('out', chunk)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.writer is None:
+            self.columns = list(chunk.columns)
+            self._open(self.temporary_file, table.schema)
+        else:
+            columns = union_columns(self.columns, chunk.columns)
+            types = {field.name: field.type for field in self.schema}
+            for field in table.schema:
+                types[field.name] = _common_type(types[field.name], field.type) if field.name in types else field.type
+            schema = pa.schema([pa.field(column, types[column]) for column in columns])
+            if columns != self.columns or not schema.equals(self.schema):
+                self._widen(columns, schema)
+        self.writer.write_table(self._conform(table))
+
+    def _widen(self, columns, schema):
+        self.writer.close()
+        previous_file = self.temporary_file
+        if self.file_format == 'parquet':
+            batches = pq.ParquetFile(previous_file).iter_batches(DEFAULT_CHUNKSIZE)
+        else:
+            batches = open_arrow(previous_file).read_all().to_batches(DEFAULT_CHUNKSIZE)
+        self._open(f'{self.output_file}.widen' if previous_file.endswith('.part') else f'{self.output_file}.part', schema)
+        self.columns = columns
+        for batch in batches:
+            self.writer.write_table(self._conform(pa.Table.from_batches([batch])))
+        os.remove(previous_file)
+
+    def size(self):
+        return os.path.getsize(self.temporary_file)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.temporary_file, self.output_file)
+            record_bytes('out', self.output_file)
+
+
+def chunk_writer(output_file, file_format=None):
+    file_format = dataset_format(output_file, file_format)
+    if file_format == 'csv':
+        return CsvChunkWriter(output_file)
+    return ColumnarChunkWriter(output_file, file_format)
+
+
+def stream_process(input_file, output_file, transformation_definitions, chunksize=DEFAULT_CHUNKSIZE, spill_dir=None, cache=None, columns=None, rejects=None, file_format=None, categorical=None):
+    with tempfile.TemporaryDirectory(prefix='etl-spill-', dir=spill_dir) as spill_path:
+        writer = chunk_writer(output_file, file_format)
+        if cache is not None and input_file in cache:
+            chunks = iter_dataset_chunks(cache.get(input_file), chunksize, columns)
+        else:
+            chunks = read_dataset_chunks(input_file, chunksize, columns, file_format)
+        for chunk in transform_chunks(chunks, transformation_definitions, spill_path, chunksize, rejects, categorical):
+            writer.write(chunk)
+        writer.close()
+
+
+def stream_split(input_file, output_definitions, chunksize=DEFAULT_CHUNKSIZE, workers=None, cache=None, file_format=None):
+    # One pass over the input: each chunk is handed to every output writer on
+    # a thread pool, while the next chunk is being read. Only the columns some
+    # output needs are read.
+    input_columns = dataset_columns(input_file, cache, file_format)
+    if input_columns is None:
+        raise FileNotFoundError(f"No such file: '{input_file}'")
+    needed_columns = {column for columns in output_definitions.values() for column in columns}
+    missing_columns = [column for column in needed_columns if column not in input_columns]
+    if missing_columns:
+        raise KeyError(f"{sorted(missing_columns)} not in index")
+    columns = [column for column in input_columns if column in needed_columns]
+
+    if cache is not None and input_file in cache:
+        chunks = iter_dataset_chunks(cache.get(input_file), chunksize, columns)
+    else:
+        # Every chunk is parsed to the types of the whole file, so the outputs
+        # are written as a split without chunksize writes them (e.g. 01234 as
+        # 1234, and 30 as 30.0 in a column with blanks).
+        chunks = read_dataset_chunks(input_file, chunksize, columns, file_format)
+
+    writers = {output_file: chunk_writer(output_file, file_format) for output_file in output_definitions}
+    with ThreadPoolExecutor(max_workers=workers or len(writers)) as executor:
+        pending = []
+        for chunk in chunks:
+            for future in pending:
+                future.result()
+            pending = [executor.submit(writers[output_file].write, chunk[output_columns])
+                       for output_file, output_columns in output_definitions.items()]
+        for future in pending:
+            future.result()
+    for output_file, writer in writers.items():
+        if writer.columns is None:
+            writer.write(pd.DataFrame(columns=output_definitions[output_file]))
+        writer.close()
@@ -0,0 +1,27 @@
+import os
+import unittest
+import pandas as pd
+from benchmark import generate_project_data, compare_results, PROJECT_DIRECTORY
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_generated_data_matches_project_schema(self):
+        df = generate_project_data(1000, seed=1)
+        project_df = pd.read_csv(os.path.join(PROJECT_DIRECTORY, 'input.csv'))
+        self.assertEqual(list(df.columns), list(project_df.columns))
+        self.assertEqual(df.dtypes.to_dict(), project_df.dtypes.to_dict())
+        self.assertTrue(df['SSN'].is_unique)
+        self.assertTrue(df['Age'].between(18, 39).all())
+        pd.testing.assert_frame_equal(df, generate_project_data(1000, seed=1))
+        self.assertFalse(df.equals(generate_project_data(1000, seed=2)))
+
+    def test_compare_results(self):
+        baseline = {'cases': {'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}, 'c': {'seconds': 0.001}, 'd': {'seconds': 1.0}}}
+        current = {'cases': {'a': {'seconds': 1.1}, 'b': {'seconds': 1.5}, 'c': {'seconds': 0.002}, 'e': {'seconds': 1.0}}}
+        statuses = {case: status for case, _, _, status in compare_results(baseline, current, threshold=0.2)}
+        self.assertEqual(statuses, {'a': 'ok', 'b': 'regressed', 'c': 'ok', 'd': 'missing', 'e': 'new'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from categorical import categorical_columns, encode_column, ColumnEncoder
+from transform import apply_transformations
+
+
+class TestCategorical(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'City': ['New York', 'Chicago', np.nan, 'New York', 'Boston', 'Chicago'],
+            'Sex': ['M', 'F', 'F', 'M', 'O', 'F'],
+            'Age': [30, 25, 40, 35, 28, 50]
+        })
+
+    def assert_same_as_row_by_row(self, transformation_definitions, categorical):
+        expected = apply_transformations(self.df.copy(), transformation_definitions, categorical=False)
+        actual = apply_transformations(self.df.copy(), transformation_definitions, categorical=categorical)
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_dictionary_transformations_match_row_by_row(self):
+        for transformation_definition in [
+            {'map_value': {'column': 'City', 'mapping': {'New York': 'NY', 'Chicago': 'CHI'}, 'default_value': 'Unknown'}},
+            {'map_value': {'column': 'City', 'mapping': {'New York': 'NY'}, 'default_value': None}},
+            {'map_value': {'column': 'Sex', 'mapping': {'M': 1, 'F': 2}, 'default_value': 0}},
+            {'convert_case': {'mapping': {'City': 'uppercase', 'Sex': 'lowercase'}}},
+            {'replace': {'column': 'City', 'match': 'o', 'replacement': '0'}},
+            {'replace_text': {'column': 'City', 'start_position': 0, 'end_position': 1, 'replacement': '*', 'start': True}},
+        ]:
+            self.assert_same_as_row_by_row([transformation_definition], ['City', 'Sex'])
+
+    def test_encoded_columns_follow_copies_and_renames(self):
+        self.assert_same_as_row_by_row([
+            {'duplicate': {'mapping': {'City': 'City_new'}}},
+            {'filter_records': {'condition': 'Age > 26'}},
+            {'map_value': {'column': 'City_new', 'mapping': {'New York': 'NY'}, 'default_value': 'Other'}},
+            {'rename': {'mapping': {'City_new': 'Town'}}},
+            {'convert_case': {'mapping': {'Town': 'lowercase'}}},
+            {'sort': {'mapping': {'Town': True, 'Age': False}}},
+            {'split': {'column': 'City', 'separator': ' '}},
+        ], ['City'])
+
+        encoder = ColumnEncoder(['City'])
+        df = encoder.before(self.df.copy(), 'map_value', {'column': 'City', 'mapping': {}, 'default_value': None})
+        self.assertEqual(encoder.encoded, {'City'})
+        encoder.before(df, 'duplicate', {'mapping': {'City': 'City_new'}})
+        self.assertEqual(encoder.encoded, {'City', 'City_new'})
+        df = encoder.before(df, 'filter_records', {'condition': 'City == "Boston"'})
+        self.assertEqual(df['City'].dtype, object)
+        self.assertEqual(encoder.encoded, {'City_new'})
+
+    def test_text_only_and_low_cardinality(self):
+        self.assertIsNone(encode_column(pd.Series(['a', 1, 'b'], dtype=object), force=True))
+        self.assertIsNone(encode_column(pd.Series([f'v{i}' for i in range(20000)], dtype=object)))
+        encoded = encode_column(pd.Series(['a', 'b'] * 10000, dtype=object))
+        self.assertEqual(list(encoded.cat.categories), ['a', 'b'])
+
+    def test_low_cardinality_columns_are_read_encoded(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'input.csv')
+            pd.DataFrame({
+                'SSN': np.arange(20000),
+                'Sex': ['M', 'F'] * 10000,
+                'Name': [f'Name {i}' for i in range(20000)]
+            }).to_csv(path, index=False)
+            self.assertEqual(categorical_columns(path), ['Sex'])
+            self.assertEqual(categorical_columns(path, ['SSN', 'Name'], ['Name']), ['Name'])
+            self.assertEqual(categorical_columns(path, categorical=False), [])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import pyarrow.parquet as pq
+import compression
+from compression import use_compression
+from dataset_io import dataset_format, dataset_columns, read_dataset, write_dataset
+from pipeline import run_pipeline
+from profiling import start_profiling, stop_profiling
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        self.sample_data = pd.DataFrame({
+            'SSN': list(range(200)),
+            'Name': [f'Name {i}' for i in range(200)],
+            'City': ['New York', 'Chicago'] * 75 + ['Salt Lake City'] * 50
+        })
+        # Small blocks, so the files hold many of them.
+        self.block_size = compression.BLOCK_SIZE
+        compression.BLOCK_SIZE = 256
+
+    def tearDown(self):
+        compression.BLOCK_SIZE = self.block_size
+        use_compression(None)
+        stop_profiling()
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_codec_extensions(self):
+        self.sample_data.to_csv('plain.csv', index=False)
+        with open('plain.csv', 'rb') as file:
+            plain = file.read()
+        for path, magic in [('data.csv.gz', b'\x1f\x8b'), ('data.csv.zst', b'\x28\xb5\x2f\xfd'), ('data.csv.lz4', b'\x04\x22\x4d\x18')]:
+            self.assertEqual(dataset_format(path), 'csv')
+            write_dataset(self.sample_data, path)
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(4)[:len(magic)], magic)
+            self.assertLess(os.path.getsize(path), len(plain))
+            self.assertEqual(dataset_columns(path), ['SSN', 'Name', 'City'])
+            self.assertTrue(read_dataset(path).equals(self.sample_data))
+            self.assertTrue(read_dataset(path, columns=['City']).equals(self.sample_data[['City']]))
+        # Independently compressed blocks still make one valid gzip file.
+        with gzip.open('data.csv.gz', 'rb') as file:
+            self.assertEqual(file.read(), plain)
+
+    def test_step_compression(self):
+        self.sample_data[['SSN', 'Name']].to_csv('input1.csv', index=False)
+        self.sample_data[['SSN', 'City']].to_csv('input2.csv', index=False)
+        pipeline_definitions = [
+            {'merge': {'input_file1': 'input1.csv.gz', 'input_file2': 'input2.csv', 'output_file': 'merged.csv',
+                       'key_column': 'SSN', 'compression': 'zstd'}},
+            {'process': {'input_file': 'merged.csv', 'output_file': 'processed.csv.gz', 'transformation_file': None,
+                         'chunksize': 50, 'compression': 'zstd',
+                         'transformations': [{'split': {'column': 'City', 'separator': ' '}}]}}
+        ]
+        with open('input1.csv', 'rb') as file, gzip.open('input1.csv.gz', 'wb') as compressed:
+            compressed.write(file.read())
+        start_profiling()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(run_pipeline(pipeline_definitions))
+        steps = {event['name']: event['args'] for event in stop_profiling().events if event['cat'] == 'step'}
+        # merged.csv takes the step's codec, processed.csv.gz the one its name
+        # gives.
+        with open('merged.csv', 'rb') as file:
+            self.assertEqual(file.read(4), b'\x28\xb5\x2f\xfd')
+        self.assertEqual(steps['step 1 (merge)']['bytes_in'], os.path.getsize('input1.csv.gz') + os.path.getsize('input2.csv'))
+        self.assertEqual(steps['step 1 (merge)']['bytes_out'], os.path.getsize('merged.csv'))
+        self.assertEqual(steps['step 2 (process)']['bytes_out'], os.path.getsize('processed.csv.gz'))
+        # Salt Lake City, in the last chunk, widens the output by a column.
+        processed = pd.read_csv('processed.csv.gz')
+        self.assertEqual(list(processed.columns), ['SSN', 'Name', 'City', 'City_1', 'City_2', 'City_3'])
+        self.assertEqual(len(processed), 200)
+        self.assertEqual(processed['City_3'].dropna().unique().tolist(), ['City'])
+
+    def test_columnar_compression(self):
+        use_compression('zstd')
+        write_dataset(self.sample_data, 'data.parquet')
+        self.assertEqual(pq.ParquetFile('data.parquet').metadata.row_group(0).column(0).compression, 'ZSTD')
+        self.assertTrue(read_dataset('data.parquet').equals(self.sample_data))
+        use_compression('gzip')
+        self.assertRaises(ValueError, write_dataset, self.sample_data, 'data.arrow')
+        self.assertRaises(ValueError, dataset_format, 'data.parquet.gz')
+        self.assertRaises(ValueError, use_compression, 'brotli')
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertFalse(run_pipeline([{'process': {'input_file': 'data.parquet', 'output_file': 'out.csv', 'transformation_file': None,
+                                                        'transformations': [], 'compression': 'brotli'}}]))
+        self.assertIn("Invalid compression 'brotli'", output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from dataset_cache import DatasetCache
+from pipeline import intermediate_files, run_pipeline
+
+
+class TestDatasetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_lru_eviction_spills_to_disk(self):
+        df1 = pd.DataFrame({'Age': range(1000)})
+        df2 = pd.DataFrame({'Age': range(1000, 2000)})
+        cache = DatasetCache(df1.memory_usage(deep=True).sum() + 10)
+        cache.put('a.csv', df1)
+        cache.put('b.csv', df2)
+        self.assertEqual(list(cache.spilled), [os.path.abspath('a.csv')])
+        self.assertTrue(cache.get('a.csv').equals(df1))
+        self.assertEqual(list(cache.spilled), [os.path.abspath('b.csv')])
+        self.assertFalse(os.path.exists('a.csv'))
+        cache.close()
+        self.assertFalse(os.path.exists(cache.spill_path))
+
+    def test_intermediate_files(self):
+        pipeline_definitions = [
+            {'merge': {'input_file1': 'input1.csv', 'input_file2': 'input2.csv', 'output_file': 'merged.csv', 'key_column': 'SSN'}},
+            {'process': {'input_file': 'merged.csv', 'output_file': 'processed.csv', 'materialize': True}},
+            {'split': {'input_file': 'processed.csv', 'output_definitions': {'split1.csv': ['SSN']}}}
+        ]
+        self.assertEqual(intermediate_files(pipeline_definitions), {os.path.abspath('merged.csv')})
+        # Shards are listed on disk, so an output read as part of a directory
+        # is written even when another step reads it by name.
+        pipeline_definitions[2] = {'process': {'input_file': 'merged.csv', 'output_file': 'parts/a.csv'}}
+        pipeline_definitions.append({'process': {'input_file': 'parts/a.csv', 'output_file': 'b.csv'}})
+        pipeline_definitions.append({'process': {'input_file': 'parts', 'output_file': 'out/{name}.csv'}})
+        self.assertEqual(intermediate_files(pipeline_definitions), {os.path.abspath('merged.csv')})
+
+    def test_pipeline_keeps_intermediates_in_memory(self):
+        pd.DataFrame({'SSN': [1, 2], 'Name': ['John Doe', 'Jane Smith']}).to_csv('input1.csv', index=False)
+        pd.DataFrame({'SSN': [1, 2], 'ZipCode': ['01234', '90001']}).to_csv('input2.csv', index=False)
+        pipeline_definitions = [
+            {'merge': {'input_file1': 'input1.csv', 'input_file2': 'input2.csv', 'output_file': 'merged.csv', 'key_column': 'SSN'}},
+            {'process': {'input_file': 'merged.csv', 'output_file': 'processed.csv', 'transformation_file': None,
+                         'transformations': [{'replace': {'column': 'ZipCode', 'match': '0', 'replacement': 'X'}}]}},
+            {'split': {'input_file': 'processed.csv', 'output_definitions': {'split1.csv': ['SSN', 'ZipCode']}}}
+        ]
+        run_pipeline(pipeline_definitions, cache_memory=1024 * 1024)
+        self.assertFalse(os.path.exists('merged.csv'))
+        self.assertFalse(os.path.exists('processed.csv'))
+        self.assertEqual(pd.read_csv('split1.csv', dtype=str)['ZipCode'].tolist(), ['1234', '9XXX1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
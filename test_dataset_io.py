@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from dataset_io import dataset_format, dataset_columns, read_dataset, write_dataset
+from pipeline import run_pipeline
+from stream import stream_process
+
+
+class TestDatasetIO(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        self.sample_data = pd.DataFrame({
+            'SSN': [1, 2, 3],
+            'Name': ['John Doe', 'Jane Smith', 'Mark Johnson'],
+            'City': ['New York', 'Chicago', 'Salt Lake City'],
+            'Score': [1.5, np.nan, 3.0]
+        })
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_dataset_format(self):
+        self.assertEqual(dataset_format('data.parquet'), 'parquet')
+        self.assertEqual(dataset_format('data.feather'), 'arrow')
+        self.assertEqual(dataset_format('data.tmp'), 'csv')
+        self.assertEqual(dataset_format('data.tmp', 'arrow'), 'arrow')
+        self.assertEqual(dataset_format('data.csv', 'arrow'), 'csv')
+        self.assertRaises(ValueError, dataset_format, 'data.csv', 'xlsx')
+
+    def test_round_trip_and_column_selection(self):
+        for path in ['data.parquet', 'data.arrow']:
+            write_dataset(self.sample_data, path)
+            self.assertEqual(dataset_columns(path), ['SSN', 'Name', 'City', 'Score'])
+            self.assertTrue(read_dataset(path).equals(self.sample_data))
+            self.assertEqual(list(read_dataset(path, columns=['Score', 'SSN']).columns), ['SSN', 'Score'])
+
+    def test_streamed_columnar_output_widens(self):
+        self.sample_data.to_csv('input.csv', index=False)
+        transformation_definitions = [{'split': {'column': 'City', 'separator': ' '}}]
+        for path in ['output.parquet', 'output.arrow']:
+            stream_process('input.csv', path, transformation_definitions, 1)
+            df = read_dataset(path)
+            self.assertEqual(list(df.columns), ['SSN', 'Name', 'City', 'Score', 'City_1', 'City_2', 'City_3'])
+            self.assertEqual(df['City_3'].tolist(), [None, None, 'City'])
+            self.assertEqual(df['Score'].tolist()[0], 1.5)
+
+    def test_pipeline_with_columnar_files(self):
+        self.sample_data[['SSN', 'Name']].to_csv('input1.csv', index=False)
+        self.sample_data[['SSN', 'City', 'Score']].to_csv('input2.csv', index=False)
+        pipeline_definitions = [
+            {'merge': {'input_file1': 'input1.csv', 'input_file2': 'input2.csv', 'output_file': 'merged.parquet', 'key_column': 'SSN'}},
+            {'process': {'input_file': 'merged.parquet', 'output_file': 'processed.data', 'format': 'arrow', 'transformation_file': None,
+                         'transformations': [{'convert_case': {'mapping': {'Name': 'uppercase'}}}]}},
+            {'split': {'input_file': 'processed.data', 'format': 'arrow', 'output_definitions': {'split1.data': ['SSN', 'Name']}}}
+        ]
+        run_pipeline(pipeline_definitions)
+        self.assertTrue(read_dataset('merged.parquet').equals(self.sample_data))
+        split_df = read_dataset('split1.data', file_format='arrow')
+        self.assertEqual(split_df['Name'].tolist(), ['JOHN DOE', 'JANE SMITH', 'MARK JOHNSON'])
+
+
+if __name__ == '__main__':
+    unittest.main()
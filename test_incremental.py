@@ -0,0 +1,117 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from incremental import read_checkpoint
+from pipeline import process, merge
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        pd.DataFrame({'SSN': [1, 2, 3], 'Name': ['John Doe', 'Jane Smith', 'Ann Lee'], 'Age': [30, 17, 45]}) \
+            .to_csv('input.csv', index=False)
+        self.transformations = [
+            {'filter_records': {'condition': 'Age >= 18'}},
+            {'convert_case': {'mapping': {'Name': 'uppercase'}}}
+        ]
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def append(self, path, lines):
+        with open(path, 'a') as file:
+            file.write(''.join(f'{line}\n' for line in lines))
+
+    def run_process(self, transformations=None, output_file='output.csv'):
+        return process('input.csv', output_file, None, transformations or self.transformations, incremental=True)
+
+    def test_appended_rows_match_full_recompute(self):
+        self.assertTrue(self.run_process())
+        self.assertIsNotNone(read_checkpoint('output.csv'))
+        size = os.path.getsize('output.csv')
+        self.append('input.csv', ['4,Bob Ray,50', '5,Sam Poe,12'])
+        self.assertTrue(self.run_process())
+        # Only the new row is appended below the rows already written.
+        with open('output.csv') as file:
+            file.seek(size)
+            self.assertEqual(file.read(), '4,BOB RAY,50\n')
+        process('input.csv', 'full.csv', None, self.transformations)
+        pd.testing.assert_frame_equal(pd.read_csv('output.csv'), pd.read_csv('full.csv'))
+
+    def test_rewritten_input_and_changed_types_run_in_full(self):
+        self.run_process()
+        pd.DataFrame({'SSN': [7], 'Name': ['Zoe Kim'], 'Age': [60]}).to_csv('input.csv', index=False)
+        self.run_process()
+        self.assertEqual(pd.read_csv('output.csv')['Name'].tolist(), ['ZOE KIM'])
+        # A blank in an integer column would turn it into floats.
+        self.append('input.csv', ['8,Max Orr,'])
+        self.run_process([{'convert_case': {'mapping': {'Name': 'uppercase'}}}])
+        self.append('input.csv', ['9,Ida Fox,'])
+        self.run_process([{'convert_case': {'mapping': {'Name': 'uppercase'}}}])
+        process('input.csv', 'full.csv', None, [{'convert_case': {'mapping': {'Name': 'uppercase'}}}])
+        pd.testing.assert_frame_equal(pd.read_csv('output.csv'), pd.read_csv('full.csv'))
+
+    def test_unparsable_rows_run_in_full(self):
+        transformations = [{'convert_case': {'mapping': {'Name': 'uppercase'}}}]
+        pd.DataFrame({'SSN': [1, 2], 'Name': ['John Doe', 'Jane Smith'], 'Score': [1.5, 2.5], 'Member': [True, False]}) \
+            .to_csv('input.csv', index=False)
+        self.run_process(transformations)
+        # Text in a float column, then in a boolean column.
+        for line in ['3,Ann Lee,n/k,True', '4,Bob Ray,4.5,maybe']:
+            self.append('input.csv', [line])
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertTrue(self.run_process(transformations))
+            self.assertIn('in full', output.getvalue())
+            process('input.csv', 'full.csv', None, transformations)
+            pd.testing.assert_frame_equal(pd.read_csv('output.csv'), pd.read_csv('full.csv'))
+
+    def test_sort_requires_full_recompute(self):
+        transformations = [{'sort': {'mapping': {'Age': False}}}]
+        self.run_process(transformations)
+        self.assertIsNone(read_checkpoint('output.csv'))
+        self.append('input.csv', ['4,Bob Ray,50'])
+        self.run_process(transformations)
+        self.assertEqual(pd.read_csv('output.csv')['Age'].tolist(), [50, 45, 30, 17])
+
+    def test_merge_delta(self):
+        pd.DataFrame({'SSN': [1, 2, 4], 'City': ['New York', 'Chicago', 'Boston']}).to_csv('cities.csv', index=False)
+        self.assertTrue(merge('input.csv', 'cities.csv', 'merged.csv', 'SSN', incremental=True))
+        self.append('input.csv', ['4,Bob Ray,50', '5,Sam Poe,12'])
+        self.append('cities.csv', ['3,Denver', '5,Austin'])
+        self.assertTrue(merge('input.csv', 'cities.csv', 'merged.csv', 'SSN', incremental=True))
+        merge('input.csv', 'cities.csv', 'full.csv', 'SSN')
+        pd.testing.assert_frame_equal(pd.read_csv('merged.csv').sort_values('SSN', ignore_index=True),
+                                      pd.read_csv('full.csv').sort_values('SSN', ignore_index=True))
+
+    def test_repeated_increments(self):
+        pd.DataFrame({'SSN': [1, 2, 3, 4, 5], 'City': ['New York', 'Chicago', 'Boston', 'Denver', 'Austin']}).to_csv('cities.csv', index=False)
+        transformations = self.transformations + [{'check_not_blank': {'columns': ['Name']}}]
+        self.assertTrue(merge('input.csv', 'cities.csv', 'merged.csv', 'SSN', incremental=True))
+        self.assertTrue(process('input.csv', 'output.csv', None, transformations, reject_file='rejects.csv', incremental=True))
+        for round, lines in enumerate([['4,Bob Ray,50'], ['5,Sam Poe,12', '6,,40'], ['7,Ivy Orr,33']]):
+            self.append('input.csv', lines)
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertTrue(merge('input.csv', 'cities.csv', 'merged.csv', 'SSN', incremental=True))
+                self.assertTrue(process('input.csv', 'output.csv', None, transformations, reject_file='rejects.csv', incremental=True))
+            # Every round continues from the checkpoint the one before wrote.
+            self.assertIn("'cities.csv' incrementally", output.getvalue(), f'round {round}')
+            self.assertIn("'input.csv' incrementally", output.getvalue(), f'round {round}')
+        merge('input.csv', 'cities.csv', 'full_merged.csv', 'SSN')
+        process('input.csv', 'full.csv', None, transformations, reject_file='full_rejects.csv')
+        pd.testing.assert_frame_equal(pd.read_csv('merged.csv').sort_values('SSN', ignore_index=True),
+                                      pd.read_csv('full_merged.csv').sort_values('SSN', ignore_index=True))
+        pd.testing.assert_frame_equal(pd.read_csv('output.csv'), pd.read_csv('full.csv'))
+        pd.testing.assert_frame_equal(pd.read_csv('rejects.csv'), pd.read_csv('full_rejects.csv'))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from join import join_files
+from pipeline import merge
+
+
+class TestJoin(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        rng = np.random.default_rng(0)
+        self.left = pd.DataFrame({
+            'Id': rng.integers(0, 50, 200),
+            'Region': rng.choice(['N', 'S'], 200),
+            'Name': [f'name{i}' for i in range(200)]
+        })
+        self.right = pd.DataFrame({
+            'Id': rng.integers(25, 75, 150),
+            'Region': rng.choice(['N', 'S'], 150),
+            'Amount': rng.integers(0, 1000, 150)
+        })
+        self.left.to_csv('left.csv', index=False)
+        self.right.to_csv('right.csv', index=False)
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def assertSameRows(self, expected, actual):
+        columns = list(expected.columns)
+        self.assertEqual(list(actual.columns), columns)
+        expected = expected.sort_values(columns, ignore_index=True)
+        actual = actual.sort_values(columns, ignore_index=True)
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+    def test_grace_join(self):
+        for how in ['inner', 'left', 'right', 'outer']:
+            for keys in ['Id', ['Id', 'Region']]:
+                expected = pd.merge(self.left, self.right, on=keys, how=how)
+                join_files('left.csv', 'right.csv', 'joined.csv', keys, how, chunksize=30, partitions=4)
+                self.assertSameRows(expected, pd.read_csv('joined.csv'))
+        join_files('left.csv', 'right.csv', 'joined.csv', 'Id', 'outer', chunksize=30, partitions=4, workers=2)
+        self.assertSameRows(pd.merge(self.left, self.right, on='Id', how='outer'), pd.read_csv('joined.csv'))
+
+    def test_sorted_join(self):
+        left = self.left.sort_values(['Id', 'Region'])
+        right = self.right.sort_values(['Id', 'Region'])
+        left.to_csv('left_sorted.csv', index=False)
+        right.to_csv('right_sorted.csv', index=False)
+        for how in ['inner', 'left', 'right', 'outer']:
+            for keys in ['Id', ['Id', 'Region']]:
+                expected = pd.merge(left, right, on=keys, how=how)
+                join_files('left_sorted.csv', 'right_sorted.csv', 'joined.csv', keys, how, chunksize=20, sorted_inputs=True)
+                self.assertSameRows(expected, pd.read_csv('joined.csv'))
+        self.assertRaises(ValueError, join_files, 'left.csv', 'right_sorted.csv', 'joined.csv', 'Id', chunksize=7, sorted_inputs=True)
+
+    def test_empty_input(self):
+        self.right.iloc[:0].to_csv('empty.csv', index=False)
+        left = self.left.sort_values('Id')
+        left.to_csv('left_sorted.csv', index=False)
+        for sorted_inputs in [False, True]:
+            join_files('left_sorted.csv', 'empty.csv', 'joined.csv', 'Id', 'left', chunksize=30, sorted_inputs=sorted_inputs)
+            self.assertSameRows(pd.merge(left, self.right.iloc[:0], on='Id', how='left'), pd.read_csv('joined.csv'))
+            join_files('left_sorted.csv', 'empty.csv', 'joined.csv', 'Id', chunksize=30, sorted_inputs=sorted_inputs)
+            self.assertEqual(list(pd.read_csv('joined.csv').columns), ['Id', 'Region_x', 'Name', 'Region_y', 'Amount'])
+
+    def test_merge_step(self):
+        self.assertTrue(merge('left.csv', 'right.csv', 'joined.csv', ['Id', 'Region'], how='left', chunksize=50))
+        self.assertSameRows(pd.merge(self.left, self.right, on=['Id', 'Region'], how='left'), pd.read_csv('joined.csv'))
+        self.assertFalse(merge('left.csv', 'right.csv', 'joined.csv', 'Missing', chunksize=50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from lookup import load_reference, write_index, read_index
+from transform import apply_transformations
+
+
+class TestLookup(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        pd.DataFrame({'zip': [10001, 60601, 2134, 10001], 'region': ['Northeast', 'Midwest', 'Northeast', 'Ignored']}) \
+            .to_csv('zips.csv', index=False)
+        pd.DataFrame({'code': ['P-1', 'P-2', 'P-ü'], 'price': [9.5, 12, np.nan]}).to_parquet('products.parquet')
+        self.df = pd.DataFrame({
+            'ZipCode': [10001, 2134, 99999, 60601, 10001],
+            'Product': ['P-2', 'P-ü', 'P-9', np.nan, 'P-1'],
+            'Zip': ['02134', '10001', 'n/a', np.nan, '60601']
+        })
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def lookup(self, column, reference_file, key_column, value_column, **parameters):
+        return {'lookup': dict(column=column, reference_file=reference_file, key_column=key_column, value_column=value_column, **parameters)}
+
+    def test_lookup_matches_mapping(self):
+        df = apply_transformations(self.df.copy(), [
+            self.lookup('ZipCode', 'zips.csv', 'zip', 'region', output_column='Region', default_value='Unknown'),
+            self.lookup('Product', 'products.parquet', 'code', 'price'),
+            self.lookup('Zip', 'zips.csv', 'zip', 'region')
+        ])
+        self.assertEqual(df['Region'].tolist(), ['Northeast', 'Northeast', 'Unknown', 'Midwest', 'Northeast'])
+        self.assertEqual(df['ZipCode'].tolist(), self.df['ZipCode'].tolist())
+        pd.testing.assert_series_equal(df['Product'], pd.Series([12, np.nan, np.nan, np.nan, 9.5], name='Product'))
+        # Numeric text matches numeric keys.
+        self.assertEqual(df['Zip'].tolist()[:2] + df['Zip'].tolist()[4:], ['Northeast', 'Northeast', 'Midwest'])
+        self.assertTrue(df['Zip'].iloc[2:4].isna().all())
+
+    def test_encoded_columns_look_up_each_value_once(self):
+        df = pd.DataFrame({'ZipCode': np.tile([10001, 60601, 2134, 5], 5000).astype(str)})
+        transformations = [self.lookup('ZipCode', 'zips.csv', 'zip', 'region', output_column='Region', default_value='Unknown')]
+        expected = apply_transformations(df.copy(), transformations, categorical=False)
+        pd.testing.assert_frame_equal(apply_transformations(df.copy(), transformations), expected)
+        self.assertEqual(expected['Region'].iloc[:4].tolist(), ['Northeast', 'Midwest', 'Northeast', 'Unknown'])
+
+    def test_prebuilt_index_is_memory_mapped_and_cached(self):
+        write_index('zips.csv', 'zip', 'region')
+        index = load_reference('zips.csv', 'zip', 'region')
+        self.assertIsInstance(index.keys, np.memmap)
+        self.assertIs(load_reference('zips.csv', 'zip', 'region'), index)
+        self.assertEqual(index.lookup(pd.Series([60601, 1])).tolist()[0], 'Midwest')
+        # Changing the table makes the index stale.
+        with open('zips.csv', 'a') as file:
+            file.write('1,South\n')
+        self.assertIsNone(read_index('zips.csv', 'zip', 'region'))
+        self.assertEqual(load_reference('zips.csv', 'zip', 'region').lookup(pd.Series([60601, 1])).tolist(), ['Midwest', 'South'])
+
+
+if __name__ == '__main__':
+    unittest.main()
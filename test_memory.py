@@ -0,0 +1,45 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from benchmark import write_project_inputs, resolve_pipeline, PROJECT_PIPELINE
+from pipeline import run_pipeline
+
+
+# Peak memory allocated while the project pipeline runs, as a multiple of
+# the size of its input files.
+MAX_MEMORY_RATIO = 7
+ROWS = 10000
+
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        write_project_inputs(self.directory, ROWS)
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_project_pipeline_peak_memory(self):
+        input_size = os.path.getsize('input1.csv') + os.path.getsize('input2.csv')
+        pipeline_definitions = resolve_pipeline(PROJECT_PIPELINE)
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertTrue(run_pipeline(pipeline_definitions))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLessEqual(peak, MAX_MEMORY_RATIO * input_size,
+                             f"Peak memory was {peak / input_size:.1f} times the input size")
+
+
+if __name__ == '__main__':
+    unittest.main()
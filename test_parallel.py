@@ -0,0 +1,60 @@
+import copy
+import unittest
+import pandas as pd
+from transform import apply_transformations
+from parse_transformations_file import parse_transformations_file
+from parallel import apply_transformations_parallel, parallel_segments
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.sample_data = pd.concat([pd.read_csv('project/merged.csv')] * 20, ignore_index=True)
+
+    def assertParallelMatches(self, transformation_definitions):
+        expected = apply_transformations(self.sample_data.copy(), copy.deepcopy(transformation_definitions))
+        actual = apply_transformations_parallel(self.sample_data.copy(), copy.deepcopy(transformation_definitions), 3, min_partition_rows=10)
+        self.assertEqual(expected.to_csv(index=False), actual.to_csv(index=False))
+
+    def test_parallel_segments(self):
+        transformation_definitions = [
+            {'rename': {'mapping': {'Name': 'Full_Name'}}},
+            {'checks': [{'type': 'not_blank', 'columns': ['Full_Name']}]},
+            {'split': {'column': 'City', 'separator': ' '}},
+            {'drop': {'columns': ['City']}},
+            {'sort': {'mapping': {'Age': True}}}
+        ]
+        self.assertEqual([(partitioned, len(definitions)) for partitioned, definitions in parallel_segments(transformation_definitions)],
+                         [(False, 1), (False, 1), (True, 2), (False, 1)])
+        # filter_records runs in the partitions with the transformations
+        # around it.
+        transformation_definitions.insert(3, {'filter_records': {'condition': 'Age >= 18'}})
+        self.assertEqual([(partitioned, len(definitions)) for partitioned, definitions in parallel_segments(transformation_definitions)],
+                         [(False, 1), (False, 1), (True, 3), (False, 1)])
+
+    def test_project_transformations(self):
+        self.assertParallelMatches(parse_transformations_file('project/transformations.yml'))
+
+    def test_split_and_filter_out_partitions(self):
+        self.assertParallelMatches([
+            {'split': {'column': 'Address', 'separator': ' '}},
+            {'filter_records': {'condition': 'Age > 1000'}},
+            {'merge': {'columns': ['Address_1', 'Address_2'], 'separator': '-', 'output_column': 'Street'}}
+        ])
+        self.assertParallelMatches([
+            {'convert_case': {'mapping': {'Name': 'uppercase'}}},
+            {'filter_records': {'condition': 'Age >= 30 and Sex == "M"'}},
+            {'split': {'column': 'City', 'separator': ' '}},
+            {'filter_records': {'condition': 'Age < 60'}},
+            {'duplicate': {'mapping': {'Name': 'Name_new'}}}
+        ])
+        self.assertParallelMatches([
+            {'filter_records': {'condition': 'Age < 25'}},
+            {'split': {'column': 'City', 'separator': ' '}},
+            {'sort': {'mapping': {'Age': False, 'SSN': True}}},
+            {'convert_case': {'mapping': {'City_1': 'uppercase'}}}
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
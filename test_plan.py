@@ -0,0 +1,82 @@
+import copy
+import unittest
+import pandas as pd
+from transform import apply_transformations
+from parse_transformations_file import parse_transformations_file
+from plan import compile_plan, plan_definitions, explain_plan, condition_columns
+
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.sample_data = pd.read_csv('project/merged.csv')
+        self.input_columns = list(self.sample_data.columns)
+
+    def assertPlanMatches(self, transformation_definitions):
+        plan = compile_plan(transformation_definitions, self.input_columns)
+        expected = apply_transformations(self.sample_data.copy(), copy.deepcopy(transformation_definitions))
+        actual = apply_transformations(self.sample_data[plan['usecols']].copy(), plan_definitions(plan))
+        self.assertEqual(expected.to_csv(index=False), actual.to_csv(index=False))
+        return plan
+
+    def test_condition_columns(self):
+        self.assertEqual(condition_columns("(Age <= 30) and (`Zip Code` >= 50000) or Sex == 'M and F'"), {'Age', 'Zip Code', 'Sex'})
+
+    def test_filter_pushed_before_independent_transforms(self):
+        transformation_definitions = [
+            {'duplicate': {'mapping': {'Phone': 'Phone_new'}}},
+            {'replace_text': {'column': 'Phone_new', 'start_position': 1, 'end_position': 2, 'replacement': '^', 'start': False}},
+            {'merge': {'columns': ['Address', 'City'], 'separator': ', ', 'output_column': 'Location'}},
+            {'filter_records': {'condition': 'Age <= 30'}}
+        ]
+        plan = self.assertPlanMatches(transformation_definitions)
+        self.assertEqual([node['type'] for node in plan['nodes']], ['filter_records', 'duplicate', 'replace_text', 'merge'])
+
+    def test_filter_not_pushed_past_its_inputs_or_checks(self):
+        transformation_definitions = [
+            {'checks': [{'type': 'range', 'column': 'Age', 'min_value': 18, 'max_value': 40}]},
+            {'duplicate': {'mapping': {'Age': 'Age_new'}}},
+            {'split': {'column': 'City', 'separator': ' '}},
+            {'filter_records': {'condition': 'Age_new <= 30'}}
+        ]
+        plan = self.assertPlanMatches(transformation_definitions)
+        self.assertEqual([node['type'] for node in plan['nodes']], ['checks', 'duplicate', 'split', 'filter_records'])
+
+    def test_unused_columns_are_pruned(self):
+        transformation_definitions = [
+            {'duplicate': {'mapping': {'Name': 'Name_new', 'Email': 'Email_new'}}},
+            {'replace': {'column': 'Email_new', 'match': 'example', 'replacement': 'X'}},
+            {'convert_case': {'mapping': {'Name_new': 'uppercase'}}},
+            {'drop': {'columns': ['Email_new', 'Phone']}},
+            {'filter': {'columns': ['SSN', 'Name_new', 'Age']}}
+        ]
+        plan = self.assertPlanMatches(transformation_definitions)
+        self.assertEqual(plan['usecols'], ['SSN', 'Name', 'Age'])
+        self.assertEqual(plan_definitions(plan), [
+            {'duplicate': {'mapping': {'Name': 'Name_new'}}},
+            {'convert_case': {'mapping': {'Name_new': 'uppercase'}}},
+            {'drop': {'columns': []}},
+            {'filter': {'columns': ['SSN', 'Name_new', 'Age']}}
+        ])
+        self.assertIn('pruned columns [Email, Phone, Sex, City, Address, ZipCode]', explain_plan(plan, transformation_definitions))
+
+    def test_aggregate_reads_only_its_columns(self):
+        transformation_definitions = [
+            {'duplicate': {'mapping': {'Name': 'Name_new'}}},
+            {'filter_records': {'condition': 'Age >= 18'}},
+            {'aggregate': {'group_by': ['City'], 'aggregations': {'People': {'count': 'SSN'}, 'Average_Age': {'mean': 'Age'}}}},
+            {'filter_records': {'condition': 'People > 1'}}
+        ]
+        plan = self.assertPlanMatches(transformation_definitions)
+        self.assertEqual(plan['usecols'], ['SSN', 'Age', 'City'])
+        # The filter on the aggregate stays after it.
+        self.assertEqual([list(definition)[0] for definition in plan_definitions(plan)], ['filter_records', 'aggregate', 'filter_records'])
+
+    def test_project_transformations(self):
+        transformation_definitions = parse_transformations_file('project/transformations.yml')
+        self.assertPlanMatches(transformation_definitions)
+        self.assertPlanMatches(transformation_definitions + [{'filter': {'columns': ['SSN', 'First_Name', 'Age']}}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import yaml
+from pipeline import run_pipeline
+from profiling import start_profiling, stop_profiling, is_profiling, profile_span, prometheus_metrics, NO_SPAN
+import pipeline_main
+from pipeline_service import run_job
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        pd.DataFrame({'SSN': [1, 2, 3], 'Name': ['John Doe', 'Jane Smith', 'Ann Lee']}).to_csv('input1.csv', index=False)
+        pd.DataFrame({'SSN': [1, 2], 'Age': [30, 17]}).to_csv('input2.csv', index=False)
+        self.pipeline_definitions = [
+            {'merge': {'input_file1': 'input1.csv', 'input_file2': 'input2.csv', 'output_file': 'merged.csv', 'key_column': 'SSN'}},
+            {'process': {'input_file': 'merged.csv', 'output_file': 'processed.csv', 'transformation_file': None,
+                         'transformations': [{'filter_records': {'condition': 'Age >= 18'}},
+                                             {'duplicate': {'mapping': {'Name': 'Name_new'}}}]}}
+        ]
+
+    def tearDown(self):
+        stop_profiling()
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_steps_and_transformations_are_recorded(self):
+        start_profiling()
+        run_pipeline(self.pipeline_definitions)
+        events = {event['name']: event for event in stop_profiling().events}
+        self.assertEqual({event['cat'] for event in events.values()}, {'pipeline', 'step', 'transform'})
+        merge_step = events['step 1 (merge)']['args']
+        self.assertEqual((merge_step['rows_in'], merge_step['rows_out']), (5, 2))
+        self.assertEqual((merge_step['columns_in'], merge_step['columns_out']), (2, 3))
+        filter_records = events['filter_records']['args']
+        self.assertEqual((filter_records['rows_in'], filter_records['rows_out']), (2, 1))
+        self.assertEqual(filter_records['step'], 'step 2 (process)')
+        duplicate = events['duplicate']['args']
+        self.assertEqual((duplicate['columns_in'], duplicate['columns_out']), (3, 4))
+        self.assertGreater(duplicate['memory_delta_bytes'], 0)
+        self.assertTrue(all(event['ph'] == 'X' and event['dur'] >= 0 for event in events.values()))
+
+        metrics = prometheus_metrics(list(events.values()))
+        self.assertIn('# TYPE etl_step_seconds gauge', metrics)
+        self.assertIn('etl_step_rows_out{step="step 2 (process)"} 1', metrics)
+        self.assertIn('etl_transform_calls_total{step="step 2 (process)",transformation="duplicate"} 1', metrics)
+
+    def test_failed_pipeline_stops_profiling(self):
+        self.pipeline_definitions[1]['process']['transformations'].append({'sort': {'mapping': {'Age': 3}}})
+        with open('pipeline.yml', 'w') as file:
+            yaml.safe_dump(self.pipeline_definitions, file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertRaises(ValueError, pipeline_main.main, pipeline_main.parse_arguments(['pipeline.yml', '--profile']))
+        self.assertFalse(is_profiling())
+        # A service worker starts every job without the last job's profiler.
+        start_profiling()
+        result = run_job('pipeline', ['pipeline.yml'], self.directory)
+        self.assertFalse(result['succeeded'])
+        self.assertFalse(is_profiling())
+
+    def test_no_spans_without_profiling(self):
+        self.assertIs(profile_span('sort', 'transform'), NO_SPAN)
+
+
+if __name__ == '__main__':
+    unittest.main()
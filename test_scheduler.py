@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from pipeline import run_step
+from scheduler import build_step_graph, run_steps
+
+
+def touch_step(pipeline_definition_item):
+    pipeline_definition = list(pipeline_definition_item.values())[0]
+    if pipeline_definition.get('fail'):
+        raise ValueError('step failed')
+    open(pipeline_definition['output_file'], 'w').close()
+    return True
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        pd.DataFrame({'SSN': [1, 2], 'Name': ['John Doe', 'Jane Smith']}).to_csv('input1.csv', index=False)
+        pd.DataFrame({'SSN': [1, 2], 'City': ['New York', 'Chicago']}).to_csv('input2.csv', index=False)
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_build_step_graph(self):
+        pipeline_definitions = [
+            {'process': {'input_file': 'input1.csv', 'output_file': 'a.csv'}},
+            {'process': {'input_file': 'input2.csv', 'output_file': 'b.csv'}},
+            {'merge': {'input_file1': 'a.csv', 'input_file2': 'b.csv', 'output_file': 'merged.csv', 'key_column': 'SSN'}},
+            {'split': {'input_file': 'merged.csv', 'output_definitions': {'a.csv': ['SSN']}}}
+        ]
+        self.assertEqual(build_step_graph(pipeline_definitions), [set(), set(), {0, 1}, {0, 2}])
+
+    def test_shard_steps(self):
+        # Directories, globs and shard patterns are matched against each
+        # other, so a chain of sharded steps runs in order.
+        pipeline_definitions = [
+            {'process': {'input_file': 'in/*.csv', 'output_file': 'mid/{name}.csv'}},
+            {'process': {'input_file': 'mid/*.csv', 'output_file': 'out/{name}.csv'}},
+            {'process': {'input_file': 'mid', 'output_file': 'out2/part-{index}.csv'}},
+            {'process': {'input_file': 'out2/part-0.csv', 'output_file': 'final.csv'}},
+            {'process': {'input_file': 'input1.csv', 'output_file': 'mid/{name}.csv'}}
+        ]
+        self.assertEqual(build_step_graph(pipeline_definitions), [set(), {0}, {0}, {2}, {0, 1, 2}])
+
+    def test_failure_skips_downstream_steps(self):
+        pipeline_definitions = [
+            {'process': {'input_file': 'input1.csv', 'output_file': 'a.csv', 'fail': True}},
+            {'process': {'input_file': 'input2.csv', 'output_file': 'b.csv'}},
+            {'process': {'input_file': 'a.csv', 'output_file': 'c.csv'}}
+        ]
+        for workers in [1, 2]:
+            with self.assertRaises(ValueError):
+                run_steps(pipeline_definitions, touch_step, workers)
+            self.assertTrue(os.path.exists('b.csv'))
+            self.assertFalse(os.path.exists('c.csv'))
+            os.remove('b.csv')
+
+    def test_parallel_pipeline(self):
+        pipeline_definitions = [
+            {'process': {'input_file': 'input1.csv', 'output_file': 'a.csv', 'transformation_file': None,
+                         'transformations': [{'convert_case': {'mapping': {'Name': 'uppercase'}}}]}},
+            {'process': {'input_file': 'input2.csv', 'output_file': 'b.csv', 'transformation_file': None,
+                         'transformations': [{'convert_case': {'mapping': {'City': 'lowercase'}}}]}},
+            {'merge': {'input_file1': 'a.csv', 'input_file2': 'b.csv', 'output_file': 'merged.csv', 'key_column': 'SSN'}},
+            {'merge': {'input_file1': 'missing.csv', 'input_file2': 'b.csv', 'output_file': 'other.csv', 'key_column': 'SSN'}},
+            {'split': {'input_file': 'other.csv', 'output_definitions': {'other_split.csv': ['SSN']}}}
+        ]
+        results = run_steps(pipeline_definitions, run_step, workers=2)
+        self.assertEqual(results, [True, True, True, False, False])
+        merged = pd.read_csv('merged.csv')
+        self.assertEqual(merged['Name'].tolist(), ['JOHN DOE', 'JANE SMITH'])
+        self.assertEqual(merged['City'].tolist(), ['new york', 'chicago'])
+        self.assertFalse(os.path.exists('other_split.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
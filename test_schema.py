@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from dataset_io import read_dataset
+from pipeline import process
+from schema import use_schemas, read_schema, schema_file, MIN_DOMAIN_ROWS
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        rows = MIN_DOMAIN_ROWS
+        self.df = pd.DataFrame({
+            'SSN': np.arange(rows),
+            'Name': [f'Person {index}' for index in range(rows)],
+            'Age': pd.array(np.where(np.arange(rows) % 7 == 0, None, 18 + np.arange(rows) % 50), dtype='Int64'),
+            'City': np.where(np.arange(rows) % 11 == 0, None, np.array(['New York', 'Chicago', 'Boston'])[np.arange(rows) % 3]),
+            'Score': np.arange(rows) / 4
+        })
+        self.df.to_csv('input.csv', index=False)
+        self.transformations = [
+            {'check_not_blank': {'columns': ['Name']}},
+            {'filter_records': {'condition': 'SSN % 2 == 0'}},
+            {'map_value': {'column': 'City', 'mapping': {'New York': 'NY'}, 'default_value': 'Other'}},
+            {'duplicate': {'mapping': {'Age': 'Age_new'}}},
+            {'replace': {'column': 'Age_new', 'match': '.0', 'replacement': ''}},
+            {'sort': {'mapping': {'Age': False}}}
+        ]
+
+    def tearDown(self):
+        use_schemas(False)
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_sidecar_types_and_typed_read(self):
+        use_schemas()
+        df = read_dataset('input.csv')
+        schema = read_schema('input.csv')
+        types = {column['name']: column['type'] for column in schema['columns']}
+        self.assertEqual(types, {'SSN': 'int64', 'Name': 'string', 'Age': 'Int64', 'City': 'category', 'Score': 'float64'})
+        self.assertEqual(schema['columns'][3]['categories'], ['Boston', 'Chicago', 'New York'])
+        self.assertEqual(str(df['Name'].dtype), 'string')
+        self.assertEqual(str(df['Age'].dtype), 'Int64')
+        self.assertEqual(df['City'].isna().sum(), self.df['City'].isna().sum())
+        # Rewriting the file makes its sidecar stale.
+        self.df[['SSN', 'Name']].to_csv('input.csv', index=False)
+        self.assertIsNone(read_schema('input.csv'))
+        self.assertEqual(list(read_dataset('input.csv').columns), ['SSN', 'Name'])
+
+    def test_typed_reads_give_the_same_output(self):
+        for chunksize in (None, 3000):
+            use_schemas(False)
+            process('input.csv', 'expected.csv', None, self.transformations, chunksize)
+            use_schemas()
+            process('input.csv', 'output.csv', None, self.transformations, chunksize)
+            with open('expected.csv') as expected, open('output.csv') as output:
+                self.assertEqual(output.read(), expected.read())
+        process('input.csv', 'output.csv', None, self.transformations)
+        self.assertTrue(os.path.exists(schema_file('output.csv')))
+        self.assertIsNotNone(read_schema('output.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
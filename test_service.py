@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import yaml
+from pipeline_service import create_app
+
+
+class TestService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(1)
+        cls.client = cls.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.executor.shutdown()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        pd.DataFrame({'Name': ['John Doe', 'Jane Smith'], 'Age': [30, 25]}).to_csv(os.path.join(self.directory, 'input.csv'), index=False)
+        self.write_yaml('transformations.yml', [{'convert_case': {'mapping': {'Name': 'uppercase'}}}])
+        self.write_yaml('pipeline.yml', [{'process': {'input_file': 'input.csv', 'transformation_file': 'transformations.yml',
+                                                      'output_file': 'output.csv', 'transformations': None}}])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_yaml(self, name, data):
+        with open(os.path.join(self.directory, name), 'w') as file:
+            yaml.safe_dump(data, file)
+
+    def submit(self, command, *args):
+        response = self.client.post('/jobs', json={'command': command, 'args': list(args), 'cwd': self.directory})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_jobs_run_in_their_directory(self):
+        result = self.submit('pipeline', 'pipeline.yml', '--manifest', '.manifest.json')
+        self.assertTrue(result['succeeded'], result['output'])
+        self.assertIn("into 'output.csv' successfully", result['output'])
+        self.assertEqual(pd.read_csv(os.path.join(self.directory, 'output.csv'))['Name'].tolist(), ['JOHN DOE', 'JANE SMITH'])
+        # A changed transformation file is parsed again by the warm worker.
+        self.write_yaml('transformations.yml', [{'convert_case': {'mapping': {'Name': 'lowercase'}}}])
+        result = self.submit('transform', 'input.csv', 'lower.csv', 'transformations.yml')
+        self.assertTrue(result['succeeded'], result['output'])
+        self.assertEqual(pd.read_csv(os.path.join(self.directory, 'lower.csv'))['Name'].tolist(), ['john doe', 'jane smith'])
+
+    def test_failed_jobs(self):
+        result = self.submit('pipeline', 'missing.yml')
+        self.assertFalse(result['succeeded'])
+        self.assertIn('missing.yml', result['output'])
+        result = self.submit('transform', 'input.csv')
+        self.assertFalse(result['succeeded'])
+        self.assertIn('usage:', result['output'])
+        self.assertEqual(self.client.post('/jobs', json={'command': 'rm', 'args': []}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from pipeline import process
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        os.mkdir('in')
+        self.df = pd.DataFrame({
+            'Name': [f'name {index}' for index in range(300)],
+            'Age': [index % 60 for index in range(300)]
+        })
+        for index in range(3):
+            self.df.iloc[index * 100:(index + 1) * 100].to_csv(f'in/day-{index:02d}.csv', index=False)
+        self.df.to_csv('full_input.csv', index=False)
+        self.transformations = [{'filter_records': {'condition': 'Age >= 25'}},
+                                {'convert_case': {'mapping': {'Name': 'uppercase'}}}]
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def test_shards_match_a_full_run(self):
+        self.assertTrue(process('full_input.csv', 'full.csv', None, self.transformations))
+        self.assertTrue(process('in/day-*.csv', 'out/{name}.csv', None, self.transformations, workers=2))
+        self.assertEqual(sorted(os.listdir('out')), ['day-00.csv', 'day-01.csv', 'day-02.csv'])
+        shards = pd.concat([pd.read_csv(f'out/day-{index:02d}.csv') for index in range(3)], ignore_index=True)
+        pd.testing.assert_frame_equal(shards, pd.read_csv('full.csv'))
+        # A sharded input needs a pattern to write its shards to.
+        self.assertFalse(process('in', 'out.csv', None, self.transformations))
+
+    def test_outputs_are_resharded_by_rows(self):
+        self.assertTrue(process('full_input.csv', 'full.csv', None, self.transformations))
+        self.assertTrue(process('in', 'parts/part-{index}.csv', None, self.transformations, shard_rows=70))
+        parts = [pd.read_csv(f'parts/part-{index}.csv') for index in range(len(glob.glob('parts/*.csv')))]
+        full = pd.read_csv('full.csv')
+        self.assertEqual([len(part) for part in parts], [70, 70, len(full) - 140])
+        pd.testing.assert_frame_equal(pd.concat(parts, ignore_index=True), full)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+import yaml
+from pipeline import run_pipeline
+from pipeline_main import main, parse_arguments
+
+
+class TestStepCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+        pd.DataFrame({'SSN': [1, 2], 'Name': ['John Doe', 'Jane Smith']}).to_csv('input1.csv', index=False)
+        pd.DataFrame({'SSN': [1, 2], 'City': ['New York', 'Chicago']}).to_csv('input2.csv', index=False)
+        self.pipeline_definitions = [
+            {'merge': {'input_file1': 'input1.csv', 'input_file2': 'input2.csv', 'output_file': 'merged.csv', 'key_column': 'SSN'}},
+            {'process': {'input_file': 'merged.csv', 'output_file': 'processed.csv', 'transformation_file': None,
+                         'transformations': [{'convert_case': {'mapping': {'Name': 'uppercase'}}}]}}
+        ]
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree(self.directory)
+
+    def run_and_report(self, force_from=None):
+        modified = {path: os.stat(path).st_mtime_ns for path in ['merged.csv', 'processed.csv'] if os.path.exists(path)}
+        run_pipeline(self.pipeline_definitions, manifest_file='manifest.json', force_from=force_from)
+        return [os.stat(path).st_mtime_ns != modified.get(path) for path in ['merged.csv', 'processed.csv']]
+
+    def test_steps_always_run_without_manifest(self):
+        with open('pipeline.yml', 'w') as file:
+            yaml.safe_dump(self.pipeline_definitions, file)
+        for _ in range(2):
+            modified = {path: os.stat(path).st_mtime_ns for path in ['merged.csv', 'processed.csv'] if os.path.exists(path)}
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertTrue(main(parse_arguments(['pipeline.yml'])))
+            self.assertTrue(all(os.stat(path).st_mtime_ns != modified.get(path) for path in ['merged.csv', 'processed.csv']))
+        self.assertEqual(sorted(os.listdir('.')), ['input1.csv', 'input2.csv', 'merged.csv', 'pipeline.yml', 'processed.csv'])
+
+    def test_unchanged_steps_are_skipped(self):
+        self.assertEqual(self.run_and_report(), [True, True])
+        self.assertEqual(self.run_and_report(), [False, False])
+        self.pipeline_definitions[1]['process']['transformations'][0]['convert_case']['mapping']['Name'] = 'lowercase'
+        self.assertEqual(self.run_and_report(), [False, True])
+        self.assertEqual(pd.read_csv('processed.csv')['Name'].tolist(), ['john doe', 'jane smith'])
+        self.assertEqual(self.run_and_report(force_from=1), [False, True])
+        self.assertEqual(self.run_and_report(force_from=0), [True, True])
+
+    def test_changed_input_and_output(self):
+        self.run_and_report()
+        pd.DataFrame({'SSN': [1, 2], 'Name': ['Ann Lee', 'Bob Ray']}).to_csv('input1.csv', index=False)
+        self.assertEqual(self.run_and_report(), [True, True])
+        os.remove('processed.csv')
+        self.assertEqual(self.run_and_report(), [False, True])
+        self.assertEqual(pd.read_csv('processed.csv')['Name'].tolist(), ['ANN LEE', 'BOB RAY'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from transform import apply_transformations
+from stream import stream_process, stream_split, split_segments, union_columns
+from pipeline import split, merge
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.directory, 'input.csv')
+        self.output_file = os.path.join(self.directory, 'output.csv')
+        self.expected_file = os.path.join(self.directory, 'expected.csv')
+        data = {
+            'Name': ['John Doe', 'Jane Smith', 'Mark Johnson', 'Ann Lee', 'Bob Ray', 'Eve Moss'],
+            'Age': [30, 25, 35, 28, 41, 22],
+            'City': ['New York', 'Los Angeles', 'Chicago', 'Salt Lake City', 'Boston', 'Austin'],
+            'Email': [np.nan, np.nan, 'mark@example.com', np.nan, 'bob@example.com', 'eve@example.com']
+        }
+        pd.DataFrame(data).to_csv(self.input_file, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertStreamMatches(self, transformation_definitions, chunksize):
+        df = apply_transformations(pd.read_csv(self.input_file), transformation_definitions)
+        df.to_csv(self.expected_file, index=False)
+        stream_process(self.input_file, self.output_file, transformation_definitions, chunksize)
+        with open(self.expected_file) as expected, open(self.output_file) as output:
+            self.assertEqual(expected.read(), output.read())
+
+    def test_split_segments(self):
+        transformation_definitions = [
+            {'duplicate': {'mapping': {'Name': 'Name_new'}}},
+            {'sort': {'mapping': {'Age': True}}},
+            {'drop': {'columns': ['Name_new']}}
+        ]
+        segments = split_segments(transformation_definitions)
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(segments[0][1], {'sort': {'mapping': {'Age': True}}})
+        self.assertEqual(segments[1], ([{'drop': {'columns': ['Name_new']}}], None))
+
+    def test_union_columns(self):
+        self.assertEqual(union_columns(['City', 'City_1', 'Age'], ['City', 'City_1', 'City_2', 'Age']),
+                         ['City', 'City_1', 'City_2', 'Age'])
+
+    def test_row_local_transformations(self):
+        transformation_definitions = [
+            {'duplicate': {'mapping': {'Name': 'Name_new'}}},
+            {'replace_text': {'column': 'Name_new', 'start_position': 1, 'end_position': 2, 'replacement': '*', 'start': True}},
+            {'filter_records': {'condition': 'Age < 40'}},
+            {'convert_case': {'mapping': {'Name': 'uppercase'}}}
+        ]
+        self.assertStreamMatches(transformation_definitions, 2)
+
+    def test_split_widens_header(self):
+        transformation_definitions = [{'split': {'column': 'City', 'separator': ' '}}]
+        self.assertStreamMatches(transformation_definitions, 2)
+
+    def test_blank_column_in_first_chunk(self):
+        transformation_definitions = [{'check_data_type': {'mapping': {'Email': 'object'}}}]
+        self.assertStreamMatches(transformation_definitions, 2)
+
+    def test_blanks_in_later_chunk(self):
+        # Only the last chunk holds blanks, yet every chunk gets the types of
+        # the whole file.
+        with open(self.input_file, 'w') as file:
+            file.write('Name,Age,Member\n')
+            for i in range(9):
+                file.write(f"N{i},{'' if i == 8 else 20 + i},{'' if i == 7 else 'True'}\n")
+        transformation_definitions = [{'check_data_type': {'mapping': {'Age': 'float64', 'Member': 'object'}}}]
+        self.assertStreamMatches(transformation_definitions, 3)
+        with open(self.output_file) as output:
+            self.assertEqual(output.readline(), 'Name,Age,Member\n')
+            self.assertEqual(output.readline(), 'N0,20.0,True\n')
+        pd.DataFrame({'Name': [f'N{i}' for i in range(9)], 'City': ['Boston'] * 9}).to_csv(self.expected_file, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(merge(self.input_file, self.expected_file, self.output_file, 'Name', chunksize=3))
+        self.assertEqual(pd.read_csv(self.output_file).sort_values('Name')['Age'].tolist()[:2], [20.0, 21.0])
+        with open(self.output_file) as output:
+            self.assertNotIn(',20,', output.read())
+
+    def test_sort_barrier(self):
+        rng = np.random.RandomState(0)
+        df = pd.DataFrame({'Group': rng.randint(0, 5, 500), 'Value': rng.permutation(500)})
+        df.to_csv(self.input_file, index=False)
+        transformation_definitions = [{'sort': {'mapping': {'Group': False, 'Value': True}}}]
+        self.assertStreamMatches(transformation_definitions, 40)
+
+    def test_sort_limit(self):
+        rng = np.random.RandomState(0)
+        df = pd.DataFrame({'Group': rng.randint(0, 5, 500), 'Value': rng.randint(0, 50, 500), 'Row': range(500)})
+        df.to_csv(self.input_file, index=False)
+        transformation_definitions = [{'sort': {'mapping': {'Value': False, 'Group': True}, 'limit': 30}},
+                                      {'duplicate': {'mapping': {'Row': 'Row_copy'}}}]
+        self.assertStreamMatches(transformation_definitions, 40)
+        # Rows that tie keep their input order, as after a stable sort.
+        expected = df.sort_values(['Value', 'Group'], ascending=[False, True], kind='stable').head(30)
+        self.assertEqual(pd.read_csv(self.output_file)['Row'].tolist(), expected['Row'].tolist())
+        # A limit of 0 keeps the header only.
+        transformation_definitions[0]['sort']['limit'] = 0
+        self.assertStreamMatches(transformation_definitions, 40)
+        self.assertEqual(len(pd.read_csv(self.output_file)), 0)
+
+    def test_aggregate_barrier(self):
+        rng = np.random.RandomState(0)
+        df = pd.DataFrame({'Group': rng.randint(0, 5, 2000), 'Sex': rng.choice(['M', 'F'], 2000),
+                           'Value': rng.randint(0, 50, 2000), 'Id': rng.randint(0, 3000, 2000)})
+        df.loc[::9, 'Value'] = np.nan
+        df.to_csv(self.input_file, index=False)
+        transformation_definitions = [
+            {'filter_records': {'condition': 'Group != 3'}},
+            {'aggregate': {'group_by': ['Group', 'Sex'], 'aggregations': {
+                'Rows': {'count': 'Id'}, 'Total': {'sum': 'Value'}, 'Low': {'min': 'Value'}, 'High': {'max': 'Value'},
+                'Average': {'mean': 'Value'}, 'Ids': {'distinct_count': 'Id'}, 'Ids_approx': {'approx_distinct_count': 'Id'}}}},
+            {'filter_records': {'condition': 'Rows > 0'}}
+        ]
+        # More chunks than partials held at once, so partials are merged
+        # along the way.
+        self.assertStreamMatches(transformation_definitions, 60)
+        aggregated = pd.read_csv(self.output_file)
+        expected = df[df['Group'] != 3].groupby(['Group', 'Sex']).agg(Rows=('Id', 'count'), Ids=('Id', 'nunique')).reset_index()
+        self.assertEqual(aggregated[['Group', 'Sex', 'Rows', 'Ids']].values.tolist(), expected.values.tolist())
+        self.assertTrue(((aggregated['Ids_approx'] - aggregated['Ids']).abs() <= 0.05 * aggregated['Ids']).all())
+
+    def test_stream_split(self):
+        output_definitions = {
+            os.path.join(self.directory, 'split1.csv'): ['Name', 'Email'],
+            os.path.join(self.directory, 'split2.csv'): ['Age', 'Name', 'City']
+        }
+        split(self.input_file, {f'{path}.expected': columns for path, columns in output_definitions.items()})
+        stream_split(self.input_file, output_definitions, 4, workers=2)
+        for path in output_definitions:
+            with open(f'{path}.expected') as expected, open(path) as output:
+                self.assertEqual(expected.read(), output.read())
+        self.assertFalse(split(self.input_file, {self.output_file: ['Name', 'Missing']}, chunksize=4))
+
+    def test_stream_split_parses_like_full_split(self):
+        # Leading zeros, trailing zeros, and integers and booleans with blanks
+        # only in later chunks are written as a full read writes them.
+        with open(self.input_file, 'w') as file:
+            file.write('Zip,Price,Age,Flag,Note\n')
+            for i in range(10):
+                file.write(f"0123{i},1.50,{'' if i == 8 else 30 + i},{'' if i == 9 else 'true'},{'x' if i > 5 else ''}\n")
+        expected_file = os.path.join(self.directory, 'expected.csv')
+        with contextlib.redirect_stdout(io.StringIO()):
+            split(self.input_file, {expected_file: ['Zip', 'Price', 'Age', 'Flag', 'Note']})
+            split(self.input_file, {self.output_file: ['Zip', 'Price', 'Age', 'Flag', 'Note']}, chunksize=3)
+        with open(expected_file) as expected, open(self.output_file) as output:
+            self.assertEqual(expected.read(), output.read())
+        self.assertEqual(pd.read_csv(self.output_file, dtype=str)['Zip'].tolist()[:2], ['1230', '1231'])
+
+
+if __name__ == '__main__':
+    unittest.main()
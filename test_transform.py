@@ -1,10 +1,11 @@
 import unittest
+import warnings
 import numpy as np 
 import pandas as pd
 from transform import split_transform, split_pair_transform, replace_transform, replace_text_transform, \
     merge_transform, filter_transform, filter_records_transform, rename_transform, \
     map_value_transform, convert_case_transform, duplicate_transform, sort_transform, check_data_type_transform, \
-    check_not_blank_transform
+    check_not_blank_transform, replace_characters_transform, mask_transform, apply_transformations, aggregate_transform
 
 
 class TestTransformations(unittest.TestCase):
@@ -64,6 +65,80 @@ class TestTransformations(unittest.TestCase):
         # self.assertTrue(transformed_data.equals(pd.DataFrame(expected_data)))
         np.array_equal(transformed_data.values, pd.DataFrame(expected_data).values)
 
+    def test_replace_text_transform__end(self):
+        transformed_data = replace_text_transform(self.sample_data, 'Name', 1, 2, '^', False)
+        self.assertEqual(transformed_data['Name'].tolist(), ['John ^^e', 'Jane Sm^^h', 'Mark John^^n'])
+
+    def test_replace_text_transform__short_text(self):
+        data = pd.DataFrame({'Code': ['1', '12', '12345', np.nan]})
+        transformed_data = replace_text_transform(data, 'Code', 1, 2, '*')
+        self.assertEqual(transformed_data['Code'].tolist(), ['1', '1*', '1**45', 'n**'])
+
+    def test_replace_characters_transform(self):
+        data = pd.DataFrame({'Card': ['4111222233334444', '12', np.nan]})
+        transformed_data = replace_characters_transform(data.copy(), 'Card', 4, '*')
+        self.assertEqual(transformed_data['Card'].tolist(), ['****222233334444', '**', '***'])
+        transformed_data = replace_characters_transform(data.copy(), 'Card', 4, '*', False)
+        self.assertEqual(transformed_data['Card'].tolist(), ['411122223333****', '**', '***'])
+        with self.assertRaises(ValueError):
+            replace_characters_transform(data, 'Card', -1, '*')
+
+    def test_mask_transform__matches_chained_transformations(self):
+        data = pd.DataFrame({'Phone': ['555-0123', '555-5555', np.nan], 'Id': [12345, 555, 7]})
+        rules = [{'replace': {'match': '555', 'replacement': 'XXX'}},
+                 {'replace': {'match': '5', 'replacement': 'F'}},
+                 {'regex': {'pattern': '[0-9]', 'replacement': '#'}},
+                 {'replace_characters': {'num_characters': 2, 'replacement': '*', 'first': False}},
+                 {'replace_text': {'start_position': 0, 'end_position': 0, 'replacement': '?'}}]
+        masked_data = mask_transform(data.copy(), ['Phone', 'Id'], rules)
+        self.assertEqual(masked_data['Phone'].tolist(), ['?XX-##**', '?XX-XX**', '?**'])
+        self.assertEqual(masked_data['Id'].tolist(), ['?##**', '?**', '?'])
+        chained = []
+        for column in ['Phone', 'Id']:
+            chained += [{'replace': {'column': column, 'match': '555', 'replacement': 'XXX'}},
+                        {'replace': {'column': column, 'match': '5', 'replacement': 'F'}}]
+        chained_data = apply_transformations(data.copy(), chained)
+        literal_data = mask_transform(data.copy(), ['Phone', 'Id'], rules[:2])
+        self.assertEqual(literal_data.astype(str).values.tolist(), chained_data.astype(str).values.tolist())
+
+    def test_mask_transform__longest_literal_wins(self):
+        data = pd.DataFrame({'Code': ['5555', 'a55b']})
+        rules = [{'replace': {'match': '55', 'replacement': '2'}}, {'replace': {'match': '555', 'replacement': '3'}},
+                 {'replace': {'match': '3', 'replacement': 'not rescanned'}}]
+        masked_data = mask_transform(data, ['Code'], rules)
+        self.assertEqual(masked_data['Code'].tolist(), ['35', 'a2b'])
+
+    def test_mask_transform__invalid_rules(self):
+        for rules in [[{'hash': {}}], [{'replace': {'match': 'a'}}], [{'regex': {'pattern': '(', 'replacement': ''}}],
+                      [{'replace': {'match': '', 'replacement': 'x'}}]]:
+            with self.assertRaises(ValueError):
+                mask_transform(self.sample_data, ['Name'], rules)
+        with self.assertRaises(ValueError):
+            mask_transform(self.sample_data, ['Missing'], [])
+
+    def test_aggregate_transform(self):
+        data = pd.DataFrame({'City': ['NY', 'LA', 'NY', np.nan, 'NY'], 'Age': [30, 25, np.nan, 40, 30],
+                             'Email': ['a@x.com', 'b@x.com', 'a@x.com', np.nan, 'c@x.com']})
+        aggregated = aggregate_transform(data, ['City'], {
+            'Rows': {'count': 'Email'}, 'Total': {'sum': 'Age'}, 'Youngest': {'min': 'Age'}, 'Oldest': {'max': 'Age'},
+            'Average': {'mean': 'Age'}, 'Emails': {'distinct_count': 'Email'}, 'Emails_approx': {'approx_distinct_count': 'Email'}})
+        # Groups come sorted, with the group of missing keys last.
+        self.assertEqual(aggregated.astype(object).where(aggregated.notna(), None).values.tolist(), [
+            ['LA', 1, 25.0, 25.0, 25.0, 25.0, 1, 1],
+            ['NY', 3, 60.0, 30.0, 30.0, 30.0, 2, 2],
+            [None, 0, 40.0, 40.0, 40.0, 40.0, 0, 0]
+        ])
+        self.assertEqual(list(aggregated.columns), ['City', 'Rows', 'Total', 'Youngest', 'Oldest', 'Average', 'Emails', 'Emails_approx'])
+        for group_by, aggregations in [([], {'Rows': {'count': 'Age'}}), (['City'], {}), (['City'], {'Rows': {'median': 'Age'}}),
+                                       (['City'], {'Rows': {'count': 'Missing'}}), (['City'], {'City': {'count': 'Age'}})]:
+            with self.assertRaises(ValueError):
+                aggregate_transform(data, group_by, aggregations)
+
+    def test_merge_transform__skips_blank_values(self):
+        data = pd.DataFrame({'Address': ['123 Main St', np.nan, np.nan], 'ZipCode': [10001, 90001, np.nan]})
+        transformed_data = merge_transform(data, ['Address', 'ZipCode'], 'Full Address', ', ')
+        self.assertEqual(transformed_data['Full Address'].tolist(), ['123 Main St, 10001.0', '90001.0', ''])
+
     def test_merge_transform(self):
         expected_data = {
             'Name': ['John Doe', 'Jane Smith', 'Mark Johnson'],
@@ -126,6 +201,10 @@ class TestTransformations(unittest.TestCase):
         transformed_data = convert_case_transform(self.sample_data, case_mapping)
         self.assertTrue(transformed_data.equals(pd.DataFrame(expected_data)))
 
+    def test_convert_case_transform__sentencecase(self):
+        transformed_data = convert_case_transform(self.sample_data, {'Email': 'sentencecase'})
+        self.assertEqual(transformed_data['Email'].tolist(), ['John.doe@example.com', 'Jane.smith@example.com', 'Mark.johnson@example.com'])
+
     def test_duplicate_transform(self):
         expected_data = {
             'Name': ['John Doe', 'Jane Smith', 'Mark Johnson'],
@@ -162,6 +241,58 @@ class TestTransformations(unittest.TestCase):
         np.array_equal(transformed_data.values, pd.DataFrame(expected_data).values)
         # self.assertTrue(transformed_data.equals(outputDf))
 
+    def test_duplicate_transform__wide(self):
+        df = pd.DataFrame(np.arange(300.0).reshape(3, 100), columns=[f'c{i}' for i in range(100)])
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', pd.errors.PerformanceWarning)
+            transformed_data = duplicate_transform(df, {f'c{i}': f'd{i}' for i in range(100)})
+            transformed_data = duplicate_transform(transformed_data, {'c0': 'e0', 'c1': 'c2'})
+        self.assertEqual(list(transformed_data.columns[-3:]), ['d98', 'd99', 'e0'])
+        self.assertEqual(transformed_data['c2'].tolist(), df['c1'].tolist())
+        # Transformations run with copy-on-write, so copies share their
+        # column's data until one of them is changed.
+        with pd.option_context('mode.copy_on_write', True):
+            transformed_data = duplicate_transform(df.copy(), {'c5': 'd5'})
+            self.assertTrue(np.shares_memory(transformed_data['d5'].to_numpy(), transformed_data['c5'].to_numpy()))
+        transformed_data = apply_transformations(df, [{'duplicate': {'mapping': {'c5': 'd5'}}},
+                                                      {'map_value': {'column': 'd5', 'mapping': {5.0: -1.0}, 'default_value': None}}])
+        self.assertEqual(transformed_data.loc[0, 'd5'], -1.0)
+        self.assertEqual(df.loc[0, 'c5'], 5.0)
+        # Copy-on-write is not left on for other code.
+        self.assertFalse(pd.get_option('mode.copy_on_write'))
+
+    def test_duplicate_transform__chained(self):
+        df = pd.DataFrame({'A': [1, 2], 'B': [3, 4]})
+        # Copies are made in order, so C gets the copy of A in B.
+        transformed_data = duplicate_transform(df, {'A': 'B', 'B': 'C'})
+        self.assertTrue(transformed_data.equals(pd.DataFrame({'A': [1, 2], 'B': [1, 2], 'C': [1, 2]})))
+        # The last copy into a target wins.
+        df = pd.DataFrame({'A': [1, 2], 'B': [3, 4]})
+        transformed_data = duplicate_transform(df, {'A': 'X', 'B': 'X'})
+        self.assertTrue(transformed_data.equals(pd.DataFrame({'A': [1, 2], 'B': [3, 4], 'X': [3, 4]})))
+
+    def test_returned_frames_share_no_data(self):
+        # Frames are handed out after copy-on-write is turned off again, so
+        # writing into one changes neither the input nor another column.
+        df = pd.DataFrame({'A': [1, 2, 3], 'B': ['x', 'y', 'z']})
+        transformed_data = apply_transformations(df, [{'duplicate': {'mapping': {'A': 'A_new'}}}])
+        transformed_data.loc[0, 'A_new'] = -1
+        self.assertEqual(transformed_data['A'].tolist(), [1, 2, 3])
+        self.assertEqual(df['A'].tolist(), [1, 2, 3])
+        transformed_data = apply_transformations(df, [{'filter': {'columns': ['A', 'B']}}])
+        transformed_data.loc[0, ['A', 'B']] = [-1, 'w']
+        self.assertEqual(df['A'].tolist(), [1, 2, 3])
+        self.assertEqual(df['B'].tolist(), ['x', 'y', 'z'])
+
+    def test_sort_transform__limit(self):
+        transformed_data = sort_transform(self.sample_data, {'Age': False}, 2)
+        self.assertEqual(transformed_data['Name'].tolist(), ['Mark Johnson', 'John Doe'])
+        self.assertEqual(len(sort_transform(self.sample_data, {'Gender': True, 'Age': False}, 10)), 3)
+        self.assertRaises(ValueError, sort_transform, self.sample_data, {'Age': True}, -1)
+        transformed_data = sort_transform(self.sample_data, {'Age': False}, 0)
+        self.assertEqual(list(transformed_data.columns), list(self.sample_data.columns))
+        self.assertEqual(len(transformed_data), 0)
+
     def test_check_data_type_transform(self):
         transformed_data = self.sample_data.copy()
         self.assertRaises(ValueError, check_data_type_transform, transformed_data, {'Name': int})
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from transform import apply_transformations
+from pipeline import process
+from validate import check_rules, evaluate_rules, validate
+
+
+class ListWriter:
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+
+class TestValidate(unittest.TestCase):
+
+    def setUp(self):
+        self.sample_data = pd.DataFrame({
+            'Name': ['John Doe', 'Jane Smith', '', 'Bob Johnson'],
+            'Age': [25, 45, 35, 17],
+            'Sex': ['M', 'F', 'X', 'M']
+        })
+        self.checks = [
+            {'type': 'not_blank', 'columns': ['Name']},
+            {'type': 'range', 'column': 'Age', 'min_value': 18, 'max_value': 40},
+            {'type': 'values', 'column': 'Sex', 'valid_values': ['M', 'F']}
+        ]
+
+    def test_evaluate_rules(self):
+        masks = evaluate_rules(self.sample_data, check_rules(self.checks))
+        self.assertEqual([mask.tolist() for mask in masks], [
+            [False, False, True, False],
+            [False, True, False, True],
+            [False, False, True, False]
+        ])
+
+    def test_error_message_is_bounded(self):
+        df = pd.DataFrame({'Code': [f'value{i}' for i in range(100000)]})
+        with self.assertRaises(ValueError) as context:
+            apply_transformations(df, [{'checks': [{'type': 'length', 'column': 'Code', 'max_length': 5}]}])
+        message = str(context.exception)
+        self.assertIn('100000 invalid values', message)
+        self.assertIn('[value0, value1, value2, value3, value4, ...]', message)
+        self.assertNotIn('value5', message)
+
+    def test_rejected_rows(self):
+        rejects = ListWriter()
+        df = validate(self.sample_data, check_rules(self.checks), rejects)
+        self.assertEqual(df['Name'].tolist(), ['John Doe'])
+        rejected = pd.concat(rejects.chunks)
+        self.assertEqual(rejected['Name'].tolist(), ['Jane Smith', '', 'Bob Johnson'])
+        self.assertEqual(rejected['_rejected_by'].tolist(), ['range(Age)', 'not_blank(Name);values(Sex)', 'range(Age)'])
+
+    def test_data_type_always_raises(self):
+        rules = check_rules([{'type': 'data_type', 'mapping': {'Age': 'object'}}])
+        self.assertRaises(ValueError, validate, self.sample_data, rules, ListWriter())
+
+    def test_process_reject_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            input_file = os.path.join(directory, 'input.csv')
+            self.sample_data.to_csv(input_file, index=False)
+            transformation_definitions = [
+                {'checks': self.checks},
+                {'filter': {'columns': ['Name']}}
+            ]
+            for chunksize in [None, 1]:
+                output_file = os.path.join(directory, 'output.csv')
+                reject_file = os.path.join(directory, 'rejects.csv')
+                self.assertTrue(process(input_file, output_file, None, transformation_definitions, chunksize, reject_file=reject_file))
+                self.assertEqual(pd.read_csv(output_file)['Name'].tolist(), ['John Doe'])
+                rejected = pd.read_csv(reject_file, keep_default_na=False)
+                self.assertEqual(list(rejected.columns), ['Name', 'Age', 'Sex', '_rejected_by'])
+                self.assertEqual(rejected['Age'].tolist(), [45, 35, 17])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,34 @@
+import numpy as np
 import pandas as pd
-
+from pandas.core.dtypes.cast import find_common_type
+from profiling import profile_span
+from categorical import ColumnEncoder, map_values, is_categorical
+from lookup import load_reference
+from mask import compile_rules, mask_positions, mask_values
+from aggregate import parse_aggregations, partial_aggregate, finish_aggregate
+from validate import validate, check_rules, transformation_rules, CHECK_TRANSFORMATIONS
 
  
+def set_columns(df, columns):
+    # Writes the columns of the frame `columns` into df in one go. Columns df
+    # already has are replaced where they are and the others are appended with
+    # one concat, instead of being inserted one at a time, which splits a wide
+    # frame into a block per column.
+    existing_columns = [col for col in columns.columns if col in df.columns]
+    for col in existing_columns:
+        df[col] = columns[col]
+    new_columns = columns.drop(columns=existing_columns) if existing_columns else columns
+    if len(new_columns.columns) == 0:
+        return df
+    return pd.concat([df, new_columns], axis=1)
+
+
 def split_transform(df, column, separator):
     if column not in df.columns:
         raise ValueError(f"Invalid column '{column}' specified for split_transform")
     split_values = df[column].str.split(separator, expand=True)
-    for i, col in enumerate(split_values.columns):
-        new_column_name = f'{column}_{i+1}'
-        df.loc[:, new_column_name] = split_values[col]
-    return df
+    split_values.columns = [f'{column}_{i+1}' for i in range(split_values.shape[1])]
+    return set_columns(df, split_values)
 
 
 def split_pair_transform(df, column, separator, first=True):
@@ -20,44 +39,46 @@ def split_pair_transform(df, column, separator, first=True):
     else:
         split_values = df[column].str.rsplit(separator, n=1, expand=True)
 
-    new_columns = [f'{column}_{i+1}' for i in range(split_values.shape[1])]
-    df = pd.concat([df, split_values.rename(columns=dict(zip(split_values.columns, new_columns)))], axis=1)
-    return df
+    split_values.columns = [f'{column}_{i+1}' for i in range(split_values.shape[1])]
+    return set_columns(df, split_values)
 
 
 
 def replace_transform(df, column, match, replacement):
     if column not in df.columns:
         raise ValueError(f"Invalid column '{column}' specified for replace_transform")
-    df[column] = df[column].astype(str).str.replace(match, replacement)
+    df[column] = map_values(df[column], lambda values: values.astype(str).str.replace(match, replacement))
     return df
 
 
 def replace_text_transform(df, column, start_position, end_position, replacement_character, start=True):
     if column not in df.columns:
         raise ValueError(f"Invalid column '{column}' specified for replace_text_transform")
-    df[column] = df[column].astype(str)
-    length = df[column].str.len()
+    df[column] = map_values(df[column], lambda values: _replace_text(values, start_position, end_position, replacement_character, start))
+    return df
 
-    def replace_text(row):
-        text = row[column]
-        length = len(text)
 
-        if start:
-            start_index = start_position
-            end_index = min(end_position + 1, length)
-        else:
-            start_index = max(length - end_position - 1, 0)
-            end_index = max(length - start_position, 0)
+def _replace_text(values, start_position, end_position, replacement_character, start):
+    return mask_positions(values.astype(str).to_numpy(dtype=object), [(start_position, end_position, replacement_character, start)])
 
-        num_replacements = end_index - start_index
-        replacement_text = replacement_character * num_replacements
 
-        replaced_text = text[:start_index] + replacement_text + text[end_index:]
-        return replaced_text
+def replace_characters_transform(df, column, num_characters, replacement_character, first=True):
+    if column not in df.columns:
+        raise ValueError(f"Invalid column '{column}' specified for replace_characters_transform")
+    if isinstance(num_characters, bool) or not isinstance(num_characters, int) or num_characters < 0:
+        raise ValueError(f"Invalid number of characters specified for replace_characters_transform: {num_characters}")
+    # The first or last num_characters characters, as replace_text counts them.
+    df[column] = map_values(df[column], lambda values: _replace_text(values, 0, num_characters - 1, replacement_character, first))
+    return df
 
-    df[column] = df.apply(replace_text, axis=1)
 
+def mask_transform(df, columns, rules):
+    invalid_columns = [col for col in columns if col not in df.columns]
+    if invalid_columns:
+        raise ValueError(f"Invalid columns specified for mask_transform: {', '.join(invalid_columns)}")
+    stages = compile_rules(rules)
+    for column in columns:
+        df[column] = map_values(df[column], lambda values: mask_values(values, stages))
     return df
 
 
@@ -67,9 +88,18 @@ def merge_transform(df, columns, output_column=None, separator=' '):
         raise ValueError("No valid columns specified for merge_transform")
     if output_column is None:
         output_column = '_'.join(merge_columns)
-    separator = separator
-    merged_value = df[merge_columns].apply(lambda x: separator.join(x.dropna().astype(str)), axis=1)
-    df[output_column] = merged_value
+
+    # Values are cast to the common dtype of the merged columns first, the same
+    # way a row of df[merge_columns] would be, so numbers render identically.
+    common_dtype = find_common_type(list(df[merge_columns].dtypes))
+    merged_value = pd.Series(np.nan, index=df.index, dtype=object)
+    for col in merge_columns:
+        values = df[col].astype(common_dtype)
+        present = values.notna()
+        text = values[present].astype(str)
+        has_value = merged_value[present].notna()
+        merged_value[present] = (merged_value[present] + separator).where(has_value, '') + text
+    df[output_column] = merged_value.fillna('')
     return df
 
 
@@ -83,7 +113,10 @@ def filter_transform(df, columns):
 
 def filter_records_transform(df, condition):
     try:
-        df = df.query(condition)
+        # Same rows as df.query(condition), but taken by position so the
+        # result is not flagged as a view of the unfiltered frame.
+        mask = df.eval(condition)
+        df = df.take(np.flatnonzero(mask.to_numpy(dtype=bool, na_value=False)))
     except pd.core.computation.ops.UndefinedVariableError:
         raise ValueError(f"Invalid condition specified for filter_records_transform: {condition}")
     return df
@@ -100,43 +133,83 @@ def rename_transform(df, mapping):
 def map_value_transform(df, column, mapping, default_value=None):
     if column not in df.columns:
         raise ValueError(f"Invalid column '{column}' specified for map_value_transform")
+    if is_categorical(df[column]):
+        # Each distinct value is mapped once and the codes remapped.
+        df[column] = map_values(df[column], lambda values: _map_value(values, mapping, default_value))
+        return df
     df.loc[:, column] = df[column].map(mapping)
     if default_value is not None:
         df.loc[:, column] = df[column].fillna(default_value)
     return df
 
 
+def _map_value(values, mapping, default_value):
+    # Mapped into an object column, as the row by row assignment above does.
+    values = values.map(mapping).astype(object)
+    return values if default_value is None else values.fillna(default_value)
+
+
+def lookup_transform(df, column, reference_file, key_column, value_column, output_column=None, default_value=None, file_format=None):
+    if column not in df.columns:
+        raise ValueError(f"Invalid column '{column}' specified for lookup_transform")
+    index = load_reference(reference_file, key_column, value_column, file_format)
+    values = map_values(df[column], lambda values: index.lookup(values, default_value))
+    df[output_column or column] = values.rename(output_column or column)
+    return df
+
+
 def convert_case_transform(df, mapping):
     columns = [column for column in mapping if column in df.columns]
     if not columns:
         raise ValueError("No valid columns specified for convert_case_transform")
     for column in columns:
         if df[column].dtype == 'object':
-            case_type = mapping[column]
-            if case_type == 'uppercase':
-                df.loc[:, column] = df[column].str.upper()
-            elif case_type == 'lowercase':
-                df.loc[:, column] = df[column].str.lower()
-            elif case_type == 'titlecase':
-                df.loc[:, column] = df[column].str.title()
-            elif case_type == 'sentencecase':
-                df.loc[:, column] = df[column].apply(lambda x: x.capitalize())
-            else:
-                raise ValueError(f"Invalid case '{case_type}' specified for column '{column}' in convert_case_transform")
+            df[column] = _convert_case(df[column], mapping[column], column)
+        elif is_categorical(df[column]) and df[column].cat.categories.dtype == 'object':
+            df[column] = map_values(df[column], lambda values: _convert_case(values, mapping[column], column))
     return df
 
 
+def _convert_case(values, case_type, column):
+    if case_type == 'uppercase':
+        return values.str.upper()
+    elif case_type == 'lowercase':
+        return values.str.lower()
+    elif case_type == 'titlecase':
+        return values.str.title()
+    elif case_type == 'sentencecase':
+        return values.str.capitalize()
+    raise ValueError(f"Invalid case '{case_type}' specified for column '{column}' in convert_case_transform")
+
+
 def duplicate_transform(df, mapping):
     invalid_columns = [col for col in mapping if col not in df.columns]
     if invalid_columns:
         raise ValueError(f"Invalid columns specified for duplicate_transform: {', '.join(invalid_columns)}")
-    for column in mapping:
-        new_column_name = mapping[column]
-        df[new_column_name] = df[column]
-    return df
-
-
-def sort_transform(df, mapping):
+    if not mapping:
+        return df
+    # Copies are made in order, as if one at a time: a source written by an
+    # earlier copy is copied as written, and the last copy into a target wins.
+    # The copies share the data of their column until either is changed.
+    copies = {}
+    for column, new_column_name in mapping.items():
+        copies[new_column_name] = copies[column] if column in copies else df[column]
+    return set_columns(df, pd.concat([series.rename(name) for name, series in copies.items()], axis=1))
+
+
+def _top_candidates(df, column, ascending, limit):
+    # Rows that can be among the first `limit` rows: those whose first sort key
+    # is at least as good as the limit-th best value. Only numeric keys are
+    # selected this way, and missing values, which sort last, need every row.
+    series = df[column]
+    if not pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype) or series.count() <= limit:
+        return df
+    best = series.nsmallest(limit) if ascending else series.nlargest(limit)
+    threshold = best.iloc[-1]
+    return df[series <= threshold] if ascending else df[series >= threshold]
+
+
+def sort_transform(df, mapping, limit=None):
     columns = [col for col in mapping if col in df.columns]
     if not columns:
         raise ValueError("No valid columns specified for sort_transform")
@@ -146,115 +219,60 @@ def sort_transform(df, mapping):
     if invalid_orders:
         raise ValueError(f"Invalid sort orders specified: {', '.join([str(order) for order in invalid_orders])}")
 
-    df = df.sort_values(columns, ascending=sort_orders)
-    return df
-
-
-def check_data_type_transform(df, mapping):
-    invalid_columns = [col for col in mapping if col not in df.columns]
-    if invalid_columns:
-        raise ValueError(f"Invalid columns specified for check_data_type_transform: {', '.join(invalid_columns)}")
-
-    for column in mapping:
-        expected_data_type = mapping[column]
-        if df[column].dtype != expected_data_type:
-            raise ValueError(
-                f"Invalid data type in column '{column}'. Expected data type: {expected_data_type}, found: {df[column].dtype}"
-            )
-
-    return df
-
-
-def check_not_blank_transform(df, columns):
-    invalid_columns = [col for col in columns if col not in df.columns]
-    if invalid_columns:
-        raise ValueError(f"Invalid columns specified for check_not_blank_transform: {', '.join(invalid_columns)}")
-
-    for column in columns:
-        if df[column].isnull().any() or (df[column] == '').any():
-            raise ValueError(f"Blank values found in column '{column}'")
+    if limit is not None:
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit < 0:
+            raise ValueError(f"Invalid sort limit specified: {limit}")
+        if limit == 0:
+            return df.iloc[:0]
+        # Only the first `limit` rows are kept. The candidates are sorted
+        # stably, so rows that tie keep their input order.
+        df = _top_candidates(df, columns[0], sort_orders[0], limit)
+        return df.sort_values(columns, ascending=sort_orders, kind='stable').head(limit)
 
+    df = df.sort_values(columns, ascending=sort_orders)
     return df
 
 
-def check_data_transform(df, checks):
-    if not isinstance(checks, list):
-        raise ValueError("Invalid checks. 'checks' must be a list.")
-
-    for check in checks:
-        check_type = check.get('type')
-        if check_type is None:
-            raise ValueError("Invalid check. 'type' parameter is missing.")
-
-        if check_type == 'length':
-            column = check.get('column')
-            max_length = check.get('max_length')
-
-            if column not in df.columns:
-                raise ValueError(f"Invalid column '{column}' specified for length check")
-
-            invalid_values = df[df[column].astype(str).str.len() > max_length][column]
-            if len(invalid_values) > 0:
-                raise ValueError(f"Text values in column '{column}' exceed the maximum length of {max_length}. Invalid values are [{', '.join(invalid_values.astype(str))}]")
+def aggregate_transform(df, group_by, aggregations):
+    # The same partial aggregate a streamed step merges chunk by chunk, taken
+    # over the whole frame.
+    aggregations = parse_aggregations(group_by, aggregations)
+    return finish_aggregate(partial_aggregate(df, group_by, aggregations), group_by, aggregations)
 
-        elif check_type == 'values':
-            column = check.get('column')
-            valid_values = check.get('valid_values')
 
-            if column not in df.columns:
-                raise ValueError(f"Invalid column '{column}' specified for values check")
+def check_data_type_transform(df, mapping, rejects=None):
+    return validate(df, transformation_rules('check_data_type', {'mapping': mapping}), rejects)
 
-            invalid_values = df[~df[column].isin(valid_values)][column]
-            if len(invalid_values) > 0:
-                raise ValueError(f"Invalid values found in column '{column}': {', '.join(invalid_values.astype(str))}")
 
-        elif check_type == 'not_blank':
-            columns = check.get('columns')
+def check_not_blank_transform(df, columns, rejects=None):
+    return validate(df, transformation_rules('check_not_blank', {'columns': columns}), rejects)
 
-            invalid_columns = [col for col in columns if col not in df.columns]
-            if invalid_columns:
-                raise ValueError(f"Invalid columns specified for not_blank check: {', '.join(invalid_columns)}")
 
-            for column in columns:
-                if df[column].isnull().any() or (df[column] == '').any():
-                    raise ValueError(f"Blank values found in column '{column}'")
+def check_data_transform(df, checks, rejects=None):
+    return validate(df, check_rules(checks), rejects)
 
-        elif check_type == 'data_type':
-            mapping = check.get('mapping')
-
-            invalid_columns = [col for col in mapping if col not in df.columns]
-            if invalid_columns:
-                raise ValueError(f"Invalid columns specified for data_type check: {', '.join(invalid_columns)}")
-
-            for column in mapping:
-                expected_data_type = mapping[column]
-                if df[column].dtype != expected_data_type:
-                    raise ValueError(
-                        f"Invalid data type in column '{column}'. Expected data type: {expected_data_type}, found: {df[column].dtype}"
-                    )
-
-        elif check_type == 'range':
-            column = check.get('column')
-            min_value = check.get('min_value')
-            max_value = check.get('max_value')
-
-            if column not in df.columns:
-                raise ValueError(f"Invalid column '{column}' specified for range check")
-
-            invalid_values = df[(df[column] < min_value) | (df[column] > max_value)][column]
-            if len(invalid_values) > 0:
-                raise ValueError(f"Values in column '{column}' fall outside the range [{min_value}, {max_value}]. Invalid values are [{', '.join(invalid_values.astype(str))}]")
 
+def fuse_checks(transformation_definitions):
+    # Consecutive checks are validated together, so each column they cover is
+    # scanned once however many checks name it.
+    fused_definitions = []
+    for transformation_definition in transformation_definitions:
+        transformation_type = list(transformation_definition.keys())[0]
+        if transformation_type not in CHECK_TRANSFORMATIONS:
+            fused_definitions.append(transformation_definition)
+            continue
+        rules = transformation_rules(transformation_type, list(transformation_definition.values())[0])
+        if fused_definitions and 'validate' in fused_definitions[-1]:
+            fused_definitions[-1]['validate'].extend(rules)
         else:
-            raise ValueError(f"Invalid check type: {check_type}")
-
-    return df
+            fused_definitions.append({'validate': rules})
+    return fused_definitions
 
 def drop_transform(df, columns):
     invalid_columns = [col for col in columns if col not in df.columns]
     if invalid_columns:
         raise ValueError(f"Invalid columns specified for drop_transform: {', '.join(invalid_columns)}")
-    df.drop(columns=columns, inplace=True)
+    df = df.drop(columns=columns)
     return df
 
 
@@ -270,46 +288,91 @@ def create_transform(df, column, data_type, default_value=None):
     return df
 
 
-def apply_transformations(df, transformation_definitions):
-    for transformation_definition in transformation_definitions:
-        transformation_type = list(transformation_definition.keys())[0]
-        transformation = list(transformation_definition.values())[0]
-
-        if transformation_type == 'split':
-            df = split_transform(df, transformation['column'], transformation['separator'])
-        elif transformation_type == 'split_pair':
-            df = split_pair_transform(df, transformation['column'], transformation['separator'], transformation['first'])
-        elif transformation_type == 'replace':
-            df = replace_transform(df, transformation['column'], transformation['match'], transformation['replacement'])
-        elif transformation_type == 'replace_text':
-            df = replace_text_transform(df, transformation['column'], transformation['start_position'], transformation['end_position'], transformation['replacement'], transformation['start'])
-        elif transformation_type == 'merge':
-            df = merge_transform(df, transformation['columns'], transformation.get('output_column'), transformation.get('separator'))
-        elif transformation_type == 'filter':
-            df = filter_transform(df, transformation['columns'])
-        elif transformation_type == 'drop':
-            df = drop_transform(df, transformation['columns'])            
-        elif transformation_type == 'filter_records':
-            df = filter_records_transform(df, transformation['condition'])
-        elif transformation_type == 'rename':
-            df = rename_transform(df, transformation['mapping'])
-        elif transformation_type == 'map_value':
-            df = map_value_transform(df, transformation['column'], transformation['mapping'], transformation['default_value'])
-        elif transformation_type == 'convert_case':
-            df = convert_case_transform(df, transformation['mapping'])
-        elif transformation_type == 'duplicate':
-            df = duplicate_transform(df, transformation['mapping'])
-        elif transformation_type == 'sort':
-            df = sort_transform(df, transformation['mapping'])
-        elif transformation_type == 'create':
-            df = create_transform(df, transformation['column'], transformation['data_type'], transformation['default_value'])
-        elif transformation_type == 'check_data_type':
-            df = check_data_type_transform(df, transformation['mapping'])
-        elif transformation_type == 'check_not_blank':
-            df = check_not_blank_transform(df, transformation['columns'])
-        elif transformation_type == 'checks':
-            df = check_data_transform(df, transformation)
-
-            
-
+def _buffers(series):
+    # The numpy arrays holding a column's values, found through the pandas
+    # array types that keep them in one (plain, masked, datetime and
+    # categorical arrays).
+    array = series.array
+    return [buffer for name in ('_ndarray', '_data', '_mask', '_codes')
+            for buffer in [getattr(array, name, None)] if isinstance(buffer, np.ndarray)]
+
+
+def unshare_columns(df, source):
+    # Outside copy-on-write, a write into a column that shares its data would
+    # also change every other frame and column holding it. Columns sharing
+    # their data with the source frame or with an earlier column are copied
+    # before the frame is handed out.
+    seen = [buffer for position in range(len(source.columns)) for buffer in _buffers(source.iloc[:, position])]
+    shared = []
+    for position in range(len(df.columns)):
+        buffers = _buffers(df.iloc[:, position])
+        if any(np.may_share_memory(buffer, other) for buffer in buffers for other in seen):
+            shared.append(position)
+        seen.extend(buffers)
+    if len(shared) == len(df.columns):
+        return df.copy()
+    for position in shared:
+        df.isetitem(position, df.iloc[:, position].copy())
     return df
+
+
+def apply_transformations(df, transformation_definitions, rejects=None, categorical=None):
+    # Transformations run with copy-on-write: frames and columns taken from
+    # other frames share their data until one of them is written to, so
+    # selecting, renaming and duplicating columns copies nothing.
+    with pd.option_context('mode.copy_on_write', True):
+        # Low cardinality columns are dictionary encoded while value-wise
+        # transformations run on them and decoded before the frame is returned.
+        encoder = ColumnEncoder(categorical, rejects is not None)
+        source = df
+        df = encoder.start(df)
+        for transformation_definition in fuse_checks(transformation_definitions):
+            transformation_type = list(transformation_definition.keys())[0]
+            transformation = list(transformation_definition.values())[0]
+
+            df = encoder.before(df, transformation_type, transformation)
+
+            with profile_span(transformation_type, 'transform', df) as span:
+                if transformation_type == 'split':
+                    df = split_transform(df, transformation['column'], transformation['separator'])
+                elif transformation_type == 'split_pair':
+                    df = split_pair_transform(df, transformation['column'], transformation['separator'], transformation['first'])
+                elif transformation_type == 'replace':
+                    df = replace_transform(df, transformation['column'], transformation['match'], transformation['replacement'])
+                elif transformation_type == 'replace_text':
+                    df = replace_text_transform(df, transformation['column'], transformation['start_position'], transformation['end_position'], transformation['replacement'], transformation['start'])
+                elif transformation_type == 'replace_characters':
+                    df = replace_characters_transform(df, transformation['column'], transformation['num_characters'], transformation['replacement'], transformation.get('first', True))
+                elif transformation_type == 'mask':
+                    df = mask_transform(df, transformation['columns'], transformation['rules'])
+                elif transformation_type == 'merge':
+                    df = merge_transform(df, transformation['columns'], transformation.get('output_column'), transformation.get('separator'))
+                elif transformation_type == 'filter':
+                    df = filter_transform(df, transformation['columns'])
+                elif transformation_type == 'drop':
+                    df = drop_transform(df, transformation['columns'])            
+                elif transformation_type == 'filter_records':
+                    df = filter_records_transform(df, transformation['condition'])
+                elif transformation_type == 'rename':
+                    df = rename_transform(df, transformation['mapping'])
+                elif transformation_type == 'map_value':
+                    df = map_value_transform(df, transformation['column'], transformation['mapping'], transformation['default_value'])
+                elif transformation_type == 'lookup':
+                    df = lookup_transform(df, transformation['column'], transformation['reference_file'], transformation['key_column'],
+                                          transformation['value_column'], transformation.get('output_column'),
+                                          transformation.get('default_value'), transformation.get('format'))
+                elif transformation_type == 'convert_case':
+                    df = convert_case_transform(df, transformation['mapping'])
+                elif transformation_type == 'duplicate':
+                    df = duplicate_transform(df, transformation['mapping'])
+                elif transformation_type == 'sort':
+                    df = sort_transform(df, transformation['mapping'], transformation.get('limit'))
+                elif transformation_type == 'aggregate':
+                    df = aggregate_transform(df, transformation['group_by'], transformation['aggregations'])
+                elif transformation_type == 'create':
+                    df = create_transform(df, transformation['column'], transformation['data_type'], transformation['default_value'])
+                elif transformation_type == 'validate':
+                    df = validate(df, transformation, rejects)
+                span.output(df)
+
+        return unshare_columns(encoder.decode(df), source)
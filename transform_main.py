@@ -1,19 +1,48 @@
-from transform import apply_transformations
+from parallel import apply_transformations_parallel
 from parse_transformations_file import parse_transformations_file
-import pandas as pd
+from stream import stream_process, chunk_writer
+from dataset_io import dataset_columns, read_dataset, write_dataset
+from schema import use_schemas
+from plan import compile_plan, plan_definitions, explain_plan
 import argparse
+import sys
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(description='Transform input CSV file based on transformation definitions.')
     parser.add_argument('input_file', type=str, help='Input CSV file path')
     parser.add_argument('output_file', type=str, help='Output CSV file path')
     parser.add_argument('transformations_file', type=str, help='Transformation definitions file path')
-    args = parser.parse_args()
+    parser.add_argument('--chunksize', type=int, default=None, help='Stream the input in chunks of this many rows')
+    parser.add_argument('--explain', action='store_true', help='Print the optimized transformation plan and exit')
+    parser.add_argument('--no-optimize', action='store_true', help='Run the transformations exactly as listed')
+    parser.add_argument('--spill-dir', type=str, default=None, help='Directory for temporary spill files when streaming')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes applying row-local transformations to row ranges of the input')
+    parser.add_argument('--format', type=str, default=None, help='File format (csv, parquet or arrow) of files whose extension does not name one')
+    parser.add_argument('--reject-file', type=str, default=None, help='Write rows failing checks to this file instead of stopping')
+    parser.add_argument('--schema', action='store_true', help='Read and write CSV files with schema sidecars holding their column types')
+    args = parser.parse_args(argv)
     return args
 
-args = parse_arguments()
-transformation_definitions = parse_transformations_file(args.transformations_file)
+def main(args):
+    if args.schema:
+        use_schemas()
+    transformation_definitions = parse_transformations_file(args.transformations_file)
+    input_columns = dataset_columns(args.input_file, file_format=args.format)
+    plan = compile_plan(transformation_definitions, input_columns, not args.no_optimize, args.reject_file is not None)
+    rejects = chunk_writer(args.reject_file, args.format) if args.reject_file else None
 
-df = pd.read_csv(args.input_file)
-df = apply_transformations(df, transformation_definitions)
-df.to_csv(args.output_file, index=False)
+    if args.explain:
+        print(explain_plan(plan, transformation_definitions))
+    elif args.chunksize:
+        stream_process(args.input_file, args.output_file, plan_definitions(plan), args.chunksize, args.spill_dir, columns=plan['usecols'], rejects=rejects, file_format=args.format)
+    else:
+        df = read_dataset(args.input_file, columns=plan['usecols'], file_format=args.format)
+        df = apply_transformations_parallel(df, plan_definitions(plan), args.workers, rejects)
+        write_dataset(df, args.output_file, file_format=args.format)
+    if rejects is not None:
+        rejects.close()
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main(parse_arguments()) else 1)
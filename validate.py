@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+
+# At most this many offending values are quoted in an error message, however
+# many rows fail a check.
+MAX_SAMPLE_VALUES = 5
+
+REJECT_REASON_COLUMN = '_rejected_by'
+
+
+CHECK_TRANSFORMATIONS = {'check_data_type', 'check_not_blank', 'checks'}
+
+
+def check_rule(check_type, column, check_name=None, **parameters):
+    return dict(parameters, type=check_type, column=column, check_name=check_name)
+
+
+def check_rules(checks):
+    if not isinstance(checks, list):
+        raise ValueError("Invalid checks. 'checks' must be a list.")
+
+    rules = []
+    for check in checks:
+        check_type = check.get('type')
+        if check_type is None:
+            raise ValueError("Invalid check. 'type' parameter is missing.")
+
+        if check_type == 'length':
+            rules.append(check_rule('length', check.get('column'), max_length=check.get('max_length')))
+        elif check_type == 'values':
+            rules.append(check_rule('values', check.get('column'), valid_values=check.get('valid_values')))
+        elif check_type == 'not_blank':
+            rules.extend(check_rule('not_blank', column) for column in check.get('columns'))
+        elif check_type == 'data_type':
+            rules.extend(check_rule('data_type', column, data_type=data_type) for column, data_type in check.get('mapping').items())
+        elif check_type == 'range':
+            rules.append(check_rule('range', check.get('column'), min_value=check.get('min_value'), max_value=check.get('max_value')))
+        else:
+            raise ValueError(f"Invalid check type: {check_type}")
+    return rules
+
+
+def transformation_rules(transformation_type, transformation):
+    if transformation_type == 'check_data_type':
+        return [check_rule('data_type', column, 'check_data_type_transform', data_type=data_type) for column, data_type in transformation['mapping'].items()]
+    if transformation_type == 'check_not_blank':
+        return [check_rule('not_blank', column, 'check_not_blank_transform') for column in transformation['columns']]
+    return check_rules(transformation)
+
+
+def check_columns(df, rules):
+    # Reports missing columns the way each check always has, before any data is scanned.
+    for rule in rules:
+        if rule['column'] in df.columns:
+            continue
+        check_type = rule['type']
+        check_name = rule['check_name'] or f'{check_type} check'
+        if rule['check_name'] is not None or check_type in ('not_blank', 'data_type'):
+            invalid_columns = list(dict.fromkeys(other['column'] for other in rules if other['column'] not in df.columns
+                                                 and other['check_name'] == rule['check_name'] and other['type'] == check_type))
+            raise ValueError(f"Invalid columns specified for {check_name}: {', '.join(invalid_columns)}")
+        raise ValueError(f"Invalid column '{rule['column']}' specified for {check_name}")
+
+
+def _column_masks(series, rules):
+    # All rules on one column share the intermediate results they need, so the
+    # column is only converted and scanned once.
+    blank = None
+    lengths = None
+    masks = []
+    for rule in rules:
+        if rule['type'] == 'data_type':
+            masks.append(None)
+            continue
+        if rule['type'] == 'length':
+            if lengths is None:
+                lengths = series.astype(str).str.len()
+            mask = lengths > rule['max_length']
+        elif rule['type'] == 'values':
+            mask = ~series.isin(rule['valid_values'])
+        elif rule['type'] == 'not_blank':
+            if blank is None:
+                blank = series.isnull() | (series == '')
+            mask = blank
+        else:
+            mask = (series < rule['min_value']) | (series > rule['max_value'])
+        masks.append(mask.to_numpy(dtype=bool, na_value=False))
+    return masks
+
+
+def evaluate_rules(df, rules):
+    masks = [None] * len(rules)
+    by_column = {}
+    for index, rule in enumerate(rules):
+        by_column.setdefault(rule['column'], []).append(index)
+    for column, indices in by_column.items():
+        for index, mask in zip(indices, _column_masks(df[column], [rules[index] for index in indices])):
+            masks[index] = mask
+    return masks
+
+
+def _sample(values):
+    sample = ', '.join(values.head(MAX_SAMPLE_VALUES).astype(str))
+    if len(values) > MAX_SAMPLE_VALUES:
+        sample += ', ...'
+    return sample
+
+
+def rule_error(df, rule, mask):
+    column = rule['column']
+    if rule['type'] == 'data_type':
+        return f"Invalid data type in column '{column}'. Expected data type: {rule['data_type']}, found: {df[column].dtype}"
+    if rule['type'] == 'not_blank':
+        return f"Blank values found in column '{column}' in {int(mask.sum())} rows"
+    invalid_values = df[column].iloc[np.flatnonzero(mask)]
+    count = f"{len(invalid_values)} invalid values"
+    if rule['type'] == 'length':
+        return f"Text values in column '{column}' exceed the maximum length of {rule['max_length']}. {count}, e.g. [{_sample(invalid_values)}]"
+    if rule['type'] == 'values':
+        return f"Invalid values found in column '{column}'. {count}, e.g. [{_sample(invalid_values)}]"
+    return f"Values in column '{column}' fall outside the range [{rule['min_value']}, {rule['max_value']}]. {count}, e.g. [{_sample(invalid_values)}]"
+
+
+def rule_name(rule):
+    return f"{rule['type']}({rule['column']})"
+
+
+def validate(df, rules, rejects=None):
+    # Rules are evaluated together and reported in order. Without a reject
+    # writer the first failing rule raises. With one, the failing rows are
+    # written there with the rules they broke and the rest carry on. A data
+    # type mismatch applies to the whole column and always raises.
+    check_columns(df, rules)
+    masks = evaluate_rules(df, rules)
+    failed = []
+    for rule, mask in zip(rules, masks):
+        if rule['type'] == 'data_type':
+            if df[rule['column']].dtype != rule['data_type']:
+                raise ValueError(rule_error(df, rule, mask))
+        elif mask.any():
+            if rejects is None:
+                raise ValueError(rule_error(df, rule, mask))
+            failed.append((rule, mask))
+    if not failed:
+        return df
+
+    rejected = np.zeros(len(df), dtype=bool)
+    for _, mask in failed:
+        rejected |= mask
+    reasons = pd.Series('', index=np.flatnonzero(rejected), dtype=object)
+    for rule, mask in failed:
+        rows = np.flatnonzero(mask[rejected])
+        reasons.iloc[rows] = reasons.iloc[rows] + rule_name(rule) + ';'
+    rejected_rows = df.take(np.flatnonzero(rejected))
+    rejected_rows[REJECT_REASON_COLUMN] = reasons.str.rstrip(';').to_numpy()
+    rejects.write(rejected_rows)
+    return df.take(np.flatnonzero(~rejected))